@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+AWS Client Pool Benchmark
+Measures DynamoDB GetItem latency (p50/p95/p99) in bursts of concurrent calls, the
+way batch mapping's workers fanning out to several doctors call AWS: every burst
+starts --threads calls at once and waits for all of them. Two client configs:
+
+    default   boto3's default client config (10 pooled connections)
+    shared    the config functions/shared/aws_clients.py builds for the same
+              concurrency (pool sized to the threads, TCP keep-alive, timeouts)
+
+The endpoint is a local HTTP server answering like DynamoDB after --service-ms, so
+no AWS access is needed. Each new connection waits --connect-ms first, standing in
+for the TCP and TLS handshake with a regional endpoint. When a burst has more calls
+than the pool has connections, botocore opens extra connections and closes them
+when the burst ends, so every burst pays the handshake again for the overflow.
+
+    python3 benchmarks/benchmark_client_pool.py
+    python3 benchmarks/benchmark_client_pool.py --threads 40 --bursts 100 --connect-ms 30
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+import boto3
+import aws_clients
+
+ITEM = {'Item': {'DoctorName': {'S': 'Sarah Johnson'}, 'ProcedureTime': {'S': '2025-07-01T10:00:00Z'}, 'cost': {'N': '250'}}}
+
+
+class FakeDynamoDB(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Don't let the listen backlog add SYN retries to the tail
+
+    def __init__(self, connect_ms, service_ms):
+        super().__init__(('127.0.0.1', 0), FakeDynamoDBHandler)
+        self.connect_seconds = connect_ms / 1000
+        self.service_seconds = service_ms / 1000
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class FakeDynamoDBHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Like the real endpoints; otherwise reused connections wait on delayed ACKs
+
+    def setup(self):
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_seconds)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.service_seconds)
+        body = json.dumps(ITEM).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(client, threads, bursts):
+    """Latency in ms of every GetItem in `bursts` bursts of `threads` concurrent calls"""
+    def get_item(_):
+        start = time.perf_counter()
+        client.get_item(TableName='DoctorProcedures', Key={'DoctorName': {'S': 'Sarah Johnson'}, 'ProcedureTime': {'S': '2025-07-01T10:00:00Z'}})
+        return (time.perf_counter() - start) * 1000
+
+    latencies = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(get_item, range(threads)))  # Warm up: open the pool
+        for _ in range(bursts):
+            latencies += executor.map(get_item, range(threads))
+    return latencies
+
+
+def percentile(latencies, share):
+    return statistics.quantiles(latencies, n=100, method='inclusive')[share - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AWS client pooling under concurrent calls.')
+    parser.add_argument('--threads', type=int, default=40, help='Concurrent calls per burst (default: 8 batch workers x 5 doctors)')
+    parser.add_argument('--bursts', type=int, default=50, help='Bursts per configuration')
+    parser.add_argument('--connect-ms', type=float, default=20, help='Simulated handshake on each new connection')
+    parser.add_argument('--service-ms', type=float, default=5, help='Simulated DynamoDB service time')
+    args = parser.parse_args()
+
+    # botocore logs a warning for every connection it drops from a full pool
+    logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+    configs = {
+        'default': None,
+        'shared': aws_clients.client_config('dynamodb', max_pool_connections=args.threads)
+    }
+
+    print("🔌 AWS client pool benchmark")
+    print(f"{args.bursts} bursts of {args.threads} GetItem calls, {args.connect_ms:g} ms handshake, {args.service_ms:g} ms service time\n")
+    print(f"{'config':<8} {'pool':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'connections':>12}")
+
+    results = {}
+    for name, config in configs.items():
+        server = FakeDynamoDB(args.connect_ms, args.service_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = boto3.client('dynamodb', region_name='us-east-1', endpoint_url=f'http://127.0.0.1:{server.server_address[1]}', config=config)
+            latencies = run(client, args.threads, args.bursts)
+            connections = server.connections
+        finally:
+            server.shutdown()
+            server.server_close()
+        pool = client.meta.config.max_pool_connections
+        results[name] = percentile(latencies, 99)
+        print(f"{name:<8} {pool:>5} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+              f"{results[name]:>8.1f} {max(latencies):>8.1f} {connections:>12}")
+
+    print(f"\np99 is {results['default'] / results['shared']:.1f}x lower with the shared client config.")
+    print("Connections counts every connection the server accepted, warm-up included.")
+
+
+if __name__ == "__main__":
+    main()
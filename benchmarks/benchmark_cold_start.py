@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""
+Cold Start Benchmark
+Starts each function in a fresh Python process, the way Lambda starts a new
+container, and times:
+
+    import      loading the handler module and everything it imports
+    first call  the first invocation, with a request rejected before any AWS call
+    deferred    building what lazy mode left for later (boto3, clients, tables),
+                which the first request that reads DynamoDB pays instead
+
+Every function is started --runs times and the medians are reported. In lazy mode
+(the deployed default) import + first call is compared with BUDGETS_MS, and the
+script exits with status 1 when a function is over budget, so a change that slows
+cold starts fails the run. Eager mode is shown for comparison. Runs offline: no
+AWS access is needed.
+
+    python3 benchmarks/benchmark_cold_start.py
+    python3 benchmarks/benchmark_cold_start.py --startup-mode lazy --runs 9 --budget-ms 150
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: (function directory, module, handler, event that is rejected before any AWS call)
+FUNCTIONS = {
+    'get_quote': ('get_quote_lambda', 'get_quote_lambda', 'lambda_handler', {'queryStringParameters': {}}),
+    'show_history': ('show_history_lambda', 'show_history_lambda', 'lambda_handler', {'queryStringParameters': {}}),
+    'add_doctor_procedure': ('add_doctor_procedure', 'add_doctor_procedure_lambda', 'lambda_handler', {'body': '{}'}),
+    'intent_mapper': ('bedrock_intent_mapper_lambda', 'bedrock_intent_mapper_lambda', 'lambda_handler', {'body': '{}'})
+}
+
+# Import + first call in lazy mode, in ms, measured locally. Lambda's CPU share at
+# the default memory size is smaller, so deployed cold starts are longer.
+BUDGETS_MS = {
+    'get_quote': 100,
+    'show_history': 100,
+    'add_doctor_procedure': 100,
+    'intent_mapper': 150
+}
+
+
+class StubContext:
+    aws_request_id = 'cold-start-benchmark'
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def measure_in_this_process(name):
+    """Import and first-call one function; runs in the child process"""
+    directory, module_name, handler_name, event = FUNCTIONS[name]
+    sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+    sys.path.append(os.path.join(ROOT, 'functions', directory))
+
+    start = time.perf_counter()
+    module = __import__(module_name)
+    imported = time.perf_counter()
+    response = getattr(module, handler_name)(event, StubContext())
+    called = time.perf_counter()
+
+    import startup
+    startup.warm()
+    warmed = time.perf_counter()
+    return {
+        'importMs': (imported - start) * 1000,
+        'firstCallMs': (called - imported) * 1000,
+        'deferredMs': (warmed - called) * 1000,
+        'statusCode': response.get('statusCode')
+    }
+
+
+def start_function(name, mode):
+    """One cold start of `name` in a fresh interpreter"""
+    env = dict(os.environ, STARTUP_MODE=mode, BEDROCK_AGENT_ID='benchmark-agent', BEDROCK_AGENT_ALIAS_ID='benchmark-alias')
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    # Keep the structured logs out of the benchmark output
+    env['LOG_LEVEL'] = 'ERROR'
+    env['METRICS_ENABLED'] = 'false'
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', name],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark function import and first-invoke time.')
+    parser.add_argument('--functions', nargs='+', choices=list(FUNCTIONS), default=list(FUNCTIONS), help='Functions to start')
+    parser.add_argument('--startup-mode', choices=['lazy', 'eager', 'both'], default='both', help='STARTUP_MODE to measure')
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts per function and mode')
+    parser.add_argument('--budget-ms', type=float, help='One budget for every function instead of BUDGETS_MS')
+    parser.add_argument('--child', choices=list(FUNCTIONS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_in_this_process(args.child)))
+        return
+
+    modes = ['lazy', 'eager'] if args.startup_mode == 'both' else [args.startup_mode]
+    print("🚀 Cold start benchmark")
+    print(f"{'function':<22} {'mode':<6} {'import':>8} {'1st call':>9} {'cold start':>11} {'deferred':>9} {'budget':>7}")
+
+    over_budget = []
+    for name in args.functions:
+        budget = args.budget_ms or BUDGETS_MS[name]
+        for mode in modes:
+            runs = [start_function(name, mode) for _ in range(args.runs)]
+            import_ms = statistics.median(run['importMs'] for run in runs)
+            call_ms = statistics.median(run['firstCallMs'] for run in runs)
+            cold_ms = statistics.median(run['importMs'] + run['firstCallMs'] for run in runs)
+            deferred_ms = statistics.median(run['deferredMs'] for run in runs)
+            status = ''
+            if mode == 'lazy':
+                status = f"{budget:>6.0f} {'✅' if cold_ms <= budget else '❌'}"
+                if cold_ms > budget:
+                    over_budget.append((name, cold_ms, budget))
+            print(f"{name:<22} {mode:<6} {import_ms:>8.1f} {call_ms:>9.1f} {cold_ms:>11.1f} {deferred_ms:>9.1f} {status}")
+
+    print("\nTimes are medians in ms. Cold start is import + first call of a request rejected before any AWS call.")
+    if over_budget:
+        for name, cold_ms, budget in over_budget:
+            print(f"❌ {name}: {cold_ms:.1f} ms cold start is over its {budget:.0f} ms budget")
+        sys.exit(1)
+    if 'lazy' in modes:
+        print("✅ Every function is within its cold start budget")
+
+
+if __name__ == "__main__":
+    main()
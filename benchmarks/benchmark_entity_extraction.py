@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Entity Extraction Benchmark
+Compares the intent mapper's Aho-Corasick extractor with the nested-loop
+extractor it replaced, on a generated corpus of utterances with conversation
+history, for catalogs of increasing size. Runs offline: the catalog is
+installed directly, so no AWS access is needed.
+
+    python3 benchmarks/benchmark_entity_extraction.py --utterances 2000 --catalog-sizes 16 200 1000
+"""
+
+import os
+import sys
+import re
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+sys.path.append(os.path.join(ROOT, 'functions', 'bedrock_intent_mapper_lambda'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import bedrock_intent_mapper_lambda as mapper
+
+FIRST_NAMES = ['Sarah', 'Michael', 'Emily', 'James', 'Lisa', 'David', 'Rachel', 'Mark', 'Jennifer', 'Robert',
+               'Amanda', 'Christopher', 'Michelle', 'Andrew', 'Nicole', 'Kevin', 'Priya', 'Omar', 'Grace', 'Hiro']
+LAST_NAMES = ['Johnson', 'Chen', 'Rodriguez', 'Wilson', 'Thompson', 'Kim', 'Green', 'Davis', 'Lee', 'Brown',
+              'Martinez', 'Taylor', 'White', 'Garcia', 'Anderson', 'Thomas', 'Patel', 'Haddad', 'Okafor', 'Tanaka']
+CODE_PREFIXES = ['CONS', 'XRAY', 'LAB', 'ENDO', 'SURG', 'CARD', 'DERM', 'ORTH', 'NEUR', 'PHYS']
+
+TEMPLATES = [
+    'get quote for {doctor} {code}',
+    'what is the cost of {code} with Dr. {doctor}?',
+    'show history for {doctor}',
+    'show procedures for {last}',
+    'price for {first} please',
+    'what about her costs for that procedure',
+    'and the history for that doctor?',
+    'add procedure {code} for {doctor} at 250',
+    'which doctor is cheapest for an MRI?'
+]
+
+
+def legacy_extract_parameters(text, conversation_history, doctors, codes):
+    """The nested-loop extraction previously used by the intent mapper (without prompt building)"""
+    text_lower = text.lower()
+    extracted = {'intent': None, 'doctorName': None, 'procedureCode': None}
+    context_doctors = []
+    context_procedures = []
+    last_intent = None
+
+    for msg in (conversation_history or [])[-6:]:
+        params = msg.get('extractedParams') or {}
+        if params.get('doctorName'):
+            context_doctors.append(params['doctorName'])
+        if params.get('procedureCode'):
+            context_procedures.append(params['procedureCode'])
+        if params.get('intent'):
+            last_intent = params['intent']
+        content = msg.get('content', '').lower()
+        for doctor in doctors:
+            if doctor.lower() in content:
+                context_doctors.append(doctor)
+        for code in codes:
+            if code.lower() in content:
+                context_procedures.append(code)
+
+    context_doctors = list(dict.fromkeys(reversed(context_doctors)))
+    context_procedures = list(dict.fromkeys(reversed(context_procedures)))
+
+    for intent, phrases in mapper.INTENT_PHRASES.items():
+        if any(phrase in text_lower for phrase in phrases):
+            extracted['intent'] = intent
+            break
+    else:
+        if any(phrase in text_lower for phrase in mapper.CONTEXT_INTENT_PHRASES) and last_intent:
+            extracted['intent'] = last_intent
+
+    has_pronoun = any(pronoun in text_lower for pronoun in mapper.DOCTOR_REFERENCES)
+    for doctor in doctors:
+        first_name = doctor.split()[0].lower()
+        last_name = doctor.split()[-1].lower()
+        if doctor.lower() in text_lower or f" {first_name}" in f" {text_lower}" or last_name in text_lower:
+            extracted['doctorName'] = doctor
+            break
+    if not extracted['doctorName'] and has_pronoun and context_doctors:
+        extracted['doctorName'] = context_doctors[0]
+    if not extracted['doctorName']:
+        for doctor in doctors:
+            if any(word in text_lower for word in doctor.lower().split() if len(word) > 2):
+                extracted['doctorName'] = doctor
+                break
+
+    for code in codes:
+        if code.lower() in text_lower:
+            extracted['procedureCode'] = code
+            break
+    code_match = re.search(r'\b([A-Z]{3,4}\d{3})\b', text.upper())
+    if code_match and not extracted['procedureCode']:
+        extracted['procedureCode'] = code_match.group(1)
+    if not extracted['procedureCode'] and any(ref in text_lower for ref in mapper.PROCEDURE_REFERENCES) and context_procedures:
+        extracted['procedureCode'] = context_procedures[0]
+    return extracted
+
+
+def make_catalog(size, rng):
+    """`size` distinct doctor names and a procedure catalog"""
+    names = [f"{first} {last}" for last in LAST_NAMES for first in FIRST_NAMES]
+    rng.shuffle(names)
+    while len(names) < size:
+        names.append(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}-{len(names)}")
+    codes = [f"{prefix}{number:03d}" for prefix in CODE_PREFIXES for number in range(1, 6)]
+    return sorted(names[:size]), codes
+
+
+def make_corpus(count, doctors, codes, rng):
+    """Utterances with two to six messages of prior conversation each"""
+    corpus = []
+    for _ in range(count):
+        doctor = rng.choice(doctors)
+        code = rng.choice(codes)
+        fields = {'doctor': doctor, 'first': doctor.split()[0], 'last': doctor.split()[-1], 'code': code}
+        history = []
+        for _ in range(rng.randint(1, 3)):
+            previous = rng.choice(doctors)
+            history.append({'role': 'user', 'content': f'show history for {previous}'})
+            history.append({
+                'role': 'assistant',
+                'content': f'{previous} performed {rng.choice(codes)} on 2025-07-30 for $250.',
+                'extractedParams': {'intent': 'showHistory', 'doctorName': previous}
+            })
+        corpus.append((rng.choice(TEMPLATES).format(**fields), history))
+    return corpus
+
+
+def use_catalog(doctors, codes):
+    """Install a catalog in the mapper without reading the doctor registry"""
+    mapper._entity_catalog.update({
+        'doctors': doctors,
+        'codes': codes,
+        'automaton': mapper.build_entity_automaton(doctors, codes),
+        'loadedAt': time.time()
+    })
+    mapper.ENTITY_CATALOG_TTL_SECONDS = 10 ** 9
+
+
+def throughput(extract, corpus):
+    """Utterances per second for one pass over the corpus"""
+    start = time.perf_counter()
+    for text, history in corpus:
+        extract(text, history)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark automaton vs nested-loop entity extraction.')
+    parser.add_argument('--utterances', type=int, default=2000, help='Utterances per corpus')
+    parser.add_argument('--catalog-sizes', type=int, nargs='+', default=[16, 200, 1000], help='Doctor catalog sizes')
+    parser.add_argument('--seed', type=int, default=7, help='Random seed for the corpus')
+    args = parser.parse_args()
+
+    print("🚀 Entity extraction benchmark")
+    print(f"{'doctors':>8} {'legacy utt/s':>14} {'automaton utt/s':>16} {'speedup':>8} {'build ms':>9} {'agreement':>10}")
+
+    for size in args.catalog_sizes:
+        rng = random.Random(args.seed)
+        doctors, codes = make_catalog(size, rng)
+        corpus = make_corpus(args.utterances, doctors, codes, rng)
+
+        build_start = time.perf_counter()
+        use_catalog(doctors, codes)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        legacy_rate = throughput(lambda text, history: legacy_extract_parameters(text, history, doctors, codes), corpus)
+        automaton_rate = throughput(mapper.extract_parameters_from_text, corpus)
+
+        fields = ('intent', 'doctorName', 'procedureCode')
+        agreement = sum(
+            all(legacy_extract_parameters(text, history, doctors, codes)[field] ==
+                mapper.extract_parameters_from_text(text, history)[field] for field in fields)
+            for text, history in corpus
+        ) / len(corpus)
+
+        print(f"{size:>8} {legacy_rate:>14,.0f} {automaton_rate:>16,.0f} {automaton_rate / legacy_rate:>7.1f}x "
+              f"{build_ms:>9.1f} {agreement:>9.1%}")
+
+    print("\nAgreement below 100% is expected. The automaton prefers a full-name match over")
+    print("the first catalog doctor sharing a first or last name, and only matches whole words,")
+    print("so 'her' no longer matches inside 'where' and 'Lee' no longer matches inside 'sleep'.")
+
+
+if __name__ == "__main__":
+    main()
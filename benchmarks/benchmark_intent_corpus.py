@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""
+Intent Corpus Benchmark
+Runs the intent mapper's offline stages over the labelled corpus in
+benchmarks/intent_corpus/ and reports utterances per second, per-stage timings
+and precision/recall:
+
+    utterances.jsonl        text, optional conversationHistory and the expected
+                            intent, doctorName and procedureCode
+    agent_replies.jsonl     agent replies and whether they should trigger the
+                            direct fallback (agent_response_needs_fallback)
+    direct_responses.jsonl  quote/history function bodies and the expected
+                            format_direct_response text
+
+Runs offline: the seed catalog is installed directly, so no AWS access is needed.
+
+    python3 benchmarks/benchmark_intent_corpus.py --repeat 200 --show-misses
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+sys.path.append(os.path.join(ROOT, 'functions', 'bedrock_intent_mapper_lambda'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import bedrock_intent_mapper_lambda as mapper
+
+CORPUS_DIR = os.path.join(ROOT, 'benchmarks', 'intent_corpus')
+FIELDS = ('intent', 'doctorName', 'procedureCode')
+
+
+def load_jsonl(name):
+    with open(os.path.join(CORPUS_DIR, name)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_corpus():
+    """(utterances, agent replies, direct responses)"""
+    return load_jsonl('utterances.jsonl'), load_jsonl('agent_replies.jsonl'), load_jsonl('direct_responses.jsonl')
+
+
+def use_seed_catalog():
+    """Install the mapper's seed doctors and codes without reading the doctor registry"""
+    mapper._entity_catalog.update({
+        'doctors': mapper.COMMON_DOCTORS,
+        'codes': mapper.PROCEDURE_CODES,
+        'automaton': mapper.build_entity_automaton(mapper.COMMON_DOCTORS, mapper.PROCEDURE_CODES),
+        'loadedAt': time.time()
+    })
+    mapper.ENTITY_CATALOG_TTL_SECONDS = 10 ** 9
+
+
+def precision_recall(pairs):
+    """
+    Precision and recall over (predicted, expected) pairs where None means "nothing".
+    A prediction is correct only if it equals the expected value.
+    """
+    true_positives = sum(1 for predicted, expected in pairs if predicted is not None and predicted == expected)
+    predicted = sum(1 for predicted, _ in pairs if predicted is not None)
+    expected = sum(1 for _, expected in pairs if expected is not None)
+    return {
+        'precision': true_positives / predicted if predicted else 1.0,
+        'recall': true_positives / expected if expected else 1.0
+    }
+
+
+def evaluate_extraction(utterances):
+    """Per-field precision/recall, exact-match rate per tag, and the utterances with a wrong field"""
+    pairs = {field: [] for field in FIELDS}
+    tags = {}
+    misses = []
+    for row in utterances:
+        extracted = mapper.extract_parameters_from_text(row['text'], row.get('conversationHistory', []))
+        wrong = [field for field in FIELDS if extracted[field] != row['expected'][field]]
+        for field in FIELDS:
+            pairs[field].append((extracted[field], row['expected'][field]))
+        tag = tags.setdefault(row.get('tag', 'untagged'), [0, 0])
+        tag[0] += not wrong
+        tag[1] += 1
+        if wrong:
+            misses.append({'text': row['text'], 'wrong': {field: (extracted[field], row['expected'][field]) for field in wrong}})
+    return {
+        'fields': {field: precision_recall(field_pairs) for field, field_pairs in pairs.items()},
+        'exactMatch': sum(correct for correct, _ in tags.values()) / len(utterances),
+        'tags': {tag: correct / total for tag, (correct, total) in tags.items()},
+        'misses': misses
+    }
+
+
+def evaluate_fallback(replies):
+    """Precision/recall of agent_response_needs_fallback, with "needs fallback" as the positive class"""
+    pairs = []
+    misses = []
+    for row in replies:
+        predicted = mapper.agent_response_needs_fallback(row['response'], row['extractedParams'])
+        pairs.append((True if predicted else None, True if row['expectedNeedsFallback'] else None))
+        if predicted != row['expectedNeedsFallback']:
+            misses.append({'response': row['response'], 'predicted': predicted})
+    return dict(precision_recall(pairs), misses=misses)
+
+
+def evaluate_direct(directs):
+    """Share of format_direct_response outputs equal to the expected text"""
+    misses = [row for row in directs if mapper.format_direct_response(row['lambdaResponse'], row['intent']) != row['expected']]
+    return {'accuracy': 1 - len(misses) / len(directs), 'misses': misses}
+
+
+def time_stage(call, inputs, repeat):
+    """Mean and p95 microseconds per call over `repeat` passes"""
+    samples = []
+    for _ in range(repeat):
+        for args in inputs:
+            start = time.perf_counter()
+            call(*args)
+            samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {'calls': len(samples), 'meanUs': sum(samples) / len(samples), 'p95Us': samples[int(0.95 * (len(samples) - 1))]}
+
+
+def time_stages(utterances, replies, directs, repeat):
+    """Per-stage timings, and utterances per second through extraction and route scoring"""
+    texts = [(row['text'], row.get('conversationHistory', [])) for row in utterances]
+    extracted = [mapper.extract_parameters_from_text(text, history) for text, history in texts]
+    stages = {
+        'extract': time_stage(mapper.extract_parameters_from_text, texts, repeat),
+        'scoreRoute': time_stage(mapper.score_local_route, [(params,) for params in extracted], repeat),
+        'needsFallback': time_stage(mapper.agent_response_needs_fallback, [(row['response'], row['extractedParams']) for row in replies], repeat),
+        'formatDirect': time_stage(mapper.format_direct_response, [(row['lambdaResponse'], row['intent']) for row in directs], repeat)
+    }
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text, history in texts:
+            mapper.score_local_route(mapper.extract_parameters_from_text(text, history))
+    utterances_per_second = repeat * len(texts) / (time.perf_counter() - start)
+    return stages, utterances_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark intent extraction and fallback heuristics on the labelled corpus.')
+    parser.add_argument('--repeat', type=int, default=100, help='Passes over the corpus for timings')
+    parser.add_argument('--show-misses', action='store_true', help='List every corpus entry that was handled wrongly')
+    args = parser.parse_args()
+
+    use_seed_catalog()
+    utterances, replies, directs = load_corpus()
+    extraction = evaluate_extraction(utterances)
+    fallback = evaluate_fallback(replies)
+    direct = evaluate_direct(directs)
+    stages, utterances_per_second = time_stages(utterances, replies, directs, args.repeat)
+
+    print(f"🚀 Intent corpus benchmark: {len(utterances)} utterances, {len(replies)} agent replies, {len(directs)} direct responses")
+    print(f"\n{'field':<16} {'precision':>10} {'recall':>8}")
+    for field, scores in extraction['fields'].items():
+        print(f"{field:<16} {scores['precision']:>9.1%} {scores['recall']:>7.1%}")
+    print(f"{'needsFallback':<16} {fallback['precision']:>9.1%} {fallback['recall']:>7.1%}")
+    print(f"\nExact match (all three fields): {extraction['exactMatch']:.1%}")
+    for tag, rate in sorted(extraction['tags'].items()):
+        print(f"   {tag:<20} {rate:>6.1%}")
+    print(f"format_direct_response accuracy: {direct['accuracy']:.1%}")
+
+    print(f"\n{'stage':<16} {'calls':>8} {'mean µs':>9} {'p95 µs':>9}")
+    for stage, timing in stages.items():
+        print(f"{stage:<16} {timing['calls']:>8} {timing['meanUs']:>9.1f} {timing['p95Us']:>9.1f}")
+    print(f"\nThroughput (extract + score): {utterances_per_second:,.0f} utterances/s")
+
+    if args.show_misses:
+        print("\nMisses:")
+        for miss in extraction['misses']:
+            print(f"   {miss['text']!r}: " + ', '.join(f"{field} got {got!r}, expected {want!r}" for field, (got, want) in miss['wrong'].items()))
+        for miss in fallback['misses']:
+            print(f"   reply {miss['response']!r}: needsFallback {miss['predicted']}")
+        for miss in direct['misses']:
+            print(f"   direct {miss['lambdaResponse']!r}: expected {miss['expected']!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Response Serialization Benchmark
+Builds the show history response for large histories three ways and reports the
+time per response and the peak memory allocated while building it:
+
+    legacy    float() on every cost, then json.dumps (the handlers before response_envelopes)
+    stdlib    Decimal costs through response_envelopes with the standard json module
+    orjson    the same with orjson, when it is installed
+
+Runs offline on generated DynamoDB items, so no AWS access is needed.
+
+    python3 benchmarks/benchmark_response_serialization.py --history-sizes 100 1000 10000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+
+import response_envelopes
+
+FAST_BACKEND = response_envelopes.orjson
+PROCEDURES = [('CONS001', 'Consultation'), ('LAB001', 'Blood Test'), ('XRAY001', 'Chest X-Ray'),
+              ('ENDO001', 'Endoscopy'), ('SURG001', 'Minor Surgery')]
+
+
+def make_items(count, rng):
+    """History rows as the table returns them: costs are Decimal"""
+    items = []
+    for index in range(count):
+        code, name = rng.choice(PROCEDURES)
+        logged = f'2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T{index % 24:02d}:{index % 60:02d}:00Z'
+        items.append({
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'{logged}#{index:08x}',
+            'procedure_code': code,
+            'procedure_name': name,
+            'cost': Decimal(str(round(rng.uniform(50, 2000), 2))),
+            'time_logged': logged
+        })
+    return items
+
+
+def legacy_response(items):
+    """The envelope as show_history built it before: per-field float() and json.dumps"""
+    history = [{'procedure': item['procedure_name'], 'time': item['time_logged'], 'cost': float(item['cost'])} for item in items]
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'message': f'Found {len(history)} procedures for Sarah Johnson.',
+            'doctorName': 'Sarah Johnson',
+            'procedureCount': len(history),
+            'totalCost': sum(float(item['cost']) for item in items),
+            'history': history
+        })
+    }
+
+
+def shared_response(items):
+    """The envelope as show_history builds it now: Decimal costs serialized once"""
+    history = [{'procedure': item['procedure_name'], 'time': item['time_logged'], 'cost': item['cost']} for item in items]
+    return response_envelopes.build_response({}, False, 200, {
+        'message': f'Found {len(history)} procedures for Sarah Johnson.',
+        'doctorName': 'Sarah Johnson',
+        'procedureCount': len(history),
+        'totalCost': sum(item['cost'] for item in items),
+        'history': history
+    }, 'ShowHistoryGroup', '/showHistory')
+
+
+def use_backend(name):
+    response_envelopes.orjson = FAST_BACKEND if name == 'orjson' else None
+
+
+def measure(build, items, repeat):
+    """(mean ms per response, peak KiB allocated while building one, body bytes)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build(items)
+    mean_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    body = build(items)['body']
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mean_ms, peak / 1024, len(body.encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response envelope serialization on large histories.')
+    parser.add_argument('--history-sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Rows per history')
+    parser.add_argument('--repeat', type=int, default=50, help='Responses built per timing')
+    parser.add_argument('--seed', type=int, default=7, help='Random seed for the costs')
+    args = parser.parse_args()
+
+    variants = [('legacy', legacy_response), ('stdlib', shared_response)]
+    if FAST_BACKEND is not None:
+        variants.append(('orjson', shared_response))
+    else:
+        print("orjson is not installed; only the standard library backend is measured")
+
+    print("🚀 Response serialization benchmark")
+    print(f"{'rows':>7} {'variant':<8} {'mean ms':>9} {'peak KiB':>10} {'body KiB':>9} {'speedup':>8}")
+    for size in args.history_sizes:
+        items = make_items(size, random.Random(args.seed))
+        baseline = None
+        for name, build in variants:
+            use_backend(name)
+            mean_ms, peak_kib, body_bytes = measure(build, items, args.repeat)
+            baseline = baseline or mean_ms
+            print(f"{size:>7} {name:<8} {mean_ms:>9.2f} {peak_kib:>10.0f} {body_bytes / 1024:>9.0f} {baseline / mean_ms:>7.1f}x")
+    use_backend('orjson')
+
+    print("\nThe shared bodies are smaller because they are written without spaces after separators.")
+
+
+if __name__ == "__main__":
+    main()
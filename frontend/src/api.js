@@ -62,9 +62,14 @@ class APIClient {
     }
   }
 
-  async getHistory(doctorName, limit = 5) {
+  async getHistory(doctorName, limit = 5, since = null) {
     try {
-      const response = await this.client.get(`/show-history?doctorName=${encodeURIComponent(doctorName)}&limit=${limit}`);
+      let url = `/show-history?doctorName=${encodeURIComponent(doctorName)}&limit=${limit}`;
+      if (since) {
+        // Only fetch procedures newer than the watermark from a previous response
+        url += `&since=${encodeURIComponent(since)}`;
+      }
+      const response = await this.client.get(url);
       return response.data;
     } catch (error) {
       console.error('Get history error:', error);
@@ -13,7 +13,7 @@ const ChatInterface = () => {
   ]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
-  const [sessionId] = useState(`session-${Date.now()}`);
+  const [sessionId, setSessionId] = useState(`session-${Date.now()}`);
   const [conversationHistory, setConversationHistory] = useState([]);
   const messagesEndRef = useRef(null);
 
@@ -48,7 +48,8 @@ const ChatInterface = () => {
     setIsLoading(true);
 
     try {
-      const response = await apiClient.chatWithAgent(inputMessage, sessionId, updatedHistory);
+      // Context is kept server-side per sessionId, so only the new message is sent
+      const response = await apiClient.chatWithAgent(inputMessage, sessionId);
       
       const botMessage = {
         id: Date.now() + 1,
@@ -119,6 +120,8 @@ const ChatInterface = () => {
 
   const clearConversationContext = () => {
     setConversationHistory([]);
+    // The server keeps context per session, so a new session starts fresh
+    setSessionId(`session-${Date.now()}`);
     // Optionally add a system message to indicate context was cleared
     const contextClearedMessage = {
       id: Date.now(),
@@ -1,14 +1,105 @@
 # filename: add_doctor_procedure_lambda.py
 import json
-import boto3
 import os
+import time
+import random
+import base64
 from datetime import datetime, timezone
-from decimal import Decimal
-import difflib
+from decimal import Decimal, InvalidOperation
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from startup import lazy, lazy_import
+import aws_clients
+from sort_keys import make_sort_key
+from doctor_shards import write_partition_key, doctor_name_from_partition_key
+from response_envelopes import is_bedrock_agent_event, build_response
+from structured_log import get_logger, start_request
+from stage_metrics import start_spans, span, timed_call, emit_spans
+from procedure_queue import enqueue_procedure, dead_letter_procedure, queue_backend
+from procedure_aggregates import STATS_TABLE_NAME, plan_transactions, transaction_actions, transaction_token, idempotency_record_key, idempotency_expires_at
+
+# Built on first use unless STARTUP_MODE=eager (see startup.py)
+difflib = lazy_import('difflib')
 
-dynamodb = boto3.resource('dynamodb')
 TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'DoctorProcedures')
-table = dynamodb.Table(TABLE_NAME)
+log = get_logger('add_doctor_procedure')
+
+# 'async' validates and enqueues adds for the queue consumer instead of writing them inline
+PROCEDURE_WRITE_MODE = os.environ.get('PROCEDURE_WRITE_MODE', 'sync').lower()
+
+# Bulk ingest settings
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '10000'))
+BULK_WRITE_CONCURRENCY = int(os.environ.get('BULK_WRITE_CONCURRENCY', '8'))
+BULK_MAX_RETRIES = int(os.environ.get('BULK_MAX_RETRIES', '6'))
+BULK_BACKOFF_BASE_SECONDS = 0.05
+BULK_BACKOFF_CAP_SECONDS = 2.0
+RETRYABLE_ERROR_CODES = ['ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded', 'TransactionInProgressException']
+RETRYABLE_CANCELLATION_CODES = ['TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded']
+
+# One pooled connection per bulk writer thread (see aws_clients.py)
+dynamodb = lazy(lambda: aws_clients.resource('dynamodb', max_pool_connections=BULK_WRITE_CONCURRENCY))
+table = lazy(lambda: dynamodb.Table(TABLE_NAME))
+
+def get_all_doctor_names():
+    """
+    Get all unique doctor names from the table, following scan pagination.
+    """
+    all_doctors = set()
+    scan_kwargs = {'ProjectionExpression': 'DoctorName'}
+    while True:
+        response = timed_call('dynamodbScan', table.scan, **scan_kwargs)
+        all_doctors.update(doctor_name_from_partition_key(item['DoctorName']) for item in response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return list(all_doctors)
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+def match_doctor_name(input_name, all_doctors, threshold=0.4):
+    """
+    Match an input name against a known list of doctor names.
+    Returns (matched_name, confidence_score) or (None, 0) if no good match found.
+    """
+    if not all_doctors:
+        return None, 0
+    
+    # Normalize input name for comparison
+    input_normalized = input_name.lower().strip()
+    
+    # Try exact case-insensitive match first
+    for doctor in all_doctors:
+        if doctor.lower() == input_normalized:
+            log.info('Exact doctor match', doctor=doctor)
+            return doctor, 1.0
+    
+    # Try partial matching (if input is contained in doctor name or vice versa)
+    for doctor in all_doctors:
+        doctor_normalized = doctor.lower()
+        if input_normalized in doctor_normalized or doctor_normalized in input_normalized:
+            # Calculate confidence based on length similarity
+            confidence = min(len(input_normalized), len(doctor_normalized)) / max(len(input_normalized), len(doctor_normalized))
+            if confidence >= threshold:
+                log.info('Partial doctor match', doctor=doctor, confidence=round(confidence, 2))
+                return doctor, confidence
+    
+    # Use fuzzy matching for typos and spelling mistakes
+    matches = difflib.get_close_matches(
+        input_normalized, 
+        [doctor.lower() for doctor in all_doctors], 
+        n=1, 
+        cutoff=threshold
+    )
+    
+    if matches:
+        # Find the original doctor name corresponding to the matched normalized name
+        matched_normalized = matches[0]
+        for doctor in all_doctors:
+            if doctor.lower() == matched_normalized:
+                confidence = difflib.SequenceMatcher(None, input_normalized, matched_normalized).ratio()
+                log.info('Fuzzy doctor match', doctor=doctor, confidence=round(confidence, 2))
+                return doctor, confidence
+    
+    log.info('No doctor match', input=input_name)
+    return None, 0
 
 def find_best_doctor_match(input_name, threshold=0.4):
     """
@@ -16,74 +107,115 @@ def find_best_doctor_match(input_name, threshold=0.4):
     Returns (matched_name, confidence_score) or (None, 0) if no good match found.
     """
     try:
-        # Get all unique doctor names from the table
-        response = table.scan(
-            ProjectionExpression='DoctorName'
-        )
-        
-        all_doctors = list(set(item['DoctorName'] for item in response.get('Items', [])))
-        print(f"Available doctors: {all_doctors}")
-        
-        if not all_doctors:
-            return None, 0
-        
-        # Normalize input name for comparison
-        input_normalized = input_name.lower().strip()
-        
-        # Try exact case-insensitive match first
-        for doctor in all_doctors:
-            if doctor.lower() == input_normalized:
-                print(f"Exact match found: {doctor}")
-                return doctor, 1.0
-        
-        # Try partial matching (if input is contained in doctor name or vice versa)
-        for doctor in all_doctors:
-            doctor_normalized = doctor.lower()
-            if input_normalized in doctor_normalized or doctor_normalized in input_normalized:
-                # Calculate confidence based on length similarity
-                confidence = min(len(input_normalized), len(doctor_normalized)) / max(len(input_normalized), len(doctor_normalized))
-                if confidence >= threshold:
-                    print(f"Partial match found: {doctor} (confidence: {confidence:.2f})")
-                    return doctor, confidence
-        
-        # Use fuzzy matching for typos and spelling mistakes
-        matches = difflib.get_close_matches(
-            input_normalized, 
-            [doctor.lower() for doctor in all_doctors], 
-            n=1, 
-            cutoff=threshold
-        )
-        
-        if matches:
-            # Find the original doctor name corresponding to the matched normalized name
-            matched_normalized = matches[0]
-            for doctor in all_doctors:
-                if doctor.lower() == matched_normalized:
-                    confidence = difflib.SequenceMatcher(None, input_normalized, matched_normalized).ratio()
-                    print(f"Fuzzy match found: {doctor} (confidence: {confidence:.2f})")
-                    return doctor, confidence
-        
-        print(f"No good match found for: {input_name}")
-        return None, 0
+        all_doctors = get_all_doctor_names()
+        log.debug('Doctor catalog', count=len(all_doctors), doctors=all_doctors)
+        return match_doctor_name(input_name, all_doctors, threshold)
         
     except Exception as e:
-        print(f"Error in find_best_doctor_match: {e}")
+        log.error('Doctor match failed', error=str(e))
         return None, 0
 
+def normalize_logged_time(time_str):
+    """
+    Normalize a provided ISO 8601 time to UTC with a Z suffix, or use the current UTC time.
+    Raises ValueError for unparseable times.
+    """
+    if time_str:
+        return datetime.fromisoformat(time_str.replace('Z', '+00:00')).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def claimed_procedures(idempotency_keys):
+    """
+    Look up the rows already written for client idempotency keys.
+    Returns {idempotency_key: record} for the keys that were used, where the record
+    holds the row's doctor_partition, procedure_time and time_logged.
+    """
+    pending = {idempotency_record_key(key)['PK']: key for key in idempotency_keys}
+    keys = [{'PK': pk, 'SK': idempotency_record_key(key)['SK']} for pk, key in pending.items()]
+    claimed = {}
+    for start in range(0, len(keys), 100):
+        request = {STATS_TABLE_NAME: {'Keys': keys[start:start + 100], 'ConsistentRead': True}}
+        attempt = 0
+        while request:
+            response = timed_call('dynamodbBatchGet', dynamodb.meta.client.batch_get_item, RequestItems=request)
+            for record in response['Responses'].get(STATS_TABLE_NAME, []):
+                claimed[pending[record['PK']]] = record
+            request = response.get('UnprocessedKeys')
+            if request:
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+    return claimed
+
+def replayed_procedure(record, procedure_code, procedure_name, cost):
+    """Response body for a request whose idempotency key was already used"""
+    doctor_name = doctor_name_from_partition_key(record['doctor_partition'])
+    return {
+        'message': f'Procedure "{procedure_name or procedure_code}" for {doctor_name} was already added at {record["time_logged"]}.',
+        'doctorName': doctor_name,
+        'procedureCode': procedure_code,
+        'procedureName': procedure_name,
+        'cost': cost,
+        'timeLogged': record['time_logged'],
+        'procedureTime': record['procedure_time'],
+        'replayed': True
+    }
+
+def respond(event, is_bedrock_agent, status_code, body, function_name='add_doctor_procedure'):
+    """Answer in the envelope the caller expects, and emit the request's stage timings"""
+    with span('response'):
+        response = build_response(event, is_bedrock_agent, status_code, body, 'AddDoctorProcedureGroup', '/addDoctorProcedure', 'POST')
+    emit_spans(function_name, statusCode=status_code, bedrockAgent=is_bedrock_agent)
+    return response
+
+def enqueue_add_procedure(event, is_bedrock_agent, request):
+    """
+    Async mode: validate the procedure, enqueue it for the queue consumer and return 202.
+    Name resolution and the DynamoDB write happen in queue_lambda_handler.
+    """
+    fields, error_message = validate_procedure_fields(request)
+    status_code = 400
+    if fields:
+        # Assigning the sort key now makes redelivered messages overwrite rather than duplicate
+        message = {
+            'doctorName': fields['doctorName'],
+            'procedureCode': fields['procedureCode'],
+            'procedureName': fields['procedureName'],
+            'cost': str(fields['cost']),
+            'time': fields['timeLogged'],
+            'procedureTime': make_sort_key(fields['timeLogged'], fields['idempotencyKey']),
+            'idempotencyKey': fields['idempotencyKey'],
+            'enqueuedAt': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        }
+        message_id = enqueue_procedure(message)
+        log.info('Procedure queued', doctor=message['doctorName'], procedureTime=message['procedureTime'], backend=queue_backend(), messageId=message_id)
+
+        status_code = 202
+        result_data = {
+            'message': f'Procedure "{fields["procedureName"] or fields["procedureCode"]}" for {fields["doctorName"]} has been queued and will be saved shortly.',
+            'status': 'queued',
+            'doctorName': fields['doctorName'],
+            'procedureCode': fields['procedureCode'],
+            'procedureName': fields['procedureName'],
+            'cost': fields['cost'],
+            'timeLogged': fields['timeLogged'],
+            'procedureTime': message['procedureTime'],
+            'queueMessageId': message_id
+        }
+    else:
+        result_data = {'message': error_message}
+
+    return respond(event, is_bedrock_agent, status_code, result_data)
+
 def lambda_handler(event, context):
+    is_bedrock_agent = False
+    start_request(context)
+    start_spans()
     try:
-        # Debug: print the event to understand Bedrock Agent invocation format
-        print(f"Event received: {json.dumps(event)}")
+        log.event(event)
         
-        # Detect Bedrock Agent by checking for agent and parameters structure
-        is_bedrock_agent = (
-            'agent' in event and 
-            'actionGroup' in event and 
-            'parameters' in event and
-            'messageVersion' in event
-        )
+        is_bedrock_agent = is_bedrock_agent_event(event)
         
-        print(f"Detected Bedrock Agent: {is_bedrock_agent}")
+        log.info('Request received', bedrockAgent=is_bedrock_agent)
         
         # Handle Bedrock Agent parameters vs API Gateway body
         if is_bedrock_agent:
@@ -94,6 +226,7 @@ def lambda_handler(event, context):
             procedure_name = parameters.get('procedureName')
             cost = parameters.get('cost')
             time_str = parameters.get('time')
+            idempotency_key = parameters.get('idempotencyKey')
         elif 'body' in event and event['body']:
             # API Gateway format
             request_body = json.loads(event['body'])
@@ -102,6 +235,8 @@ def lambda_handler(event, context):
             procedure_name = request_body.get('procedureName')
             cost = request_body.get('cost')
             time_str = request_body.get('time')
+            headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+            idempotency_key = request_body.get('idempotencyKey') or headers.get('idempotency-key')
         else:
             # Direct invocation fallback
             doctor_name = event.get('doctorName')
@@ -109,144 +244,95 @@ def lambda_handler(event, context):
             procedure_name = event.get('procedureName')
             cost = event.get('cost')
             time_str = event.get('time')
+            idempotency_key = event.get('idempotencyKey')
 
         if not all([doctor_name, procedure_code, cost is not None]):
             error_message = 'Missing required parameters: doctorName, procedureCode, and cost.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                        'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                        'httpMethod': event.get('httpMethod', 'POST'),
-                        'httpStatusCode': 400,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 400, {'message': error_message})
+        # A numeric code would make procedure_codes a mixed-type set that DynamoDB rejects
+        procedure_code = str(procedure_code)
+
+        if PROCEDURE_WRITE_MODE == 'async':
+            return enqueue_add_procedure(event, is_bedrock_agent, {
+                'doctorName': doctor_name,
+                'procedureCode': procedure_code,
+                'procedureName': procedure_name,
+                'cost': cost,
+                'time': time_str,
+                'idempotencyKey': idempotency_key
+            })
 
         # Find the best matching doctor name using fuzzy matching
-        print(f"Original doctor name input: {doctor_name}")
-        matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
+        with span('nameResolution'):
+            matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
         original_input = doctor_name
         
         # For adding procedures, we're more cautious with fuzzy matching
         if matched_doctor_name and confidence >= 0.8:
             # High confidence match - use it
             doctor_name = matched_doctor_name
-            print(f"Using matched doctor name: {doctor_name} (confidence: {confidence:.2f})")
+            log.info('Using matched doctor', input=original_input, doctor=doctor_name, confidence=round(confidence, 2))
         elif matched_doctor_name and confidence >= 0.5:
             # Medium confidence - ask for confirmation or provide suggestion
             suggestion_message = f'Did you mean "{matched_doctor_name}"? The name "{original_input}" was not found exactly. Please confirm the doctor name or use the exact name "{matched_doctor_name}".'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                        'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                        'httpMethod': event.get('httpMethod', 'POST'),
-                        'httpStatusCode': 400,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({
-                                    'message': suggestion_message,
-                                    'suggestion': matched_doctor_name,
-                                    'confidence': confidence
-                                })
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'message': suggestion_message,
-                        'suggestion': matched_doctor_name,
-                        'confidence': confidence
-                    })
-                }
+            return respond(event, is_bedrock_agent, 400, {
+                'message': suggestion_message,
+                'suggestion': matched_doctor_name,
+                'confidence': confidence
+            })
         else:
             # Low confidence or no match - use the original name (create new doctor)
-            print(f"Using original doctor name (new doctor): {doctor_name}")
+            log.info('Using new doctor name', doctor=doctor_name)
             confidence = 1.0  # Set confidence to 1.0 for new doctor
 
         try:
             cost = Decimal(str(cost))
         except (ValueError, TypeError):
             error_message = 'Cost must be a valid number.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                        'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                        'httpMethod': event.get('httpMethod', 'POST'),
-                        'httpStatusCode': 400,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 400, {'message': error_message})
 
         # Handle time: use provided or current UTC
-        if time_str:
-            try:
-                logged_time = datetime.fromisoformat(time_str.replace('Z', '+00:00')).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
-            except ValueError:
-                error_message = 'Invalid time format. Use ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SSZ).'
-                if is_bedrock_agent:
-                    return {
-                        'messageVersion': '1.0',
-                        'response': {
-                            'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                            'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                            'httpMethod': event.get('httpMethod', 'POST'),
-                            'httpStatusCode': 400,
-                            'responseBody': {
-                                'application/json': {
-                                    'body': json.dumps({'message': error_message})
-                                }
-                            }
-                        }
-                    }
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'message': error_message})
-                    }
-        else:
-            logged_time = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        try:
+            logged_time = normalize_logged_time(time_str)
+        except ValueError:
+            error_message = 'Invalid time format. Use ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SSZ).'
+            return respond(event, is_bedrock_agent, 400, {'message': error_message})
+
+        # A retried request is answered with the row its idempotency key already wrote
+        if idempotency_key:
+            with span('idempotencyLookup'):
+                claimed = claimed_procedures([idempotency_key]).get(idempotency_key)
+            if claimed:
+                log.info('Idempotency key already used', procedureTime=claimed['procedure_time'])
+                return respond(event, is_bedrock_agent, 200, replayed_procedure(claimed, procedure_code, procedure_name, cost))
 
+        # A unique suffix keeps same-second procedures for one doctor from overwriting each other,
+        # and hot doctors' rows are spread across shard partitions. An idempotency key is claimed
+        # in the same transaction as the row, so a concurrent retry cannot write a second row.
+        sort_key = make_sort_key(logged_time, idempotency_key)
         item = {
-            'DoctorName': doctor_name,
-            'ProcedureTime': logged_time,
+            'DoctorName': write_partition_key(doctor_name, sort_key),
+            'ProcedureTime': sort_key,
             'procedure_code': procedure_code,
             'procedure_name': procedure_name,
             'cost': cost,
             'time_logged': logged_time
         }
+        if idempotency_key:
+            item['idempotency_key'] = idempotency_key
 
-        table.put_item(Item=item)
+        # The row, the doctor registry entry and the aggregates are written atomically
+        with span('procedureWrite'):
+            write_errors = write_procedure_transaction([(0, item)])
+        if write_errors:
+            raise RuntimeError(write_errors[0])
+
+        # A concurrent request with the same key may have claimed it first
+        if idempotency_key:
+            with span('idempotencyLookup'):
+                claimed = claimed_procedures([idempotency_key]).get(idempotency_key)
+            if claimed and claimed['procedure_time'] != sort_key:
+                return respond(event, is_bedrock_agent, 200, replayed_procedure(claimed, procedure_code, procedure_name, cost))
 
         success_message = f'Procedure "{procedure_name or procedure_code}" for {doctor_name} added successfully at {logged_time}.'
         
@@ -254,66 +340,398 @@ def lambda_handler(event, context):
         if confidence < 1.0 and matched_doctor_name:
             success_message += f' (Note: Matched "{doctor_name}" from your input "{original_input}")'
         
-        if is_bedrock_agent:
-            return {
-                'messageVersion': '1.0',
-                'response': {
-                    'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                    'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                    'httpMethod': event.get('httpMethod', 'POST'),
-                    'httpStatusCode': 200,
-                    'responseBody': {
-                        'application/json': {
-                            'body': json.dumps({
-                                'message': success_message,
-                                'doctorName': doctor_name,
-                                'procedureCode': procedure_code,
-                                'procedureName': procedure_name,
-                                'cost': float(cost),
-                                'timeLogged': logged_time,
-                                'matchConfidence': confidence
-                            })
-                        }
-                    }
-                }
-            }
+        return respond(event, is_bedrock_agent, 200, {
+            'message': success_message,
+            'doctorName': doctor_name,
+            'procedureCode': procedure_code,
+            'procedureName': procedure_name,
+            'cost': cost,
+            'timeLogged': logged_time,
+            'procedureTime': item['ProcedureTime'],
+            'matchConfidence': confidence
+        })
+
+    except Exception as e:
+        log.error('addDoctorProcedure failed', error=str(e))
+        return respond(event, is_bedrock_agent, 500, {'message': f'Internal server error: {str(e)}'})
+
+def parse_bulk_body(event):
+    """
+    Parse a bulk request body as a JSON array or NDJSON (one JSON object per line).
+    Returns a list of rows; NDJSON lines that fail to parse are returned as the error message string.
+    Raises ValueError when the body is empty or is not a valid JSON array.
+    """
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+
+    body = body.strip()
+    if not body:
+        raise ValueError('Request body is empty.')
+
+    if body.startswith('['):
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise ValueError(f'Invalid JSON array: {e}')
+
+    rows = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError as e:
+            rows.append(f'Invalid JSON line: {e}')
+    return rows
+
+def validate_procedure_fields(row):
+    """
+    Validate and normalize one procedure (a bulk row or a queued message).
+    Returns (fields, error_message) where exactly one of the two is None.
+    """
+    if isinstance(row, str):
+        return None, row
+    if not isinstance(row, dict):
+        return None, 'Row must be a JSON object.'
+
+    doctor_name = row.get('doctorName')
+    procedure_code = row.get('procedureCode')
+    cost = row.get('cost')
+    if not all([doctor_name, procedure_code, cost is not None]):
+        return None, 'Missing required parameters: doctorName, procedureCode, and cost.'
+
+    try:
+        if isinstance(cost, bool):
+            raise InvalidOperation()
+        cost = Decimal(str(cost))
+        if not cost.is_finite():
+            raise InvalidOperation()
+    except (InvalidOperation, ValueError, TypeError):
+        return None, 'Cost must be a valid number.'
+
+    try:
+        logged_time = normalize_logged_time(row.get('time'))
+    except (ValueError, TypeError, AttributeError):
+        return None, 'Invalid time format. Use ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SSZ).'
+
+    return {
+        'doctorName': str(doctor_name).strip(),
+        'procedureCode': str(procedure_code),
+        'procedureName': row.get('procedureName'),
+        'cost': cost,
+        'timeLogged': logged_time,
+        'idempotencyKey': row.get('idempotencyKey')
+    }, None
+
+def resolve_doctor_names(input_names):
+    """
+    Resolve every distinct input doctor name against a single scan of the table.
+    Applies the same confidence rules as single adds and treats doctors created
+    earlier in the batch as known, so the result matches adding rows one at a time.
+    Returns {input_name: (resolved_name, confidence, suggestion)}; resolved_name is
+    None when the match needs confirmation and `suggestion` holds the candidate.
+    """
+    all_doctors = get_all_doctor_names()
+    log.info('Resolving doctor names', names=len(input_names), knownDoctors=len(all_doctors))
+
+    resolved = {}
+    for input_name in input_names:
+        if input_name in resolved:
+            continue
+        matched_doctor_name, confidence = match_doctor_name(input_name, all_doctors)
+        if matched_doctor_name and confidence >= 0.8:
+            resolved[input_name] = (matched_doctor_name, confidence, None)
+        elif matched_doctor_name and confidence >= 0.5:
+            resolved[input_name] = (None, confidence, matched_doctor_name)
+        else:
+            resolved[input_name] = (input_name, 1.0, None)
+            all_doctors.append(input_name)
+    return resolved
+
+def backoff_delay(attempt):
+    """
+    Full-jitter exponential backoff delay in seconds for the given retry attempt.
+    """
+    return random.uniform(0, min(BULK_BACKOFF_CAP_SECONDS, BULK_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+def write_procedure_transaction(rows):
+    """
+    Write (row_id, item) pairs for one partition, with their doctor registry and
+    aggregate updates, in a single TransactWriteItems call. Rows whose key already
+    exists, or whose idempotency key is already claimed, were written by an earlier
+    attempt or request and are dropped rather than counted twice; conflicts and
+    throttling are retried with jittered backoff.
+    Returns {row_id: error_message} for rows that could not be written.
+    """
+    pending = list(rows)
+    # Fixed for the whole write: every retry must send the same claims under the same token
+    expires_at = idempotency_expires_at()
+    attempt = 0
+    while pending:
+        items = [item for _, item in pending]
+        try:
+            # The resource's client accepts native Python types and is safe to share across threads
+            timed_call(
+                'dynamodbTransactWrite',
+                dynamodb.meta.client.transact_write_items,
+                TransactItems=transaction_actions(TABLE_NAME, items, expires_at=expires_at),
+                ClientRequestToken=transaction_token(items, expires_at)
+            )
+            return {}
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', '')
+            if error_code == 'TransactionCanceledException':
+                reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                # Raw row puts come first in the transaction, in `pending` order, then the idempotency key claims
+                existing = {index for index, code in enumerate(reasons[:len(pending)]) if code == 'ConditionalCheckFailed'}
+                keyed = [index for index, (_, item) in enumerate(pending) if item.get('idempotency_key')]
+                claim_reasons = reasons[len(pending):len(pending) + len(keyed)]
+                existing |= {index for index, code in zip(keyed, claim_reasons) if code == 'ConditionalCheckFailed'}
+                if existing:
+                    log.info('Skipping procedures already written', count=len(existing))
+                    pending = [row for index, row in enumerate(pending) if index not in existing]
+                    continue
+                if not set(reasons) - {'None', None} <= set(RETRYABLE_CANCELLATION_CODES):
+                    log.error('TransactWriteItems cancelled', reasons=reasons)
+                    return {row_id: f'Write failed: {error_code}' for row_id, _ in pending}
+            elif error_code not in RETRYABLE_ERROR_CODES:
+                log.error('TransactWriteItems failed', error=str(e))
+                return {row_id: f'Write failed: {error_code or str(e)}' for row_id, _ in pending}
+
+        if attempt >= BULK_MAX_RETRIES:
+            log.warning('Giving up on procedures', count=len(pending), retries=attempt)
+            break
+
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+    return {row_id: 'Write was not processed after retries. Please resubmit this row.' for row_id, _ in pending}
+
+def write_partition_transactions(transactions):
+    """
+    Write one partition's transactions one after another; they all update the same
+    aggregate items, so run together they would cancel each other with TransactionConflict.
+    Returns {row_id: error_message} for rows that could not be written.
+    """
+    errors = {}
+    for rows in transactions:
+        errors.update(write_procedure_transaction(rows))
+    return errors
+
+def bulk_lambda_handler(event, context):
+    """
+    Bulk ingest handler for POST /add-doctor-procedure/bulk.
+    Accepts a JSON array or NDJSON body and reports a result for every row.
+    """
+    start_request(context)
+    start_spans()
+    try:
+        try:
+            rows = parse_bulk_body(event)
+        except ValueError as e:
+            return respond(event, False, 400, {'message': str(e)}, 'add_doctor_procedure_bulk')
+
+        if not isinstance(rows, list) or not rows:
+            error_message = 'Request body must be a non-empty JSON array or NDJSON of procedures.'
+        elif len(rows) > BULK_MAX_ROWS:
+            error_message = f'Too many procedures in one request ({len(rows)}). The maximum is {BULK_MAX_ROWS}.'
         else:
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'message': success_message,
-                    'doctorName': doctor_name,
-                    'procedureCode': procedure_code,
-                    'procedureName': procedure_name,
-                    'cost': float(cost),
-                    'timeLogged': logged_time,
-                    'matchConfidence': confidence
-                })
+            error_message = None
+        if error_message:
+            return respond(event, False, 400, {'message': error_message}, 'add_doctor_procedure_bulk')
+
+        log.info('Bulk ingest received', rows=len(rows))
+
+        # Validate and normalize every row before touching DynamoDB
+        results = [None] * len(rows)
+        valid_rows = []
+        for row_index, row in enumerate(rows):
+            fields, row_error = validate_procedure_fields(row)
+            if row_error:
+                results[row_index] = {'row': row_index, 'status': 'failed', 'message': row_error}
+            else:
+                valid_rows.append((row_index, fields))
+
+        # Rows whose idempotency key an earlier request already used are reported, not written again
+        idempotency_keys = {fields['idempotencyKey'] for _, fields in valid_rows if fields['idempotencyKey']}
+        with span('idempotencyLookup'):
+            claimed = claimed_procedures(idempotency_keys) if idempotency_keys else {}
+        replayed_keys = set()
+        new_rows = []
+        for row_index, fields in valid_rows:
+            record = claimed.get(fields['idempotencyKey'])
+            if not record:
+                new_rows.append((row_index, fields))
+            elif fields['idempotencyKey'] in replayed_keys:
+                results[row_index] = {
+                    'row': row_index,
+                    'status': 'failed',
+                    'message': 'Duplicate idempotencyKey; this procedure is already an earlier row of the request.'
+                }
+            else:
+                replayed_keys.add(fields['idempotencyKey'])
+                results[row_index] = {
+                    'row': row_index,
+                    'status': 'written',
+                    'doctorName': doctor_name_from_partition_key(record['doctor_partition']),
+                    'procedureCode': fields['procedureCode'],
+                    'timeLogged': record['time_logged'],
+                    'procedureTime': record['procedure_time'],
+                    'replayed': True
+                }
+        valid_rows = new_rows
+
+        # Resolve all doctor names in one pass
+        with span('nameResolution'):
+            resolved_names = resolve_doctor_names([fields['doctorName'] for _, fields in valid_rows]) if valid_rows else {}
+
+        items_to_write = []
+        seen_keys = {}
+        for row_index, fields in valid_rows:
+            doctor_name, confidence, suggestion = resolved_names[fields['doctorName']]
+            if not doctor_name:
+                results[row_index] = {
+                    'row': row_index,
+                    'status': 'failed',
+                    'message': f'Did you mean "{suggestion}"? The name "{fields["doctorName"]}" was not found exactly.',
+                    'suggestion': suggestion,
+                    'confidence': confidence
+                }
+                continue
+
+            # Unique sort keys mean rows logged at the same time are kept as separate procedures
+            sort_key = make_sort_key(fields['timeLogged'], fields['idempotencyKey'])
+            item = {
+                'DoctorName': write_partition_key(doctor_name, sort_key),
+                'ProcedureTime': sort_key,
+                'procedure_code': fields['procedureCode'],
+                'procedure_name': fields['procedureName'],
+                'cost': fields['cost'],
+                'time_logged': fields['timeLogged']
             }
+            if fields['idempotencyKey']:
+                item['idempotency_key'] = fields['idempotencyKey']
 
-    except Exception as e:
-        print(f"Error in addDoctorProcedureLambda: {e}")
-        error_message = f'Internal server error: {str(e)}'
-        
-        if 'is_bedrock_agent' in locals() and is_bedrock_agent:
-            return {
-                'messageVersion': '1.0',
-                'response': {
-                    'actionGroup': event.get('actionGroup', 'AddDoctorProcedureGroup'),
-                    'apiPath': event.get('apiPath', '/addDoctorProcedure'),
-                    'httpMethod': event.get('httpMethod', 'POST'),
-                    'httpStatusCode': 500,
-                    'responseBody': {
-                        'application/json': {
-                            'body': json.dumps({'message': error_message})
-                        }
-                    }
+            # Rows sharing an idempotency key are one procedure, whatever their times
+            key = fields['idempotencyKey'] or (item['DoctorName'], item['ProcedureTime'])
+            if key in seen_keys:
+                results[row_index] = {
+                    'row': row_index,
+                    'status': 'failed',
+                    'message': f'Duplicate idempotencyKey; this procedure is already row {seen_keys[key]} of the request.'
                 }
+                continue
+            seen_keys[key] = row_index
+            items_to_write.append((row_index, item))
+            results[row_index] = {
+                'row': row_index,
+                'status': 'written',
+                'doctorName': doctor_name,
+                'procedureCode': fields['procedureCode'],
+                'timeLogged': fields['timeLogged'],
+                'procedureTime': item['ProcedureTime'],
+                'matchConfidence': confidence
             }
+
+        # Write doctor partitions in parallel, each as a run of transactions of up to ~95 rows
+        partitions = plan_transactions(items_to_write)
+        if partitions:
+            with span('procedureWrite'), ThreadPoolExecutor(max_workers=min(BULK_WRITE_CONCURRENCY, len(partitions))) as executor:
+                for chunk_errors in executor.map(write_partition_transactions, partitions):
+                    for row_index, row_error in chunk_errors.items():
+                        results[row_index] = {'row': row_index, 'status': 'failed', 'message': row_error}
+
+        written = sum(1 for result in results if result['status'] == 'written')
+        failed = len(results) - written
+        log.info('Bulk ingest finished', written=written, failed=failed)
+
+        return respond(event, False, 200 if failed == 0 else 207, {
+            'message': f'Added {written} of {len(results)} procedures.',
+            'total': len(results),
+            'written': written,
+            'failed': failed,
+            'results': results
+        }, 'add_doctor_procedure_bulk')
+
+    except Exception as e:
+        log.error('Bulk addDoctorProcedure failed', error=str(e))
+        return respond(event, False, 500, {'message': f'Internal server error: {str(e)}'}, 'add_doctor_procedure_bulk')
+
+
+def queue_lambda_handler(event, context):
+    """
+    Queue consumer for async procedure adds (SQS event source, or a drained local queue).
+    Resolves doctor names once per batch and writes one transaction per doctor partition.
+    Messages that can never succeed are dead-lettered; transient write failures are
+    returned as batchItemFailures so only those messages are redelivered.
+    """
+    start_request(context)
+    start_spans()
+    records = event.get('Records', [])
+    log.info('Queue consumer received', messages=len(records))
+
+    failed_message_ids = []
+
+    def park(message_id, message, reason):
+        log.warning('Dead-lettering message', messageId=message_id, reason=reason)
+        if not dead_letter_procedure(message, reason):
+            failed_message_ids.append(message_id)
+
+    valid_messages = []
+    for record in records:
+        message_id = record['messageId']
+        try:
+            message = json.loads(record['body'])
+        except ValueError:
+            park(message_id, {'body': record['body']}, 'Message body is not valid JSON.')
+            continue
+
+        fields, error_message = validate_procedure_fields(message)
+        if error_message:
+            park(message_id, message, error_message)
         else:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': error_message})
-            }
\ No newline at end of file
+            valid_messages.append((message_id, message, fields))
+
+    with span('nameResolution'):
+        resolved_names = resolve_doctor_names([fields['doctorName'] for _, _, fields in valid_messages]) if valid_messages else {}
+
+    items_to_write = []
+    seen_keys = set()
+    for message_id, message, fields in valid_messages:
+        doctor_name, confidence, suggestion = resolved_names[fields['doctorName']]
+        if not doctor_name:
+            park(message_id, message, f'Doctor name "{fields["doctorName"]}" needs confirmation. Did you mean "{suggestion}"?')
+            continue
+
+        sort_key = message.get('procedureTime') or make_sort_key(fields['timeLogged'])
+        item = {
+            'DoctorName': write_partition_key(doctor_name, sort_key),
+            'ProcedureTime': sort_key,
+            'procedure_code': fields['procedureCode'],
+            'procedure_name': fields['procedureName'],
+            'cost': fields['cost'],
+            'time_logged': fields['timeLogged']
+        }
+        if fields['idempotencyKey']:
+            item['idempotency_key'] = fields['idempotencyKey']
+
+        # SQS delivers at least once; a redelivered copy in the same batch is the same row,
+        # and so is a retried request queued again under the same idempotency key
+        key = fields['idempotencyKey'] or (item['DoctorName'], item['ProcedureTime'])
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        items_to_write.append((message_id, item))
+
+    write_failures = 0
+    partitions = plan_transactions(items_to_write)
+    if partitions:
+        with span('procedureWrite'), ThreadPoolExecutor(max_workers=min(BULK_WRITE_CONCURRENCY, len(partitions))) as executor:
+            for chunk_errors in executor.map(write_partition_transactions, partitions):
+                write_failures += len(chunk_errors)
+                failed_message_ids.extend(chunk_errors)
+
+    log.info('Queue consumer finished', written=len(items_to_write) - write_failures, retrying=len(failed_message_ids))
+    emit_spans('add_doctor_procedure_queue', messages=len(records), retrying=len(failed_message_ids))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
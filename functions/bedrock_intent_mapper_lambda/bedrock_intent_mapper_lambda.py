@@ -1,30 +1,74 @@
 import json
-import boto3
 import os
 import time
 import re
-from botocore.exceptions import ClientError
-
-# Configure boto3 with retry configuration
-bedrock_agent_runtime = boto3.client(
-    service_name='bedrock-agent-runtime',
-    region_name=os.environ.get('AWS_REGION', 'us-east-1'),
-    config=boto3.session.Config(
-        retries={
-            'max_attempts': 3,
-            'mode': 'adaptive'
-        }
-    )
-)
+import math
+import threading
+import queue
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from botocore.exceptions import ClientError, ReadTimeoutError, ConnectTimeoutError
+from startup import lazy, lazy_import
+import aws_clients
+from entity_matcher import build_automaton, find_matches
+from procedure_aggregates import STATS_TABLE_NAME, PROFILE_SORT_KEY, STATS_SORT_KEY_PREFIX, ALL_PROCEDURES, aggregate_partition_key, stats_sort_key
+from doctor_shards import read_partition_keys
+from response_cache import ResponseCache
+from session_store import new_session, update_session, InMemorySessionStore, DynamoDBSessionStore
+from retry_budget import TokenBucket, DynamoDBTokenBucket, request_deadline, remaining_seconds, backoff_delay
+from circuit_breaker import CircuitBreaker, OPEN, CLOSED
+from single_flight import SingleFlight, lease_flight
+from structured_log import get_logger, start_request
+from stage_metrics import start_spans, span, timed_call, emit_spans, detached
+
+log = get_logger('intent_mapper')
+
+# Fan-out: quote/history requests naming several doctors run one direct lookup per doctor, in parallel
+FAN_OUT_ENABLED = os.environ.get('FAN_OUT_ENABLED', 'true').lower() == 'true'
+FAN_OUT_MAX_DOCTORS = int(os.environ.get('FAN_OUT_MAX_DOCTORS', '5'))
+
+# Batch mapping (offline evaluation and replay): item limit and worker pool size
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))
+
+# Clients and tables are built on first use unless STARTUP_MODE=eager (see startup.py),
+# so requests rejected up front never load boto3. aws_clients sets their timeouts, and
+# their connection pools are sized for batch mapping's workers running at once
+conditions = lazy_import('boto3.dynamodb.conditions')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+# One attempt: invoke_bedrock_agent retries itself, within the invocation's time budget
+bedrock_agent_runtime = lazy(lambda: aws_clients.client('bedrock-agent-runtime', AWS_REGION, max_pool_connections=BATCH_MAX_WORKERS))
+
+# Direct function invocation; each batch worker can fan out to FAN_OUT_MAX_DOCTORS lookups
+lambda_client = lazy(lambda: aws_clients.client('lambda', AWS_REGION, max_pool_connections=BATCH_MAX_WORKERS * FAN_OUT_MAX_DOCTORS))
+
+# Doctor registry (see procedure_aggregates), source of the live doctor and procedure catalog
+dynamodb = lazy(lambda: aws_clients.resource('dynamodb', AWS_REGION, max_pool_connections=BATCH_MAX_WORKERS))
+stats_table = lazy(lambda: dynamodb.Table(STATS_TABLE_NAME))
 
-# Configure Lambda client for direct function invocation
-lambda_client = boto3.client('lambda', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+# Conversation sessions: 'dynamodb', 'memory' (per container, for local runs) or 'none'
+SESSION_STORE = os.environ.get('SESSION_STORE', 'dynamodb').lower()
+SESSIONS_TABLE_NAME = os.environ.get('DYNAMODB_SESSIONS_TABLE_NAME', 'ConversationSessions')
+if SESSION_STORE == 'dynamodb':
+    session_store = DynamoDBSessionStore(lazy(lambda: dynamodb.Table(SESSIONS_TABLE_NAME)))
+elif SESSION_STORE == 'memory':
+    session_store = InMemorySessionStore()
+else:
+    session_store = None
 
 # Get agent details from environment variables
 AGENT_ID = os.environ.get('BEDROCK_AGENT_ID')
 AGENT_ALIAS_ID = os.environ.get('BEDROCK_AGENT_ALIAS_ID')
 
-# Common doctor names for enhanced matching
+# Functions used for direct quote/history lookups (fast path, fallback and hedging)
+DIRECT_FUNCTION_NAMES = {
+    'getQuote': os.environ.get('GET_QUOTE_FUNCTION_NAME'),
+    'showHistory': os.environ.get('SHOW_HISTORY_FUNCTION_NAME')
+}
+
+# Seed catalog, used until the doctor registry can be read (or while it is empty)
 COMMON_DOCTORS = [
     "Sarah Johnson", "Robert Brown", "Michael Smith", "Emily Davis", 
     "David Wilson", "Lisa Anderson", "John Thompson", "Maria Garcia", 
@@ -37,17 +81,209 @@ PROCEDURE_CODES = [
     "PHYS001", "CARD001", "DERM001", "ORTH001", "NEUR001"
 ]
 
-def extract_parameters_from_text(text, conversation_history=None):
+# Intent trigger phrases, checked in this order
+INTENT_PHRASES = {
+    'showHistory': ['show history', 'history for', 'procedures for', 'show procedures', 'her history', 'his history', 'their history'],
+    'getQuote': ['get quote', 'cost for', 'quote for', 'price for', 'cost of', 'costs'],
+    'addProcedure': ['add procedure', 'new procedure', 'create procedure']
+}
+
+# Follow-up phrases that inherit the previous intent
+CONTEXT_INTENT_PHRASES = ['what about', 'how about', 'and', 'also']
+
+# References resolved from conversation history
+DOCTOR_REFERENCES = ['her', 'his', 'their', 'that doctor', 'this doctor', 'the doctor', 'same doctor']
+PROCEDURE_REFERENCES = ['that procedure', 'this procedure', 'the procedure', 'same procedure']
+
+# Comparisons of several doctors, e.g. "compare Sarah Johnson and Robert Brown for ENDO001"
+COMPARISON_PHRASES = ['compare', 'comparison', 'versus', 'vs', 'difference between']
+
+# Codes outside the catalog, e.g. "ENDO001"
+PROCEDURE_CODE_PATTERN = re.compile(r'\b([A-Z]{3,4}\d{3})\b')
+
+ENTITY_CATALOG_TTL_SECONDS = int(os.environ.get('ENTITY_CATALOG_TTL_SECONDS', '300'))
+
+# Local fast path: unambiguous quote and history requests are answered without the Bedrock agent
+FAST_PATH_ENABLED = os.environ.get('FAST_PATH_ENABLED', 'true').lower() == 'true'
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get('FAST_PATH_MIN_CONFIDENCE', '0.8'))
+FAST_PATH_INTENTS = ['getQuote', 'showHistory']
+
+# How much each way of finding a parameter can be trusted without the agent
+MATCH_CONFIDENCE = {
+    'intent': {'phrase': 1.0, 'comparison': 0.9, 'context': 0.6},
+    'doctorName': {'fullName': 1.0, 'lastName': 0.85, 'firstName': 0.8, 'context': 0.7},
+    'procedureCode': {None: 1.0, 'catalog': 1.0, 'pattern': 0.9, 'context': 0.8}
+}
+AMBIGUITY_PENALTY = 0.5
+
+# Bedrock agent calls: per-container rate limit and jittered, deadline-aware retries
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3'))
+BEDROCK_RATE_PER_SECOND = float(os.environ.get('BEDROCK_RATE_PER_SECOND', '0.5'))
+BEDROCK_BURST = float(os.environ.get('BEDROCK_BURST', '3'))
+BEDROCK_BACKOFF_BASE_MS = int(os.environ.get('BEDROCK_BACKOFF_BASE_MS', '500'))
+BEDROCK_BACKOFF_CAP_MS = int(os.environ.get('BEDROCK_BACKOFF_CAP_MS', '4000'))
+BEDROCK_MIN_ATTEMPT_MS = int(os.environ.get('BEDROCK_MIN_ATTEMPT_MS', '3000'))  # Don't start an attempt with less time left
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', '2000'))  # Kept back for the direct fallback
+THROTTLING_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException']
+# Count against the circuit breaker like throttling, but are not retried; so does any HTTP 5xx
+SERVER_ERROR_CODES = ['InternalServerException', 'DependencyFailedException', 'BadGatewayException', 'ServiceUnavailableException']
+
+bedrock_rate_limiter = TokenBucket(BEDROCK_RATE_PER_SECOND, BEDROCK_BURST)
+
+# Stop calling the agent after repeated throttling/timeouts; probe again after the reset timeout
+BEDROCK_BREAKER_FAILURES = int(os.environ.get('BEDROCK_BREAKER_FAILURES', '5'))
+BEDROCK_BREAKER_RESET_SECONDS = float(os.environ.get('BEDROCK_BREAKER_RESET_SECONDS', '30'))
+BEDROCK_BREAKER_PROBES = int(os.environ.get('BEDROCK_BREAKER_PROBES', '1'))
+
+bedrock_breaker = CircuitBreaker(BEDROCK_BREAKER_FAILURES, BEDROCK_BREAKER_RESET_SECONDS, BEDROCK_BREAKER_PROBES)
+
+# Answers to quote/history requests, reused until the doctor's data changes or the TTL passes
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '300'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+
+# Prefetch: once a doctor is resolved, cache the answers to likely follow-ups in the background
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_MAX_PROCEDURES = int(os.environ.get('PREFETCH_MAX_PROCEDURES', '3'))
+
+prefetch_executor = ThreadPoolExecutor(max_workers=2)
+_prefetching = set()
+_prefetching_lock = threading.Lock()
+
+# Coalescing: identical concurrent requests share one answer, within a container and
+# optionally across containers through a lease item in the coordination table
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'true').lower() == 'true'
+COALESCE_LEASE_ENABLED = os.environ.get('COALESCE_LEASE_ENABLED', 'false').lower() == 'true'
+COALESCE_LEASE_SECONDS = int(os.environ.get('COALESCE_LEASE_SECONDS', '30'))
+COALESCE_WAIT_MS = int(os.environ.get('COALESCE_WAIT_MS', '10000'))
+COORDINATION_TABLE_NAME = os.environ.get('DYNAMODB_COORDINATION_TABLE_NAME', 'IntentCoordination')
+
+coordination_table = lazy(lambda: dynamodb.Table(COORDINATION_TABLE_NAME))
+request_flights = SingleFlight()
+
+# Fleet-wide limit on agent calls, shared by every container through the coordination table
+BEDROCK_FLEET_LIMIT_ENABLED = os.environ.get('BEDROCK_FLEET_LIMIT_ENABLED', 'false').lower() == 'true'
+BEDROCK_FLEET_RATE_PER_SECOND = float(os.environ.get('BEDROCK_FLEET_RATE_PER_SECOND', '2'))
+BEDROCK_FLEET_BURST = float(os.environ.get('BEDROCK_FLEET_BURST', '10'))
+FLEET_LIMIT_KEY = 'LIMIT#bedrock-agent'
+
+bedrock_fleet_limiter = DynamoDBTokenBucket(coordination_table, FLEET_LIMIT_KEY, BEDROCK_FLEET_RATE_PER_SECOND, BEDROCK_FLEET_BURST)
+
+# Hedging: once the agent has taken HEDGE_DELAY_MS, race it against a direct lookup
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'false').lower() == 'true'
+HEDGE_DELAY_MS = int(os.environ.get('HEDGE_DELAY_MS', '2500'))
+
+# Agent replies that mean it could not map the request
+POOR_RESPONSE_INDICATORS = [
+    "please specify which doctor", "please provide the doctor's name",
+    "i don't understand", "i'm not sure", "could you clarify",
+    "i found that you want to get a quote, but i need",
+    "try: 'get quote for [doctor name]'",
+    "available doctors include:",
+    "but i need both a doctor name"
+]
+
+_entity_catalog = {'doctors': COMMON_DOCTORS, 'codes': PROCEDURE_CODES, 'automaton': None, 'loadedAt': 0}
+_entity_catalog_lock = threading.Lock()
+
+def load_entity_catalog():
+    """
+    Read every doctor name and procedure code from the doctor registry.
+    Returns (doctors, codes), both sorted.
+    """
+    doctors = set()
+    codes = set()
+    scan_kwargs = {
+        'FilterExpression': conditions.Attr('SK').eq(PROFILE_SORT_KEY),
+        'ProjectionExpression': 'doctor_name, procedure_codes'
+    }
+    while True:
+        response = stats_table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            doctors.add(item['doctor_name'])
+            codes.update(item.get('procedure_codes', []))
+        if 'LastEvaluatedKey' not in response:
+            return sorted(doctors), sorted(codes)
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def build_entity_automaton(doctors, codes):
+    """
+    Compile doctor names (full, first and last), procedure codes and every intent
+    and reference phrase into one automaton. Payloads are (kind, value) pairs.
+    """
+    patterns = {}
+
+    def add(pattern, kind, value=None):
+        patterns.setdefault(pattern.lower(), []).append((kind, value))
+
+    for intent, phrases in INTENT_PHRASES.items():
+        for phrase in phrases:
+            add(phrase, 'intent', intent)
+    for phrase in CONTEXT_INTENT_PHRASES:
+        add(phrase, 'followUp')
+    for phrase in DOCTOR_REFERENCES:
+        add(phrase, 'doctorReference')
+    for phrase in PROCEDURE_REFERENCES:
+        add(phrase, 'procedureReference')
+    for phrase in COMPARISON_PHRASES:
+        add(phrase, 'comparison')
+    for doctor in doctors:
+        names = doctor.split()
+        add(doctor, 'fullName', doctor)
+        add(names[0], 'firstName', doctor)
+        if len(names) > 1:
+            add(names[-1], 'lastName', doctor)
+    for code in codes:
+        add(code, 'code', code)
+    return build_automaton(patterns)
+
+def get_entity_catalog():
+    """
+    The current catalog and its automaton, reloaded from the doctor registry every
+    ENTITY_CATALOG_TTL_SECONDS. Keeps the previous catalog if the registry can't be read.
+    """
+    with _entity_catalog_lock:
+        if _entity_catalog['automaton'] is None or time.time() - _entity_catalog['loadedAt'] >= ENTITY_CATALOG_TTL_SECONDS:
+            try:
+                doctors, codes = load_entity_catalog()
+                if doctors:
+                    _entity_catalog['doctors'] = doctors
+                    _entity_catalog['codes'] = sorted(set(codes) | set(PROCEDURE_CODES))
+                log.info('Entity catalog loaded', doctors=len(doctors), procedureCodes=len(codes))
+            except Exception as e:
+                log.warning('Could not load entity catalog', knownDoctors=len(_entity_catalog['doctors']), error=str(e))
+            _entity_catalog['automaton'] = build_entity_automaton(_entity_catalog['doctors'], _entity_catalog['codes'])
+            _entity_catalog['loadedAt'] = time.time()
+        return _entity_catalog
+
+def scan_entities(automaton, text):
+    """
+    One pass over `text`, grouping matched values by kind in order of appearance.
+    """
+    found = {}
+    for _, _, payloads in find_matches(automaton, text.lower()):
+        for kind, value in payloads:
+            found.setdefault(kind, {})[value] = None
+    return {kind: list(values) for kind, values in found.items()}
+
+def extract_parameters_from_text(text, conversation_history=None, session=None):
     """
     Enhanced parameter extraction from natural language text with conversation context.
+    Context comes from the server-side session when it has one, otherwise from the
+    conversation history sent with the request.
     Returns dict with extracted parameters for better Bedrock Agent results.
     """
-    text_lower = text.lower()
+    automaton = get_entity_catalog()['automaton']
     extracted = {
         'intent': None,
         'doctorName': None,
+        'doctorNames': [],
         'procedureCode': None,
-        'enhanced_prompt': text
+        'enhanced_prompt': text,
+        'matchSources': {},
+        'mentions': {'intents': 0, 'doctors': 0}
     }
     
     # Extract context from conversation history
@@ -55,7 +291,12 @@ def extract_parameters_from_text(text, conversation_history=None):
     context_procedures = []
     last_intent = None
     
-    if conversation_history:
+    if session and session['turns']:
+        # Already resolved on earlier turns, most recent first
+        context_doctors = session['doctors']
+        context_procedures = session['procedures']
+        last_intent = session['lastIntent']
+    elif conversation_history:
         for msg in conversation_history[-6:]:  # Look at last 6 messages
             if msg.get('extractedParams'):
                 params = msg['extractedParams']
@@ -67,85 +308,68 @@ def extract_parameters_from_text(text, conversation_history=None):
                     last_intent = params['intent']
             
             # Also scan message content for doctor names and procedure codes
-            content = msg.get('content', '').lower()
-            for doctor in COMMON_DOCTORS:
-                if doctor.lower() in content:
-                    context_doctors.append(doctor)
-            
-            for code in PROCEDURE_CODES:
-                if code.lower() in content:
-                    context_procedures.append(code)
+            content_entities = scan_entities(automaton, msg.get('content', ''))
+            context_doctors.extend(content_entities.get('fullName', []))
+            context_procedures.extend(content_entities.get('code', []))
     
-    # Remove duplicates while preserving order (most recent first)
-    context_doctors = list(dict.fromkeys(reversed(context_doctors)))
-    context_procedures = list(dict.fromkeys(reversed(context_procedures)))
+        # Remove duplicates while preserving order (most recent first)
+        context_doctors = list(dict.fromkeys(reversed(context_doctors)))
+        context_procedures = list(dict.fromkeys(reversed(context_procedures)))
+
+    entities = scan_entities(automaton, text)
     
-    # Intent detection with context awareness
-    if any(phrase in text_lower for phrase in ['show history', 'history for', 'procedures for', 'show procedures']):
-        extracted['intent'] = 'showHistory'
-    elif any(phrase in text_lower for phrase in ['get quote', 'cost for', 'quote for', 'price for', 'cost of', 'costs']):
-        extracted['intent'] = 'getQuote'
-    elif any(phrase in text_lower for phrase in ['add procedure', 'new procedure', 'create procedure']):
-        extracted['intent'] = 'addProcedure'
-    elif any(phrase in text_lower for phrase in ['what about', 'how about', 'and', 'also']) and last_intent:
+    # Intent detection with context awareness; phrase intents take priority in INTENT_PHRASES order
+    intents = [intent for intent in INTENT_PHRASES if intent in entities.get('intent', [])]
+    extracted['mentions']['intents'] = len(intents)
+    if intents:
+        extracted['intent'] = intents[0]
+        extracted['matchSources']['intent'] = 'phrase'
+    elif entities.get('followUp') and last_intent:
         # Context-dependent queries inherit the last intent
         extracted['intent'] = last_intent
+        extracted['matchSources']['intent'] = 'context'
     
-    # Pronoun and reference resolution
-    pronouns_references = ['her', 'his', 'their', 'that doctor', 'this doctor', 'the doctor', 'same doctor']
-    has_pronoun = any(pronoun in text_lower for pronoun in pronouns_references)
-    
-    # Doctor name extraction - improved fuzzy matching with context resolution
-    for doctor in COMMON_DOCTORS:
-        # Full name match
-        if doctor.lower() in text_lower:
-            extracted['doctorName'] = doctor
-            break
-        
-        # First name only
-        first_name = doctor.split()[0].lower()
-        if f" {first_name}" in f" {text_lower}" or text_lower.startswith(first_name):
-            extracted['doctorName'] = doctor
-            break
-            
-        # Last name only
-        last_name = doctor.split()[-1].lower()
-        if last_name in text_lower:
-            extracted['doctorName'] = doctor
+    # Doctor name: full name, then first name, then last name, then a reference to the previous doctor
+    for source in ('fullName', 'firstName', 'lastName'):
+        if entities.get(source):
+            extracted['doctorName'] = entities[source][0]
+            extracted['matchSources']['doctorName'] = source
             break
-    
-    # If no explicit doctor found but we have pronouns/references, use context
-    if not extracted['doctorName'] and has_pronoun and context_doctors:
+    if not extracted['doctorName'] and entities.get('doctorReference') and context_doctors:
         extracted['doctorName'] = context_doctors[0]  # Most recent doctor
+        extracted['matchSources']['doctorName'] = 'context'
+    # Every doctor mentioned, full names first, for requests about several doctors
+    extracted['doctorNames'] = list(dict.fromkeys(
+        entities.get('fullName', []) + entities.get('lastName', []) + entities.get('firstName', [])
+    ))
+    extracted['mentions']['doctors'] = len(extracted['doctorNames'])
+
+    # "Compare X and Y" without an intent phrase asks for their quotes
+    if not extracted['intent'] and entities.get('comparison') and len(extracted['doctorNames']) > 1:
+        extracted['intent'] = 'getQuote'
+        extracted['matchSources']['intent'] = 'comparison'
     
-    # If no exact match, try partial matching
-    if not extracted['doctorName']:
-        for doctor in COMMON_DOCTORS:
-            doctor_words = doctor.lower().split()
-            if any(word in text_lower for word in doctor_words if len(word) > 2):
-                extracted['doctorName'] = doctor
-                break
-    
-    # Procedure code extraction
-    for code in PROCEDURE_CODES:
-        if code.lower() in text_lower:
-            extracted['procedureCode'] = code
-            break
-    
-    # Pattern matching for codes like "ENDO001" or "endo001"
-    code_pattern = r'\b([A-Z]{3,4}\d{3})\b'
-    code_match = re.search(code_pattern, text.upper())
-    if code_match and not extracted['procedureCode']:
-        extracted['procedureCode'] = code_match.group(1)
-    
-    # Context-based procedure code resolution
-    procedure_references = ['that procedure', 'this procedure', 'the procedure', 'same procedure']
-    has_procedure_reference = any(ref in text_lower for ref in procedure_references)
-    if not extracted['procedureCode'] and has_procedure_reference and context_procedures:
-        extracted['procedureCode'] = context_procedures[0]  # Most recent procedure
+    # Procedure code: catalog match, then any code-shaped token, then a reference to the previous code
+    if entities.get('code'):
+        extracted['procedureCode'] = entities['code'][0]
+        extracted['matchSources']['procedureCode'] = 'catalog'
+    else:
+        code_match = PROCEDURE_CODE_PATTERN.search(text.upper())
+        if code_match:
+            extracted['procedureCode'] = code_match.group(1)
+            extracted['matchSources']['procedureCode'] = 'pattern'
+        elif entities.get('procedureReference') and context_procedures:
+            extracted['procedureCode'] = context_procedures[0]  # Most recent procedure
+            extracted['matchSources']['procedureCode'] = 'context'
     
     # Enhanced prompt generation with context resolution
-    if extracted['intent'] == 'getQuote' and extracted['doctorName']:
+    if extracted['intent'] == 'getQuote' and len(extracted['doctorNames']) > 1:
+        doctors = ', '.join(extracted['doctorNames'])
+        if extracted['procedureCode']:
+            extracted['enhanced_prompt'] = f"Compare cost quotes for doctors {doctors} for procedure {extracted['procedureCode']}"
+        else:
+            extracted['enhanced_prompt'] = f"Compare overall cost quotes for doctors {doctors} for all procedures"
+    elif extracted['intent'] == 'getQuote' and extracted['doctorName']:
         if extracted['procedureCode']:
             extracted['enhanced_prompt'] = f"Get a cost quote for doctor {extracted['doctorName']} for procedure {extracted['procedureCode']}"
         else:
@@ -157,15 +381,385 @@ def extract_parameters_from_text(text, conversation_history=None):
     
     return extracted
 
+def load_session(session_id):
+    """The stored session, or None if there is none (or no store, or it can't be read)"""
+    if not session_store:
+        return None
+    try:
+        return session_store.load(session_id)
+    except Exception as e:
+        log.warning('Could not load session', sessionId=session_id, error=str(e))
+        return None
+
+def save_session(session_id, session, user_text, extracted, response):
+    """Fold this turn into the session and store it"""
+    if not session_store:
+        return
+    try:
+        session_store.save(session_id, update_session(session or new_session(), user_text, extracted, response))
+    except Exception as e:
+        log.warning('Could not save session', sessionId=session_id, error=str(e))
+
+def score_local_route(extracted):
+    """
+    Confidence (0-1) that a request can be answered directly, without the Bedrock agent.
+    Only quote and history requests with a doctor qualify. Context-resolved or partial
+    parameters lower the score, and mentioning several intents or doctors halves it.
+    """
+    if extracted['intent'] not in FAST_PATH_INTENTS or not extracted['doctorName']:
+        return 0.0
+
+    sources = extracted.get('matchSources', {})
+    confidence = 1.0
+    for param, weights in MATCH_CONFIDENCE.items():
+        confidence *= weights.get(sources.get(param), 0.0)
+
+    mentions = extracted.get('mentions', {})
+    if mentions.get('intents', 0) > 1:
+        confidence *= AMBIGUITY_PENALTY
+    if mentions.get('doctors', 0) > 1:
+        confidence *= AMBIGUITY_PENALTY
+    return round(confidence, 3)
+
+def pause(seconds, cancelled=None):
+    """Sleep, waking early if `cancelled` is set"""
+    if cancelled:
+        cancelled.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+def acquire_bedrock_token(deadline, cancelled=None):
+    """
+    Wait for the container's rate limiter, but only while an agent call would still
+    fit before `deadline`. Returns False when the caller should give up on the agent.
+    """
+    min_attempt = BEDROCK_MIN_ATTEMPT_MS / 1000
+    while True:
+        wait_seconds = bedrock_rate_limiter.try_acquire()
+        if not wait_seconds:
+            return remaining_seconds(deadline) >= min_attempt
+        if remaining_seconds(deadline) - wait_seconds < min_attempt or (cancelled and cancelled.is_set()):
+            return False
+        pause(wait_seconds, cancelled)
+
+def fleet_retry_after():
+    """
+    Take a token from the fleet-wide agent call limit. Returns 0 when the call may go
+    ahead, otherwise the seconds until the fleet has capacity again. If the coordination
+    table can't be reached, calls are only limited per container.
+    """
+    if not BEDROCK_FLEET_LIMIT_ENABLED:
+        return 0
+    try:
+        return bedrock_fleet_limiter.try_acquire()
+    except ClientError as e:
+        log.warning('Fleet rate limit unavailable, limiting per container only', error=str(e))
+        return 0
+
+def normalized_request_key(extracted):
+    """
+    (intent, doctorName, procedureCode) for a single quote or history request, or None
+    when the answer can't be reused (other intents, no doctor, several intents or doctors).
+    """
+    if extracted['intent'] not in FAST_PATH_INTENTS or not extracted['doctorName']:
+        return None
+    mentions = extracted.get('mentions', {})
+    if mentions.get('intents', 0) > 1 or mentions.get('doctors', 0) > 1:
+        return None
+    return (extracted['intent'], extracted['doctorName'], extracted['procedureCode'])
+
+def response_cache_key(extracted):
+    """The normalized request key, or None when the response cache is off"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return normalized_request_key(extracted)
+
+def doctor_data_version(doctor_name):
+    """
+    Fingerprint of a doctor's procedures: the count and total cost across every shard's
+    all-procedures aggregate. Every procedure written through the add functions changes it.
+    None (don't cache) if it can't be read or the doctor has no aggregates, e.g. rows
+    loaded by populate_dynamodb.py before rebuild_aggregates.py has run.
+    """
+    keys = [
+        {'PK': aggregate_partition_key(partition_key), 'SK': stats_sort_key(ALL_PROCEDURES)}
+        for partition_key in read_partition_keys(doctor_name)
+    ]
+    try:
+        response = timed_call('dynamodbBatchGet', dynamodb.batch_get_item, RequestItems={
+            STATS_TABLE_NAME: {'Keys': keys, 'ProjectionExpression': 'procedure_count, total_cost'}
+        })
+    except ClientError as e:
+        log.warning('Could not read data version, not caching', doctor=doctor_name, error=str(e))
+        return None
+    if response.get('UnprocessedKeys'):
+        return None
+    items = response['Responses'].get(STATS_TABLE_NAME, [])
+    if not items:
+        return None
+    count = sum(item.get('procedure_count', 0) for item in items)
+    total_cost = sum(item.get('total_cost', 0) for item in items)
+    return f"{count}:{total_cost}"
+
+def doctor_top_procedures(doctor_name, limit):
+    """A doctor's most frequent procedure codes, from the per-procedure aggregates of every shard"""
+    counts = Counter()
+    for partition_key in read_partition_keys(doctor_name):
+        query_kwargs = {
+            'KeyConditionExpression': conditions.Key('PK').eq(aggregate_partition_key(partition_key)) & conditions.Key('SK').begins_with(STATS_SORT_KEY_PREFIX),
+            'ProjectionExpression': 'SK, procedure_count'
+        }
+        while True:
+            response = timed_call('dynamodbQuery', stats_table.query, **query_kwargs)
+            for item in response.get('Items', []):
+                code = item['SK'][len(STATS_SORT_KEY_PREFIX):]
+                if code != ALL_PROCEDURES:
+                    counts[code] += item.get('procedure_count', 0)
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return [code for code, _ in counts.most_common(limit)]
+
+def follow_up_keys(extracted):
+    """
+    Cache keys of the requests likely to follow this one: the doctor's history, their
+    overall quote and quotes for their most frequent procedures. The request's own key is left out.
+    """
+    doctor_name = extracted['doctorName']
+    keys = [('showHistory', doctor_name, None), ('getQuote', doctor_name, None)]
+    keys += [('getQuote', doctor_name, code) for code in doctor_top_procedures(doctor_name, PREFETCH_MAX_PROCEDURES)]
+    return [key for key in keys if key != normalized_request_key(extracted)]
+
+def prefetch_follow_ups(extracted, data_version=None):
+    """
+    Warm the response cache for the follow-ups to a request about one doctor, on a
+    background thread. Returns the Future, or None when there is nothing to prefetch.
+    """
+    doctor_name = extracted['doctorName']
+    if not (PREFETCH_ENABLED and RESPONSE_CACHE_ENABLED and doctor_name) or extracted['mentions']['doctors'] > 1:
+        return None
+    with _prefetching_lock:
+        if doctor_name in _prefetching:
+            return None
+        _prefetching.add(doctor_name)
+
+    def prefetch():
+        # Runs alongside the request but is not part of it, so its DynamoDB calls are kept out of the request's stages
+        with detached():
+            try:
+                version = data_version or doctor_data_version(doctor_name)
+                if version is None:
+                    return
+                keys = [key for key in follow_up_keys(extracted) if response_cache.get(key, version) is None]
+                if not keys:
+                    return
+                with ThreadPoolExecutor(max_workers=len(keys)) as executor:
+                    responses = list(executor.map(lambda key: try_direct_lambda_invocation(*key), keys))
+                for key, response in zip(keys, responses):
+                    if response:
+                        response_cache.put(key, version, response)
+                log.info('Prefetched follow-ups', doctor=doctor_name, count=sum(1 for response in responses if response))
+            except Exception as e:
+                log.warning('Prefetch failed', doctor=doctor_name, error=str(e))
+            finally:
+                with _prefetching_lock:
+                    _prefetching.discard(doctor_name)
+
+    return prefetch_executor.submit(prefetch)
+
+def coalescing_key(extracted, session_id, user_text):
+    """
+    Requests with the same key get the same answer: quote/history requests by their
+    normalized parameters, anything else by session and normalized text.
+    """
+    request_key = normalized_request_key(extracted)
+    if request_key:
+        return list(request_key)
+    return [session_id, ' '.join(user_text.lower().split())]
+
+def coalesce_request(key, compute):
+    """
+    compute() once for concurrent requests with the same key.
+    Returns (answer, coalesced) where coalesced means another request computed it.
+    """
+    if not COALESCE_ENABLED:
+        return compute(), False
+
+    def run():
+        if not COALESCE_LEASE_ENABLED:
+            return compute(), False
+        return lease_flight(
+            coordination_table, key, compute, owner=str(uuid.uuid4()),
+            lease_seconds=COALESCE_LEASE_SECONDS, wait_seconds=COALESCE_WAIT_MS / 1000
+        )
+
+    (answer, shared_across_containers), shared_in_container = request_flights.do(json.dumps(key), run)
+    if shared_in_container or shared_across_containers:
+        log.info('Coalesced with an identical request', scope='container' if shared_in_container else 'lease')
+    return answer, shared_in_container or shared_across_containers
+
+def invoke_bedrock_agent(prompt, session_id, cancelled=None, on_chunk=None, deadline=None):
+    """
+    Invoke the Bedrock agent, retrying throttling with jittered exponential backoff.
+    Calls are rate limited per container, retries also against the fleet-wide limit
+    (the caller takes the first attempt's fleet token), and no attempt or backoff is
+    started that would not finish before `deadline` (see retry_budget.request_deadline)
+    or while the circuit breaker is open; the caller then falls back straight away.
+    Setting the optional `cancelled` event stops reading the stream and skips further retries.
+    The optional `on_chunk` callback receives each piece of the completion as it arrives.
+    Returns (completion or None, number of invoke_agent calls made).
+    """
+    calls = 0
+
+    for attempt in range(BEDROCK_MAX_ATTEMPTS):
+        if cancelled and cancelled.is_set():
+            return None, calls
+        if bedrock_breaker.state == OPEN:
+            log.info('Skipping Bedrock Agent: circuit open', calls=calls)
+            return None, calls
+        if not acquire_bedrock_token(deadline, cancelled):
+            log.info('Skipping Bedrock Agent: no call fits in the remaining time', remainingSeconds=round(remaining_seconds(deadline), 1), calls=calls)
+            return None, calls
+        if attempt and fleet_retry_after():
+            log.info('Skipping Bedrock Agent retry: fleet rate limit reached', calls=calls)
+            return None, calls
+        if not bedrock_breaker.allow_request():
+            log.info('Skipping Bedrock Agent: circuit not closed', circuitState=bedrock_breaker.state, calls=calls)
+            return None, calls
+        calls += 1
+        try:
+            response = bedrock_agent_runtime.invoke_agent(
+                agentId=AGENT_ID,
+                agentAliasId=AGENT_ALIAS_ID,
+                sessionId=session_id,
+                inputText=prompt
+            )
+
+            # Process the streaming response from invoke_agent
+            completion = ""
+            if 'completion' in response:
+                for chunk in response['completion']:
+                    if cancelled and cancelled.is_set():
+                        log.info('Bedrock Agent response abandoned: hedged lookup already answered')
+                        bedrock_breaker.release_probe()
+                        return None, calls
+                    if 'chunk' in chunk:
+                        text = chunk['chunk']['bytes'].decode('utf-8')
+                        completion += text
+                        if on_chunk:
+                            on_chunk(text)
+
+            # Only a completed answer shows the agent is healthy
+            bedrock_breaker.record_success()
+            log.debug('Bedrock Agent response', completion=completion)
+            return completion, calls
+
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', '')
+            status_code = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            if error_code in THROTTLING_ERROR_CODES or error_code in SERVER_ERROR_CODES or status_code >= 500:
+                bedrock_breaker.record_failure()
+            else:
+                # e.g. AccessDenied or ValidationException: neither healthy nor overloaded
+                bedrock_breaker.release_probe()
+
+            if error_code in THROTTLING_ERROR_CODES and attempt < BEDROCK_MAX_ATTEMPTS - 1:
+                delay = backoff_delay(attempt, BEDROCK_BACKOFF_BASE_MS / 1000, BEDROCK_BACKOFF_CAP_MS / 1000)
+                if remaining_seconds(deadline) - delay < BEDROCK_MIN_ATTEMPT_MS / 1000:
+                    log.warning('Rate limit hit, no time left for another attempt', attempt=attempt + 1, maxAttempts=BEDROCK_MAX_ATTEMPTS)
+                    return None, calls
+                log.warning('Rate limit hit, retrying', delaySeconds=round(delay, 2), attempt=attempt + 1, maxAttempts=BEDROCK_MAX_ATTEMPTS)
+                pause(delay, cancelled)
+                continue
+
+            log.error('Bedrock Agent error', error=str(e))
+            return None, calls
+
+        except (ReadTimeoutError, ConnectTimeoutError) as e:
+            bedrock_breaker.record_failure()
+            log.error('Bedrock Agent timed out', error=str(e))
+            return None, calls
+
+        except Exception as e:
+            # Connection errors and failures while reading the stream
+            bedrock_breaker.record_failure()
+            log.error('Bedrock Agent call failed', error=str(e))
+            return None, calls
+
+    return None, calls
+
+def agent_response_needs_fallback(agent_response, extracted_params):
+    """
+    True when the agent gave no answer, a generic "could not understand" reply, or
+    boilerplate even though the request's intent and doctor were extracted.
+    """
+    if not agent_response:
+        return True
+    response_lower = agent_response.lower()
+    if any(indicator in response_lower for indicator in POOR_RESPONSE_INDICATORS):
+        return True
+    has_good_params = extracted_params['intent'] and extracted_params['doctorName']
+    return bool(has_good_params and "try:" in response_lower and "[doctor name]" in response_lower)
+
+def hedged_agent_request(prompt, session_id, extracted_params, on_chunk=None, deadline=None):
+    """
+    Call the Bedrock agent and, if it has not answered acceptably within HEDGE_DELAY_MS
+    (or fails sooner), start the direct quote/history lookup alongside it.
+    The first acceptable answer wins; the agent is told to stop if it loses.
+    Returns (response or None, bedrock_calls, winner) with winner 'bedrock', 'direct' or None.
+    """
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        agent_future = executor.submit(invoke_bedrock_agent, prompt, session_id, cancelled, on_chunk, deadline)
+        pending = {agent_future}
+        direct_future = None
+
+        done, _ = wait(pending, timeout=HEDGE_DELAY_MS / 1000)
+        while True:
+            if agent_future in done:
+                agent_response, _ = agent_future.result()
+                if not agent_response_needs_fallback(agent_response, extracted_params):
+                    if direct_future:
+                        direct_future.cancel()
+                    return agent_response, agent_future.result()[1], 'bedrock'
+            if direct_future in done and direct_future.result():
+                cancelled.set()
+                bedrock_calls = agent_future.result()[1] if agent_future.done() else 1
+                log.info('Hedged direct lookup answered first', agentFinished=agent_future.done())
+                return direct_future.result(), bedrock_calls, 'direct'
+
+            pending -= done
+            if direct_future is None:
+                log.info('Starting hedged direct lookup', hedgeDelayMs=HEDGE_DELAY_MS)
+                direct_future = executor.submit(
+                    try_direct_lambda_invocation,
+                    extracted_params['intent'],
+                    extracted_params['doctorName'],
+                    extracted_params['procedureCode']
+                )
+                pending.add(direct_future)
+            if not pending:
+                agent_response, bedrock_calls = agent_future.result()
+                return agent_response, bedrock_calls, None
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    finally:
+        # Never block the response on the losing request
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def try_direct_lambda_invocation(intent, doctor_name, procedure_code=None):
     """
     Try to invoke Lambda functions directly when Bedrock Agent fails.
     This provides a fallback mechanism for better user experience.
     """
     try:
+        function_name = DIRECT_FUNCTION_NAMES.get(intent)
+        if intent in DIRECT_FUNCTION_NAMES and not function_name:
+            log.warning('No function name configured for direct lookups', intent=intent)
+            return None
+
         if intent == 'getQuote' and doctor_name:
             # Direct invocation of get-quote function
-            function_name = "doctor-procedures-bedrock-app-GetQuoteFunction-weEztYJpLinp"
             
             # Construct event for direct Lambda invocation
             event = {
@@ -190,8 +784,6 @@ def try_direct_lambda_invocation(intent, doctor_name, procedure_code=None):
                 
         elif intent == 'showHistory' and doctor_name:
             # Direct invocation of show-history function
-            function_name = "doctor-procedures-bedrock-app-ShowHistoryFunction-6ri533GOJGz3"
-            
             event = {
                 'queryStringParameters': {
                     'doctorName': doctor_name
@@ -210,7 +802,7 @@ def try_direct_lambda_invocation(intent, doctor_name, procedure_code=None):
                 return format_direct_response(body, 'showHistory')
     
     except Exception as e:
-        print(f"Direct Lambda invocation failed: {e}")
+        log.error('Direct Lambda invocation failed', error=str(e))
         return None
     
     return None
@@ -233,43 +825,90 @@ def format_direct_response(lambda_response, intent):
     
     return str(lambda_response)
 
-def lambda_handler(event, context):
-    if not AGENT_ID or not AGENT_ALIAS_ID:
-        print("Error: BEDROCK_AGENT_ID or BEDROCK_AGENT_ALIAS_ID not set as environment variables.")
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Internal configuration error: Bedrock Agent details missing.'})
-        }
+def is_fan_out_request(extracted):
+    """A single quote or history request naming several doctors"""
+    return (FAN_OUT_ENABLED and extracted['intent'] in FAST_PATH_INTENTS
+            and len(extracted.get('doctorNames', [])) > 1 and extracted['mentions']['intents'] <= 1)
 
-    try:
-        # 1. Parse the incoming request from API Gateway
-        if 'body' not in event:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Request body is missing.'})
-            }
+def fan_out_lookups(extracted_params):
+    """
+    Run the direct lookup for each doctor (up to FAN_OUT_MAX_DOCTORS) in parallel and
+    merge the answers into one, so several doctors take about as long as one.
+    Returns None if no lookup answered.
+    """
+    intent = extracted_params['intent']
+    procedure_code = extracted_params['procedureCode']
+    doctors = extracted_params['doctorNames'][:FAN_OUT_MAX_DOCTORS]
+    log.info('Fanning out', intent=intent, doctors=doctors)
 
-        request_body = json.loads(event['body'])
-        user_text = request_body.get('text')
-        session_id = request_body.get('sessionId', context.aws_request_id) # Use AWS request ID as a default session ID
-        conversation_history = request_body.get('conversationHistory', [])
+    with ThreadPoolExecutor(max_workers=len(doctors)) as executor:
+        responses = list(executor.map(lambda doctor: try_direct_lambda_invocation(intent, doctor, procedure_code), doctors))
+    if not any(responses):
+        return None
 
-        if not user_text:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Text input is required in the request body.'})
-            }
+    if intent == 'getQuote':
+        heading = f"Quotes for {procedure_code}:" if procedure_code else "Overall quotes:"
+    else:
+        heading = "Procedure history:"
+    lines = [f"• {doctor}: {response or 'No answer available right now.'}" for doctor, response in zip(doctors, responses)]
+    return "\n".join([heading] + lines)
 
-        # Enhanced parameter extraction with conversation context
-        extracted_params = extract_parameters_from_text(user_text, conversation_history)
-        print(f"Extracted parameters: {extracted_params}")
+def answer_request(extracted_params, route_confidence, session, conversation_history, session_id, on_chunk=None, deadline=None):
+    """
+    Answer a request from the fast path, or from the Bedrock agent with the direct
+    lookup as fallback (or hedge). Returns the answer and how it was produced:
+    {'response', 'route', 'fallbackUsed', 'bedrockCalls', 'hedgeWinner'}, plus
+    'retryAfter' (seconds) when the fleet is over its agent call limit and no direct
+    lookup can answer instead.
+    """
+    # Unambiguous quote/history requests are served directly, skipping the Bedrock agent
+    fast_path_response = None
+    if is_fan_out_request(extracted_params):
+        with span('fastPath'):
+            fast_path_response = fan_out_lookups(extracted_params)
+    elif FAST_PATH_ENABLED and route_confidence >= FAST_PATH_MIN_CONFIDENCE:
+        log.info('Local fast path', intent=extracted_params['intent'], routeConfidence=round(route_confidence, 2))
+        with span('fastPath'):
+            fast_path_response = try_direct_lambda_invocation(
+                extracted_params['intent'],
+                extracted_params['doctorName'],
+                extracted_params['procedureCode']
+            )
+
+    fallback_used = False
+    bedrock_calls = 0
+    hedge_winner = None
+
+    # Over the fleet-wide agent limit: answer directly when possible, otherwise ask the client to retry
+    retry_after = 0
+    if not fast_path_response and bedrock_breaker.state != OPEN:
+        with span('fleetLimit'):
+            retry_after = fleet_retry_after()
+        if retry_after:
+            log.warning('Fleet rate limit reached for the Bedrock Agent', retryAfterSeconds=round(retry_after, 1))
+            if extracted_params['intent'] in FAST_PATH_INTENTS and extracted_params['doctorName']:
+                with span('fastPath'):
+                    fast_path_response = try_direct_lambda_invocation(
+                        extracted_params['intent'],
+                        extracted_params['doctorName'],
+                        extracted_params['procedureCode']
+                    )
+            if not fast_path_response:
+                return {'response': None, 'route': 'bedrock', 'fallbackUsed': False, 'bedrockCalls': 0, 'hedgeWinner': None, 'retryAfter': retry_after}
+
+    if fast_path_response:
+        route = 'local'
+        final_response = fast_path_response
+    else:
+        route = 'bedrock'
 
         # Build context-aware prompt if we have conversation history
         enhanced_prompt = extracted_params['enhanced_prompt']
-        if conversation_history:
+        if session and session['summary']:
+            # Running summary kept by the session store, the same size every turn
+            context_summary = "Previous conversation context:\n" + "\n".join(session['summary']) + "\n"
+            enhanced_prompt = f"{context_summary}\nCurrent question: {enhanced_prompt}"
+        elif conversation_history:
             # Create a summary of recent context
             recent_context = conversation_history[-6:]  # Last 3 exchanges (6 messages)
             context_summary = "Previous conversation context:\n"
@@ -277,113 +916,136 @@ def lambda_handler(event, context):
                 role = "User" if msg.get('role') == 'user' else "Assistant"
                 content = msg.get('content', '')[:200]  # Limit to 200 chars per message
                 context_summary += f"{role}: {content}\n"
-            
+
             enhanced_prompt = f"{context_summary}\nCurrent question: {enhanced_prompt}"
-            print(f"Enhanced prompt with context: {enhanced_prompt[:500]}...")  # Log first 500 chars
+            log.debug('Enhanced prompt with context', prompt=enhanced_prompt)
 
-        print(f"Invoking Bedrock Agent with text: '{enhanced_prompt}' for session: '{session_id}' with {len(conversation_history)} context messages")
+        log.info('Invoking Bedrock Agent', sessionId=session_id, contextMessages=len(conversation_history))
+        log.debug('Bedrock Agent input', text=enhanced_prompt)
 
-        # 2. Try Bedrock Agent first with enhanced prompt
-        agent_response = None
-        max_retries = 3
-        base_delay = 1  # Start with 1 second delay
-        
-        for attempt in range(max_retries):
-            try:
-                response = bedrock_agent_runtime.invoke_agent(
-                    agentId=AGENT_ID,
-                    agentAliasId=AGENT_ALIAS_ID,
-                    sessionId=session_id,
-                    inputText=enhanced_prompt
-                )
-                
-                # Process the streaming response from invoke_agent
-                completion = ""
-                if 'completion' in response:
-                    for chunk in response['completion']:
-                        if 'chunk' in chunk:
-                            completion += chunk['chunk']['bytes'].decode('utf-8')
-
-                print(f"Bedrock Agent Response: {completion}")
-                agent_response = completion
-                break  # Success, exit retry loop
-                
-            except ClientError as e:
-                error_code = e.response.get('Error', {}).get('Code', '')
-                
-                if error_code in ['ThrottlingException', 'TooManyRequestsException']:
-                    if attempt < max_retries - 1:  # Don't wait on the last attempt
-                        delay = base_delay * (2 ** attempt)  # Exponential backoff
-                        print(f"Rate limit hit, retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        agent_response = None
-                        break
-                else:
-                    print(f"Bedrock Agent error: {e}")
-                    agent_response = None
-                    break
+        # 2. Try Bedrock Agent first with enhanced prompt, hedged with a direct lookup when one is possible
+        hedged = HEDGE_ENABLED and extracted_params['intent'] in FAST_PATH_INTENTS and bool(extracted_params['doctorName'])
+        with span('bedrockInvocation'):
+            if hedged:
+                agent_response, bedrock_calls, hedge_winner = hedged_agent_request(enhanced_prompt, session_id, extracted_params, on_chunk, deadline)
+                fallback_used = hedge_winner == 'direct'
+            else:
+                agent_response, bedrock_calls = invoke_bedrock_agent(enhanced_prompt, session_id, on_chunk=on_chunk, deadline=deadline)
+        final_response = agent_response
 
         # 3. Fallback to direct Lambda invocation if Bedrock Agent fails or gives poor response
-        fallback_used = False
-        final_response = agent_response
-        
-        # Check if Bedrock Agent response indicates parameter extraction failure or generic responses
-        poor_response_indicators = [
-            "please specify which doctor", "please provide the doctor's name", 
-            "i don't understand", "i'm not sure", "could you clarify",
-            "i found that you want to get a quote, but i need",
-            "try: 'get quote for [doctor name]'",
-            "available doctors include:",
-            "but i need both a doctor name"
-        ]
-        
-        # Additional logic: If we have good extracted parameters but Bedrock Agent gives generic response, use fallback
-        has_good_params = (extracted_params['intent'] and extracted_params['doctorName'])
-        agent_gave_generic_response = agent_response and any(indicator in agent_response.lower() for indicator in poor_response_indicators)
-        
-        # Force fallback when we have extracted parameters but agent gives boilerplate response
-        should_use_fallback = (
-            agent_gave_generic_response or 
-            not agent_response or 
-            (has_good_params and "try:" in (agent_response or '').lower() and "[doctor name]" in (agent_response or '').lower())
-        )
-            
-        if should_use_fallback:
-            
-            print("Bedrock Agent failed or gave poor response, trying direct Lambda invocation...")
-            print(f"Reason: agent_gave_generic_response={agent_gave_generic_response}, no_response={not agent_response}, has_good_params={has_good_params}")
-            
-            direct_response = try_direct_lambda_invocation(
-                extracted_params['intent'], 
-                extracted_params['doctorName'], 
-                extracted_params['procedureCode']
-            )
-            
+        # (a hedged request has already raced the direct lookup)
+        if not hedged and agent_response_needs_fallback(agent_response, extracted_params):
+            log.info('Bedrock Agent failed or gave a poor response, trying direct Lambda invocation')
+
+            with span('fallback'):
+                direct_response = try_direct_lambda_invocation(
+                    extracted_params['intent'],
+                    extracted_params['doctorName'],
+                    extracted_params['procedureCode']
+                )
+
             if direct_response:
                 final_response = direct_response
                 fallback_used = True
-                print(f"Direct Lambda response: {direct_response}")
+                log.debug('Direct Lambda response', response=direct_response)
+
+    return {
+        'response': final_response,
+        'route': route,
+        'fallbackUsed': fallback_used,
+        'bedrockCalls': bedrock_calls,
+        'hedgeWinner': hedge_winner
+    }
+
+def handle_intent_request(event, context, on_chunk=None, use_session=True):
+    """
+    Map one chat message to an answer. Returns (status_code, body) for the caller to send,
+    either as a single JSON response or as the trailing event of a stream.
+    The optional `on_chunk` callback receives agent output as it arrives.
+    With use_session=False the session store is neither read nor written (batch replay).
+    """
+    start_time = time.perf_counter()
+    deadline = request_deadline(context, DEADLINE_RESERVE_MS)
+    if not AGENT_ID or not AGENT_ALIAS_ID:
+        log.error('BEDROCK_AGENT_ID or BEDROCK_AGENT_ALIAS_ID not set as environment variables')
+        return 500, {'message': 'Internal configuration error: Bedrock Agent details missing.'}
+
+    try:
+        # 1. Parse the incoming request from API Gateway
+        if 'body' not in event:
+            return 400, {'message': 'Request body is missing.'}
+
+        request_body = json.loads(event['body'])
+        user_text = request_body.get('text')
+        session_id = request_body.get('sessionId', context.aws_request_id) # Use AWS request ID as a default session ID
+        conversation_history = request_body.get('conversationHistory', [])
+
+        if not user_text:
+            return 400, {'message': 'Text input is required in the request body.'}
+
+        # Enhanced parameter extraction with conversation context
+        with span('sessionLoad'):
+            session = load_session(session_id) if use_session else None
+        with span('extraction'):
+            extracted_params = extract_parameters_from_text(user_text, conversation_history, session)
+        log.debug('Extracted parameters', params=extracted_params)
+
+        # Repeated quote/history requests are answered from the cache while the doctor's data is unchanged
+        with span('cacheLookup'):
+            cache_key = response_cache_key(extracted_params)
+            data_version = doctor_data_version(extracted_params['doctorName']) if cache_key else None
+            cached_response = response_cache.get(cache_key, data_version) if data_version is not None else None
+
+        # Likely follow-ups ("show her history", "what about ENDO001") are looked up while this request is answered
+        prefetch_follow_ups(extracted_params, data_version)
+
+        # Unambiguous quote/history requests are served directly, skipping the Bedrock agent
+        route_confidence = score_local_route(extracted_params)
+        coalesced = False
+        if cached_response:
+            log.info('Response cache hit', cacheKey=cache_key)
+            answer = {'response': cached_response, 'route': 'cache', 'fallbackUsed': False, 'bedrockCalls': 0, 'hedgeWinner': None}
+        else:
+            def compute_answer():
+                answer = answer_request(extracted_params, route_confidence, session, conversation_history, session_id, on_chunk, deadline)
+                if data_version is not None and not agent_response_needs_fallback(answer['response'], extracted_params):
+                    response_cache.put(cache_key, data_version, answer['response'])
+                return answer
+
+            # Identical concurrent requests share one upstream call
+            answer, coalesced = coalesce_request(coalescing_key(extracted_params, session_id, user_text), compute_answer)
+
+        if answer.get('retryAfter'):
+            retry_after = max(1, math.ceil(answer['retryAfter']))
+            log.info('Intent routed', intentRoute='rejected', routeConfidence=route_confidence, retryAfterSeconds=retry_after, coalesced=coalesced)
+            return 429, {'message': 'The assistant is busy, please try again shortly.', 'retryAfterSeconds': retry_after}
+
+        final_response = answer['response']
+        route = answer['route']
+        fallback_used = answer['fallbackUsed']
+        bedrock_calls = answer['bedrockCalls']
+        hedge_winner = answer['hedgeWinner']
 
         # 4. If still no good response, provide helpful guidance
+        known_doctors = get_entity_catalog()['doctors']
         if not final_response or any(phrase in final_response.lower() for phrase in [
             "please specify which doctor", "please provide the doctor's name"
         ]):
             if extracted_params['intent'] == 'getQuote':
                 final_response = f"I found that you want to get a quote, but I need both a doctor name and optionally a procedure code. " \
                                f"Try: 'Get quote for [Doctor Name]' or 'Get quote for [Doctor Name] procedure [Code]'. " \
-                               f"Available doctors include: {', '.join(COMMON_DOCTORS[:5])}..."
+                               f"Available doctors include: {', '.join(known_doctors[:5])}..."
             elif extracted_params['intent'] == 'showHistory':
                 final_response = f"I found that you want to see history, but I need a doctor name. " \
                                f"Try: 'Show history for [Doctor Name]'. " \
-                               f"Available doctors include: {', '.join(COMMON_DOCTORS[:5])}..."
+                               f"Available doctors include: {', '.join(known_doctors[:5])}..."
             else:
                 final_response = f"I didn't quite understand your request. You can ask me to:\n" \
                                f"• 'Show history for [Doctor Name]'\n" \
                                f"• 'Get quote for [Doctor Name]'\n" \
                                f"• 'Get quote for [Doctor Name] procedure [Code]'\n" \
-                               f"Available doctors: {', '.join(COMMON_DOCTORS[:3])}..."
+                               f"Available doctors: {', '.join(known_doctors[:3])}..."
 
         # Determine if this was a successful intent mapping
         intent_mapped = bool(final_response and not any(phrase in final_response.lower() for phrase in [
@@ -392,28 +1054,201 @@ def lambda_handler(event, context):
             "sorry, i don't", "i can't", "that's not something i can"
         ]))
         
-        # 5. Format the response for API Gateway
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*' # Required for CORS if your frontend is on a different domain
-            },
-            'body': json.dumps({
-                'response': final_response,
-                'sessionId': session_id,
-                'intentMapped': intent_mapped,
-                'contextUsed': len(conversation_history) > 0,
-                'originalMessage': user_text,
-                'extractedParams': extracted_params,
-                'fallbackUsed': fallback_used
-            })
+        if use_session:
+            with span('sessionSave'):
+                save_session(session_id, session, user_text, extracted_params, final_response)
+
+        latency_ms = round((time.perf_counter() - start_time) * 1000, 1)
+        circuit_state = bedrock_breaker.state
+        log.info('Intent routed', intentRoute=route, routeConfidence=route_confidence, latencyMs=latency_ms, bedrockCalls=bedrock_calls, hedgeWinner=hedge_winner, circuitState=circuit_state, coalesced=coalesced)
+
+        return 200, {
+            'response': final_response,
+            'sessionId': session_id,
+            'intentMapped': intent_mapped,
+            'contextUsed': len(conversation_history) > 0 or bool(session and session['turns']),
+            'originalMessage': user_text,
+            'extractedParams': extracted_params,
+            'fallbackUsed': fallback_used,
+            'route': route,
+            'routeConfidence': route_confidence,
+            'latencyMs': latency_ms,
+            'bedrockCalls': bedrock_calls,
+            'hedgeWinner': hedge_winner,
+            'circuitState': circuit_state,
+            'coalesced': coalesced
         }
 
     except Exception as e:
-        print(f"Error in IntentMapper (proxy) Lambda: {e}")
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': f'Internal server error: {str(e)}'})
-        }
\ No newline at end of file
+        log.error('IntentMapper failed', error=str(e))
+        return 500, {'message': f'Internal server error: {str(e)}'}
+
+def format_sse(event_name, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+def stream_intent_events(event, context):
+    """
+    Server-sent events for one chat message: a `chunk` event per piece of agent output
+    as it arrives, a `replace` event if the final answer differs from what was streamed
+    (e.g. the direct fallback was used), then a trailing `metadata` event with the same
+    body as the JSON route. Errors end the stream with an `error` event instead.
+    Served by intent_stream_server.py; API Gateway would buffer the whole stream.
+    """
+    chunks = queue.Queue()
+    result = {}
+
+    def run():
+        try:
+            result['status'], result['body'] = handle_intent_request(event, context, on_chunk=chunks.put)
+        finally:
+            chunks.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    streamed = ""
+    while True:
+        text = chunks.get()
+        if text is None:
+            break
+        streamed += text
+        yield format_sse('chunk', {'text': text})
+
+    status_code, body = result.get('status', 500), result.get('body', {'message': 'Internal server error'})
+    if status_code != 200:
+        yield format_sse('error', dict(body, statusCode=status_code))
+        return
+    if not streamed:
+        yield format_sse('chunk', {'text': body['response']})
+    elif streamed != body['response']:
+        yield format_sse('replace', {'text': body['response']})
+    yield format_sse('metadata', body)
+
+def predicted_route(extracted, route_confidence):
+    """The route a request would take before any lookup runs: 'local' or 'bedrock'"""
+    if is_fan_out_request(extracted) or (FAST_PATH_ENABLED and route_confidence >= FAST_PATH_MIN_CONFIDENCE):
+        return 'local'
+    return 'bedrock'
+
+def map_locally(item):
+    """
+    Extraction and routing for one batch item, without calling the agent or the
+    direct lookups. Returns (status_code, body).
+    """
+    start_time = time.perf_counter()
+    if not item.get('text'):
+        return 400, {'message': 'Text input is required in the request body.'}
+    extracted_params = extract_parameters_from_text(item['text'], item.get('conversationHistory', []))
+    route_confidence = score_local_route(extracted_params)
+    return 200, {
+        'originalMessage': item['text'],
+        'extractedParams': extracted_params,
+        'route': predicted_route(extracted_params, route_confidence),
+        'routeConfidence': route_confidence,
+        'latencyMs': round((time.perf_counter() - start_time) * 1000, 1)
+    }
+
+def latency_summary(latencies):
+    """Mean, p50, p95 and max of a list of latencies in ms (nearest rank)"""
+    if not latencies:
+        return {'mean': 0, 'p50': 0, 'p95': 0, 'max': 0}
+    ordered = sorted(latencies)
+
+    def rank(quantile):
+        return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)]
+
+    return {
+        'mean': round(sum(ordered) / len(ordered), 1),
+        'p50': rank(0.5),
+        'p95': rank(0.95),
+        'max': ordered[-1]
+    }
+
+def handle_batch_request(event, context):
+    """
+    Map a list of utterances, e.g. logged ones being replayed, on a bounded worker pool.
+    Body: {"items": [{"text", "conversationHistory"?, "sessionId"?}], "localOnly"?, "workers"?}.
+    With localOnly only extraction and routing run, so nothing calls Bedrock or the lookups.
+    Otherwise every item takes the /intent-mapper path, using only its own history (the
+    session store is not touched). Items that can't start before the deadline are
+    reported as 503. Returns (status_code, body) with per-item results and a summary.
+    """
+    start_time = time.perf_counter()
+    deadline = request_deadline(context, DEADLINE_RESERVE_MS)
+    try:
+        request_body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        return 400, {'message': 'Request body must be JSON.'}
+
+    items = request_body.get('items')
+    if not isinstance(items, list) or not items:
+        return 400, {'message': 'A non-empty list of items is required in the request body.'}
+    if len(items) > BATCH_MAX_ITEMS:
+        return 400, {'message': f'At most {BATCH_MAX_ITEMS} items are accepted per batch.'}
+    local_only = bool(request_body.get('localOnly', False))
+    workers = max(1, min(int(request_body.get('workers', BATCH_MAX_WORKERS)), BATCH_MAX_WORKERS))
+
+    def run(index):
+        item = items[index] if isinstance(items[index], dict) else {'text': items[index]}
+        if remaining_seconds(deadline) <= 0:
+            return 503, {'message': 'Not processed: the batch ran out of time.'}
+        if local_only:
+            return map_locally(item)
+        # Each item gets its own agent session, so replayed utterances don't share agent memory
+        item_event = {'body': json.dumps(dict(item, sessionId=item.get('sessionId') or f"{context.aws_request_id}-{index}"))}
+        return handle_intent_request(item_event, context, use_session=False)
+
+    log.info('Batch received', items=len(items), workers=workers, localOnly=local_only)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(run, range(len(items))))
+
+    results = [dict(body, index=index, statusCode=status_code) for index, (status_code, body) in enumerate(outcomes)]
+    succeeded = [result for result in results if result['statusCode'] == 200]
+    routes = Counter(result['route'] for result in succeeded)
+    summary = {
+        'items': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'localOnly': local_only,
+        'workers': workers,
+        'wallMs': round((time.perf_counter() - start_time) * 1000, 1),
+        'itemLatencyMs': latency_summary([result['latencyMs'] for result in succeeded]),
+        'routes': dict(routes),
+        'bedrockCalls': sum(result.get('bedrockCalls', 0) for result in succeeded)
+    }
+    log.info('Batch finished', batch=summary)
+    return 200, {'results': results, 'summary': summary}
+
+def is_batch_request(event):
+    return (event.get('resource') or event.get('path') or '').rstrip('/').endswith('/batch')
+
+def lambda_handler(event, context):
+    start_request(context)
+    start_spans()
+    log.event(event)
+    # 5. Format the response for API Gateway
+    if is_batch_request(event):
+        status_code, body = handle_batch_request(event, context)
+        route = 'batch'
+    else:
+        status_code, body = handle_intent_request(event, context)
+        route = body.get('route', 'none')
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*' # Required for CORS if your frontend is on a different domain
+    }
+    if status_code == 429:
+        headers['Retry-After'] = str(body['retryAfterSeconds'])
+    with span('response'):
+        response_body = json.dumps(body)
+    # CircuitOpen is 1 while the agent is skipped or only probed, so it can be alarmed on
+    circuit_state = bedrock_breaker.state
+    emit_spans(
+        'intent_mapper', counts={'CircuitOpen': int(circuit_state != CLOSED)},
+        route=route, statusCode=status_code, circuitState=circuit_state
+    )
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': response_body
+    }
\ No newline at end of file
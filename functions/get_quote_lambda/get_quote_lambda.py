@@ -1,16 +1,22 @@
 # filename: get_quote_lambda.py
-import json
-import boto3
 import os
-from boto3.dynamodb.conditions import Key, Attr
-from decimal import Decimal
-import statistics
-import difflib
-import re
+from startup import lazy, lazy_import
+import aws_clients
+from doctor_shards import doctor_name_from_partition_key, read_partition_keys, fan_out, max_read_fan_out
+from response_envelopes import is_bedrock_agent_event, build_response
+from structured_log import get_logger, start_request
+from stage_metrics import start_spans, span, timed_call, emit_spans
 
-dynamodb = boto3.resource('dynamodb')
+# Built on first use unless STARTUP_MODE=eager (see startup.py)
+conditions = lazy_import('boto3.dynamodb.conditions')
+difflib = lazy_import('difflib')
+statistics = lazy_import('statistics')
+
+# One pooled connection per shard a hot doctor's reads fan out across (see aws_clients.py)
+dynamodb = lazy(lambda: aws_clients.resource('dynamodb', max_pool_connections=max_read_fan_out()))
 TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'DoctorProcedures')
-table = dynamodb.Table(TABLE_NAME)
+table = lazy(lambda: dynamodb.Table(TABLE_NAME))
+log = get_logger('get_quote')
 
 def find_best_doctor_match(input_name, threshold=0.4):
     """
@@ -19,12 +25,10 @@ def find_best_doctor_match(input_name, threshold=0.4):
     """
     try:
         # Get all unique doctor names from the table
-        response = table.scan(
-            ProjectionExpression='DoctorName'
-        )
+        response = timed_call('dynamodbScan', table.scan, ProjectionExpression='DoctorName')
         
-        all_doctors = list(set(item['DoctorName'] for item in response.get('Items', [])))
-        print(f"Available doctors: {all_doctors}")
+        all_doctors = list(set(doctor_name_from_partition_key(item['DoctorName']) for item in response.get('Items', [])))
+        log.debug('Doctor catalog', count=len(all_doctors), doctors=all_doctors)
         
         if not all_doctors:
             return None, 0
@@ -35,7 +39,7 @@ def find_best_doctor_match(input_name, threshold=0.4):
         # Try exact case-insensitive match first
         for doctor in all_doctors:
             if doctor.lower() == input_normalized:
-                print(f"Exact match found: {doctor}")
+                log.info('Exact doctor match', doctor=doctor)
                 return doctor, 1.0
         
         # Try partial matching (if input is contained in doctor name or vice versa)
@@ -45,7 +49,7 @@ def find_best_doctor_match(input_name, threshold=0.4):
                 # Calculate confidence based on length similarity
                 confidence = min(len(input_normalized), len(doctor_normalized)) / max(len(input_normalized), len(doctor_normalized))
                 if confidence >= threshold:
-                    print(f"Partial match found: {doctor} (confidence: {confidence:.2f})")
+                    log.info('Partial doctor match', doctor=doctor, confidence=round(confidence, 2))
                     return doctor, confidence
         
         # Use fuzzy matching for typos and spelling mistakes
@@ -62,37 +66,58 @@ def find_best_doctor_match(input_name, threshold=0.4):
             for doctor in all_doctors:
                 if doctor.lower() == matched_normalized:
                     confidence = difflib.SequenceMatcher(None, input_normalized, matched_normalized).ratio()
-                    print(f"Fuzzy match found: {doctor} (confidence: {confidence:.2f})")
+                    log.info('Fuzzy doctor match', doctor=doctor, confidence=round(confidence, 2))
                     return doctor, confidence
         
-        print(f"No good match found for: {input_name}")
+        log.info('No doctor match', input=input_name)
         return None, 0
         
     except Exception as e:
-        print(f"Error in find_best_doctor_match: {e}")
+        log.error('Doctor match failed', error=str(e))
         return None, 0
 
+def query_partition_items(partition_key):
+    """
+    Fetch every item in one DoctorName partition, following Query pagination.
+    """
+    items = []
+    query_kwargs = {
+        'TableName': TABLE_NAME,
+        'KeyConditionExpression': conditions.Key('DoctorName').eq(partition_key)
+    }
+    while True:
+        # The resource's client is safe to share across the fan-out threads
+        response = timed_call('dynamodbQuery', table.meta.client.query, **query_kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def query_doctor_items(doctor_name):
+    """
+    Fetch all of a doctor's procedures, querying every shard of hot doctors in parallel.
+    """
+    partition_results = fan_out(query_partition_items, read_partition_keys(doctor_name))
+    return [item for items in partition_results for item in items]
+
+def respond(event, is_bedrock_agent, status_code, body):
+    """Answer in the envelope the caller expects, and emit the request's stage timings"""
+    with span('response'):
+        response = build_response(event, is_bedrock_agent, status_code, body, 'GetQuoteGroup', '/getQuote')
+    emit_spans('get_quote', statusCode=status_code, bedrockAgent=is_bedrock_agent)
+    return response
+
 def lambda_handler(event, context):
+    is_bedrock_agent = False
+    start_request(context)
+    start_spans()
     try:
-        # Debug: print the event to understand Bedrock Agent invocation format
-        print(f"Event received: {json.dumps(event)}")
+        log.event(event)
         
-        # Detect Bedrock Agent by checking for agent and parameters structure
-        is_bedrock_agent = (
-            'agent' in event and 
-            'actionGroup' in event and 
-            'parameters' in event and
-            'messageVersion' in event
-        )
-        
-        print(f"Detected Bedrock Agent: {is_bedrock_agent}")
+        is_bedrock_agent = is_bedrock_agent_event(event)
         
-        # Additional debugging for Bedrock Agent events
-        if is_bedrock_agent:
-            print(f"Bedrock Agent ID: {event.get('agent', {}).get('id', 'Unknown')}")
-            print(f"Action Group: {event.get('actionGroup', 'Unknown')}")
-            print(f"API Path: {event.get('apiPath', 'Unknown')}")
-            print(f"Raw parameters: {event.get('parameters', [])}")
+        log.info('Request received', bedrockAgent=is_bedrock_agent)
         
         # Handle Bedrock Agent parameters vs API Gateway parameters
         if is_bedrock_agent:
@@ -100,10 +125,7 @@ def lambda_handler(event, context):
             parameters = {param['name']: param['value'] for param in event.get('parameters', [])}
             doctor_name = parameters.get('doctorName')
             procedure_code = parameters.get('procedureCode')  # Optional
-            
-            # Debug: Print extracted parameters
-            print(f"Bedrock Agent parameters extracted: {parameters}")
-            print(f"Doctor name from parameters: {doctor_name}")
+            log.debug('Bedrock agent parameters', agentId=event.get('agent', {}).get('id'), apiPath=event.get('apiPath'), parameters=parameters)
         else:
             # Handle API Gateway query parameters
             query_params = event.get('queryStringParameters') or {}
@@ -116,85 +138,41 @@ def lambda_handler(event, context):
                 error_message = 'Missing required parameter: doctorName. Please specify which doctor you want to get a quote for.'
             else:
                 error_message = 'Missing required parameter: doctorName. Please provide the doctor name.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'GetQuoteGroup'),
-                        'apiPath': event.get('apiPath', '/getQuote'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 400,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 400, {'message': error_message})
 
         # Find the best matching doctor name using fuzzy matching
-        print(f"Original doctor name input: {doctor_name}")
-        matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
+        with span('nameResolution'):
+            matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
         
         if not matched_doctor_name:
             error_message = f'No doctor found matching "{doctor_name}". Please check the spelling and try again.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'GetQuoteGroup'),
-                        'apiPath': event.get('apiPath', '/getQuote'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 404,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 404, {'message': error_message})
         
         # Use the matched doctor name for the query
+        original_input = doctor_name
         doctor_name = matched_doctor_name
-        print(f"Using matched doctor name: {doctor_name} (confidence: {confidence:.2f})")
+        log.info('Using matched doctor', input=original_input, doctor=doctor_name, confidence=round(confidence, 2))
 
-        # Query DynamoDB for doctor's procedures
-        print(f"Querying for doctor: {doctor_name}")
-        if procedure_code:
-            print(f"Filtering for specific procedure: {procedure_code}")
-        
-        # Base query for the doctor
-        response = table.query(
-            KeyConditionExpression=Key('DoctorName').eq(doctor_name)
-        )
-
-        items = response.get('Items', [])
-        print(f"Found {len(items)} total items for doctor {doctor_name}")
+        # Query DynamoDB for all of the doctor's procedures
+        with span('procedureQuery'):
+            items = query_doctor_items(doctor_name)
+        log.info('Procedures found', doctor=doctor_name, count=len(items))
 
         # Filter by procedure code if provided
         if procedure_code:
             items = [item for item in items if item.get('procedure_code') == procedure_code]
-            print(f"Filtered to {len(items)} items for procedure {procedure_code}")
+            log.info('Procedures filtered', procedureCode=procedure_code, count=len(items))
 
         if items:
             # Extract costs and calculate median
-            costs = [float(item['cost']) for item in items]
-            median_cost = statistics.median(costs)
+            # Costs stay Decimal; the response serializer writes them as numbers
+            with span('aggregation'):
+                costs = [item['cost'] for item in items]
+                median_cost = statistics.median(costs)
+                cost_range = {'min': min(costs), 'max': max(costs)}
             
-            print(f"Costs found: {costs}")
-            print(f"Median cost: {median_cost}")
+            log.debug('Costs found', count=len(costs), costs=costs)
+            log.info('Median cost', medianCost=median_cost)
             
             if procedure_code:
                 # Specific procedure median
@@ -213,10 +191,7 @@ def lambda_handler(event, context):
                     'medianCost': median_cost,
                     'sampleCount': len(items),
                     'matchConfidence': confidence,
-                    'costRange': {
-                        'min': min(costs),
-                        'max': max(costs)
-                    }
+                    'costRange': cost_range
                 }
             else:
                 # Overall median for all procedures by this doctor
@@ -235,33 +210,10 @@ def lambda_handler(event, context):
                     'sampleCount': len(items),
                     'procedureTypes': unique_procedures,
                     'matchConfidence': confidence,
-                    'costRange': {
-                        'min': min(costs),
-                        'max': max(costs)
-                    }
+                    'costRange': cost_range
                 }
 
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'GetQuoteGroup'),
-                        'apiPath': event.get('apiPath', '/getQuote'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 200,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps(result_data)
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(result_data)
-                }
+            return respond(event, is_bedrock_agent, 200, result_data)
         else:
             if procedure_code:
                 error_message = f'No procedures found for {doctor_name} with procedure code "{procedure_code}".'
@@ -272,50 +224,8 @@ def lambda_handler(event, context):
             if confidence < 1.0:
                 original_input = event.get("queryStringParameters", {}).get("doctorName") if not is_bedrock_agent else [p["value"] for p in event.get("parameters", []) if p["name"] == "doctorName"][0]
                 error_message += f' (Note: Matched "{doctor_name}" from your input "{original_input}")'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'GetQuoteGroup'),
-                        'apiPath': event.get('apiPath', '/getQuote'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 404,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 404, {'message': error_message})
 
     except Exception as e:
-        print(f"Error in getQuoteLambda: {e}")
-        error_message = f'Internal server error: {str(e)}'
-        
-        if 'is_bedrock_agent' in locals() and is_bedrock_agent:
-            return {
-                'messageVersion': '1.0',
-                'response': {
-                    'actionGroup': event.get('actionGroup', 'GetQuoteGroup'),
-                    'apiPath': event.get('apiPath', '/getQuote'),
-                    'httpMethod': event.get('httpMethod', 'GET'),
-                    'httpStatusCode': 500,
-                    'responseBody': {
-                        'application/json': {
-                            'body': json.dumps({'message': error_message})
-                        }
-                    }
-                }
-            }
-        else:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': error_message})
-            }
\ No newline at end of file
+        log.error('getQuote failed', error=str(e))
+        return respond(event, is_bedrock_agent, 500, {'message': f'Internal server error: {str(e)}'})
@@ -0,0 +1,97 @@
+"""
+Shared AWS clients for the Lambda functions.
+
+botocore's defaults suit a long-running process: 10 pooled connections, no TCP
+keep-alive, 60 second connect and read timeouts. Batch mapping and the doctor
+fan-out run more calls at once than that pool holds, so the extra connections are
+opened, used once and dropped ("Connection pool is full"). A 60 second read
+timeout also outlives a 30 second function, so a stalled call ends with Lambda
+killing the invocation instead of an error the handler can fall back from.
+
+`client` and `resource` build each service with:
+
+- a connection pool at least as large as the caller says it needs
+- TCP keep-alive on pooled connections, so they survive between invocations
+- connect and read timeouts per service, with the read timeout cut so that every
+  attempt fits in the function timeout (FUNCTION_TIMEOUT_SECONDS) less a reserve
+- standard-mode retries, with attempts per service
+
+Each one is built once per container and shared by every module and invocation.
+Wrap them in `startup.lazy` to keep them off the cold start:
+
+    dynamodb = lazy(lambda: aws_clients.resource('dynamodb', max_pool_connections=BULK_WRITE_CONCURRENCY))
+"""
+import os
+import threading
+from startup import lazy_import
+
+boto3 = lazy_import('boto3')
+botocore_config = lazy_import('botocore.config')
+
+# Smallest connection pool; callers ask for more to match their concurrency
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10'))
+AWS_TCP_KEEPALIVE = os.environ.get('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+# Lambda does not expose the function timeout, so the template passes it in
+FUNCTION_TIMEOUT_SECONDS = float(os.environ.get('FUNCTION_TIMEOUT_SECONDS', '30'))
+CLIENT_TIMEOUT_RESERVE_SECONDS = float(os.environ.get('CLIENT_TIMEOUT_RESERVE_SECONDS', '2'))  # Kept for answering after a timeout
+
+# service: (connect timeout, read timeout, attempts), timeouts in seconds
+SERVICE_TIMEOUTS = {
+    'dynamodb': (1, 3, 3),
+    'sqs': (1, 5, 3),
+    'lambda': (2, 15, 2),  # Direct quote/history lookups
+    'bedrock-agent-runtime': (2, 60, 1)  # The agent can pause between chunks; invoke_bedrock_agent retries itself
+}
+DEFAULT_TIMEOUTS = (2, 10, 3)
+
+_built = {}
+_built_lock = threading.Lock()
+
+
+def service_timeouts(service_name):
+    """(connect timeout, read timeout, attempts) for a service, fitted to the function timeout"""
+    connect_timeout, read_timeout, attempts = SERVICE_TIMEOUTS.get(service_name, DEFAULT_TIMEOUTS)
+    per_attempt = (FUNCTION_TIMEOUT_SECONDS - CLIENT_TIMEOUT_RESERVE_SECONDS) / attempts - connect_timeout
+    return connect_timeout, max(1.0, min(read_timeout, per_attempt)), attempts
+
+
+def pool_size(max_pool_connections=None):
+    return max(AWS_MAX_POOL_CONNECTIONS, max_pool_connections or 0)
+
+
+def client_config(service_name, max_pool_connections=None):
+    """The botocore Config `client` and `resource` build `service_name` with"""
+    connect_timeout, read_timeout, attempts = service_timeouts(service_name)
+    return botocore_config.Config(
+        max_pool_connections=pool_size(max_pool_connections),
+        tcp_keepalive=AWS_TCP_KEEPALIVE,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries={'total_max_attempts': attempts, 'mode': 'standard'}
+    )
+
+
+def _shared(kind, service_name, region_name, max_pool_connections):
+    key = (kind, service_name, region_name, pool_size(max_pool_connections))
+    with _built_lock:
+        if key not in _built:
+            build = boto3.client if kind == 'client' else boto3.resource
+            _built[key] = build(service_name, region_name=region_name, config=client_config(service_name, max_pool_connections))
+        return _built[key]
+
+
+def client(service_name, region_name=None, max_pool_connections=None):
+    """The container's shared boto3 client for a service"""
+    return _shared('client', service_name, region_name, max_pool_connections)
+
+
+def resource(service_name, region_name=None, max_pool_connections=None):
+    """The container's shared boto3 resource for a service"""
+    return _shared('resource', service_name, region_name, max_pool_connections)
+
+
+def clear():
+    """Forget the shared clients, so the next call builds new ones (tests and benchmarks)"""
+    with _built_lock:
+        _built.clear()
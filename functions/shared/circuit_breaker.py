@@ -0,0 +1,81 @@
+"""
+Per-container circuit breaker for a dependency that throttles or times out under load.
+
+closed     every call is allowed; `failure_threshold` consecutive failures open the circuit
+open       no calls are allowed until `reset_timeout` seconds have passed
+half_open  up to `probe_limit` probe calls at a time are allowed; a probe that
+           succeeds closes the circuit, one that fails opens it again
+
+Callers ask allow_request() before each call and report its outcome with
+record_success() or record_failure(), or release_probe() when the call ended
+without showing whether the dependency is healthy (e.g. it was cancelled or
+rejected as invalid). Every allowed call must end in one of the three, or a
+half-open circuit keeps its probe slot taken and never allows another call.
+"""
+import threading
+import time
+
+from structured_log import get_logger
+
+log = get_logger('circuit_breaker')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold, reset_timeout, probe_limit=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_limit = probe_limit
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+        self.lock = threading.Lock()
+
+    def _current_state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._current_state()
+
+    def allow_request(self):
+        with self.lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self.probes < self.probe_limit:
+                self.probes += 1
+                return True
+            return False
+
+    def release_probe(self):
+        with self.lock:
+            if self.probes:
+                self.probes -= 1
+
+    def record_success(self):
+        with self.lock:
+            if self._current_state() != CLOSED:
+                log.info('Circuit closed: probe call succeeded')
+            self.failures = 0
+            self.opened_at = None
+            self.probes = 0
+
+    def record_failure(self):
+        with self.lock:
+            state = self._current_state()
+            self.failures += 1
+            if state == HALF_OPEN or (state == CLOSED and self.failures >= self.failure_threshold):
+                log.warning('Circuit opened', consecutiveFailures=self.failures)
+                self.opened_at = self.clock()
+                self.probes = 0
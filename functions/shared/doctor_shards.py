@@ -0,0 +1,123 @@
+"""
+Partition-key sharding for high-volume ("hot") doctors.
+
+Doctors listed in HOT_DOCTOR_SHARDS (a JSON object of doctor name -> shard count,
+e.g. '{"Sarah Johnson": 4}') have their new rows spread across the partition keys
+"Sarah Johnson#0" .. "Sarah Johnson#3". Readers query every shard plus the bare
+name (rows written before the doctor was flagged) in parallel and merge the results.
+Shard counts should only ever be increased, otherwise rows in the dropped shards
+are no longer read.
+"""
+import heapq
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from structured_log import get_logger
+
+log = get_logger('doctor_shards')
+
+SHARD_SEPARATOR = '#'
+
+_SHARD_SUFFIX_PATTERN = re.compile(r'#\d+$')
+
+
+def _load_hot_doctor_shards():
+    try:
+        config = json.loads(os.environ.get('HOT_DOCTOR_SHARDS') or '{}')
+    except ValueError:
+        log.warning('Ignoring invalid HOT_DOCTOR_SHARDS configuration')
+        return {}
+    if not isinstance(config, dict):
+        log.warning('Ignoring HOT_DOCTOR_SHARDS configuration that is not a JSON object')
+        return {}
+
+    # A bad entry is skipped rather than failing the import of every function using the layer
+    shards = {}
+    for name, count in config.items():
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            log.warning('Ignoring invalid HOT_DOCTOR_SHARDS shard count', doctor=name, count=str(count))
+            continue
+        if count > 1:
+            shards[name.lower()] = count
+    return shards
+
+
+HOT_DOCTOR_SHARDS = _load_hot_doctor_shards()
+
+
+def shard_count(doctor_name):
+    """
+    Number of write shards for a doctor (1 means unsharded).
+    """
+    return HOT_DOCTOR_SHARDS.get(doctor_name.lower(), 1)
+
+
+def write_partition_key(doctor_name, sort_key):
+    """
+    Partition key for a new row. The shard is derived from the sort key, so a
+    retried write of the same row always lands on the same shard.
+    """
+    shards = shard_count(doctor_name)
+    if shards == 1:
+        return doctor_name
+    return f"{doctor_name}{SHARD_SEPARATOR}{zlib.crc32(sort_key.encode('utf-8')) % shards}"
+
+
+def read_partition_keys(doctor_name):
+    """
+    Every partition key that may hold rows for a doctor.
+    """
+    shards = shard_count(doctor_name)
+    if shards == 1:
+        return [doctor_name]
+    return [doctor_name] + [f"{doctor_name}{SHARD_SEPARATOR}{shard}" for shard in range(shards)]
+
+
+def doctor_name_from_partition_key(partition_key):
+    """
+    Strip a shard suffix from a stored DoctorName value.
+    """
+    return _SHARD_SUFFIX_PATTERN.sub('', partition_key)
+
+
+def fan_out(query_partition, partition_keys):
+    """
+    Run `query_partition(partition_key)` for every key, in parallel when there is
+    more than one, and return the results in `partition_keys` order.
+    """
+    if len(partition_keys) == 1:
+        return [query_partition(partition_keys[0])]
+    with ThreadPoolExecutor(max_workers=len(partition_keys)) as executor:
+        return list(executor.map(query_partition, partition_keys))
+
+
+def max_read_fan_out():
+    """
+    Most partition keys one doctor's reads fan out across, i.e. the parallel queries
+    a single request can make.
+    """
+    return max(HOT_DOCTOR_SHARDS.values(), default=0) + 1
+
+
+def merge_partition_results(results, limit, newest_first=True):
+    """
+    Merge per-partition (items, has_more) results, each already in sort key order,
+    into one list of at most `limit` items. Returns (items, has_more).
+    """
+    merged = heapq.merge(
+        *[items for items, _ in results],
+        key=lambda item: item['ProcedureTime'],
+        reverse=newest_first
+    )
+    items = []
+    for item in merged:
+        items.append(item)
+        if len(items) > limit:
+            break
+    has_more = len(items) > limit or any(partition_has_more for _, partition_has_more in results)
+    return items[:limit], has_more
@@ -0,0 +1,74 @@
+"""
+Multi-pattern entity matching with an Aho-Corasick automaton.
+
+build_automaton compiles a {pattern: [payload, ...]} map once; find_matches then
+reports every whole-word occurrence of every pattern in a single left-to-right
+pass over the text, however many patterns there are. Patterns and text are
+matched as given, so callers lowercase both for case-insensitive matching.
+"""
+from collections import deque
+
+
+def build_automaton(patterns):
+    """
+    Compile patterns into goto/fail/output tables.
+    Each output entry is (pattern_length, payloads).
+    """
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+
+    for pattern, payloads in patterns.items():
+        if not pattern:
+            continue
+        state = 0
+        for char in pattern:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                next_state = len(goto)
+                goto.append({})
+                fail.append(0)
+                output.append([])
+                goto[state][char] = next_state
+            state = next_state
+        output[state].append((len(pattern), list(payloads)))
+
+    # Breadth-first, so every fail target is finished before it is used
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(char, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+
+    return {'goto': goto, 'fail': fail, 'output': output}
+
+
+def _is_word_boundary(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+def find_matches(automaton, text):
+    """
+    Every whole-word pattern occurrence in `text`, as (start, end, payloads) tuples
+    ordered by end position.
+    """
+    goto = automaton['goto']
+    fail = automaton['fail']
+    output = automaton['output']
+
+    matches = []
+    state = 0
+    for index, char in enumerate(text):
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        for length, payloads in output[state]:
+            start = index + 1 - length
+            if _is_word_boundary(text, start, index + 1):
+                matches.append((start, index + 1, payloads))
+    return matches
@@ -0,0 +1,280 @@
+"""
+Doctor registry and per-procedure aggregates kept next to the raw procedure rows.
+
+The stats table (DYNAMODB_STATS_TABLE_NAME) has one partition per write partition
+of DoctorProcedures (see doctor_shards), so hot doctors' aggregates are sharded too:
+  PK "DOCTOR#<partition key>", SK "PROFILE"        registry entry: doctor_name, procedure_codes
+  PK "DOCTOR#<partition key>", SK "STATS#<code>"   procedure_count, total_cost and a cost sketch
+  PK "DOCTOR#<partition key>", SK "STATS#*"        the same across every procedure code
+  PK "IDEMPOTENCY#<key hash>",  SK "KEY"            the row written for a client idempotency key
+Raw rows and their aggregate deltas are written in one TransactWriteItems call, so
+the two cannot drift apart; rebuild_aggregates.py recomputes everything from the raw
+rows if they ever do. The cost sketch is a log-bucketed histogram (attributes
+"h<index>") with about 1% relative error, enough to estimate a median cost.
+"""
+import math
+import os
+import time
+import uuid
+from collections import Counter
+
+from doctor_shards import doctor_name_from_partition_key
+from sort_keys import idempotent_suffix
+
+STATS_TABLE_NAME = os.environ.get('DYNAMODB_STATS_TABLE_NAME', 'DoctorProcedureStats')
+
+AGGREGATE_KEY_PREFIX = 'DOCTOR#'
+PROFILE_SORT_KEY = 'PROFILE'
+STATS_SORT_KEY_PREFIX = 'STATS#'
+ALL_PROCEDURES = '*'
+
+IDEMPOTENCY_KEY_PREFIX = 'IDEMPOTENCY#'
+IDEMPOTENCY_SORT_KEY = 'KEY'
+# How long an idempotency key keeps mapping to its row (the record's expires_at TTL)
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+
+SKETCH_GAMMA = 1.02
+SKETCH_MIN_COST = 0.01
+SKETCH_ATTRIBUTE_PREFIX = 'h'
+
+# TransactWriteItems accepts at most 100 actions
+MAX_TRANSACTION_ACTIONS = 100
+
+_TOKEN_NAMESPACE = uuid.UUID('5b0c7f8e-3a41-4d8e-9a55-6f2f1c0d8e21')
+
+
+def aggregate_partition_key(partition_key):
+    """
+    Stats table partition key for a DoctorProcedures partition key.
+    """
+    return f"{AGGREGATE_KEY_PREFIX}{partition_key}"
+
+
+def stats_sort_key(procedure_code):
+    return f"{STATS_SORT_KEY_PREFIX}{procedure_code}"
+
+
+def cost_bucket(cost):
+    """
+    Sketch bucket index for a cost: bucket i covers (gamma^(i-1), gamma^i].
+    """
+    return math.ceil(math.log(max(float(cost), SKETCH_MIN_COST)) / math.log(SKETCH_GAMMA))
+
+
+def bucket_cost(index):
+    """
+    Representative cost for a bucket, within 1% of every cost in it.
+    """
+    return 2 * SKETCH_GAMMA ** index / (SKETCH_GAMMA + 1)
+
+
+def sketch_from_item(item):
+    """
+    Read the {bucket index: count} sketch out of a stored stats item.
+    """
+    return {
+        int(name[len(SKETCH_ATTRIBUTE_PREFIX):]): int(count)
+        for name, count in item.items()
+        if name.startswith(SKETCH_ATTRIBUTE_PREFIX) and name[len(SKETCH_ATTRIBUTE_PREFIX):].lstrip('-').isdigit()
+    }
+
+
+def estimate_quantile(sketch, quantile):
+    """
+    Estimate a cost quantile (0.5 for the median) from a sketch. Returns None for an empty sketch.
+    """
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = quantile * (total - 1)
+    seen = 0
+    for index in sorted(sketch):
+        seen += sketch[index]
+        if seen > rank:
+            return bucket_cost(index)
+    return bucket_cost(max(sketch))
+
+
+def idempotency_record_key(idempotency_key):
+    """
+    Stats table key of the record naming the row written for a client idempotency key.
+    """
+    return {'PK': f"{IDEMPOTENCY_KEY_PREFIX}{idempotent_suffix(idempotency_key)}", 'SK': IDEMPOTENCY_SORT_KEY}
+
+
+def idempotency_expires_at():
+    """
+    expires_at (epoch seconds) for idempotency key records written now.
+    """
+    return int(time.time() + IDEMPOTENCY_KEY_TTL_HOURS * 3600)
+
+
+def idempotency_record_put(table_name, item, expires_at):
+    """
+    TransactWriteItems Put action claiming a row's idempotency key. It only succeeds
+    for an unused key, so a replay whose row got a different sort key (e.g. a new
+    current time) cancels the whole transaction instead of adding a second row.
+    """
+    record = idempotency_record_key(item['idempotency_key'])
+    record.update({
+        'doctor_partition': item['DoctorName'],
+        'procedure_time': item['ProcedureTime'],
+        'time_logged': item['time_logged'],
+        'expires_at': expires_at
+    })
+    return {
+        'Put': {
+            'TableName': table_name,
+            'Item': record,
+            'ConditionExpression': 'attribute_not_exists(PK)'
+        }
+    }
+
+
+def aggregate_rows(items):
+    """
+    Fold raw procedure rows into aggregate deltas keyed by (PK, SK).
+    Profile deltas hold doctor_name and procedure_codes; stats deltas hold
+    procedure_count, total_cost and buckets.
+    """
+    deltas = {}
+    for item in items:
+        pk = aggregate_partition_key(item['DoctorName'])
+        code = item['procedure_code']
+
+        profile = deltas.setdefault((pk, PROFILE_SORT_KEY), {
+            'doctor_name': doctor_name_from_partition_key(item['DoctorName']),
+            'procedure_codes': set()
+        })
+        profile['procedure_codes'].add(code)
+
+        for sort_key in (stats_sort_key(code), stats_sort_key(ALL_PROCEDURES)):
+            stats = deltas.setdefault((pk, sort_key), {
+                'procedure_count': 0,
+                'total_cost': 0,
+                'buckets': Counter()
+            })
+            stats['procedure_count'] += 1
+            stats['total_cost'] += item['cost']
+            stats['buckets'][cost_bucket(item['cost'])] += 1
+    return deltas
+
+
+def aggregate_item(key, delta):
+    """
+    Full stats table item for a delta computed over every row (used by the rebuild job).
+    """
+    pk, sk = key
+    item = {'PK': pk, 'SK': sk}
+    if sk == PROFILE_SORT_KEY:
+        item['doctor_name'] = delta['doctor_name']
+        item['procedure_codes'] = set(delta['procedure_codes'])
+        return item
+    item['procedure_count'] = delta['procedure_count']
+    item['total_cost'] = delta['total_cost']
+    for index, count in delta['buckets'].items():
+        item[f"{SKETCH_ATTRIBUTE_PREFIX}{index}"] = count
+    return item
+
+
+def aggregate_update(table_name, key, delta):
+    """
+    TransactWriteItems Update action that adds a delta to a stored aggregate.
+    """
+    pk, sk = key
+    update = {'TableName': table_name, 'Key': {'PK': pk, 'SK': sk}}
+    if sk == PROFILE_SORT_KEY:
+        update['UpdateExpression'] = 'SET doctor_name = :doctor_name ADD procedure_codes :procedure_codes'
+        update['ExpressionAttributeValues'] = {
+            ':doctor_name': delta['doctor_name'],
+            ':procedure_codes': set(delta['procedure_codes'])
+        }
+        return {'Update': update}
+
+    names = {}
+    values = {':procedure_count': delta['procedure_count'], ':total_cost': delta['total_cost']}
+    additions = ['procedure_count :procedure_count', 'total_cost :total_cost']
+    for position, (index, count) in enumerate(sorted(delta['buckets'].items())):
+        names[f'#h{position}'] = f"{SKETCH_ATTRIBUTE_PREFIX}{index}"
+        values[f':h{position}'] = count
+        additions.append(f'#h{position} :h{position}')
+    update['UpdateExpression'] = 'ADD ' + ', '.join(additions)
+    update['ExpressionAttributeValues'] = values
+    if names:
+        update['ExpressionAttributeNames'] = names
+    return {'Update': update}
+
+
+def transaction_actions(table_name, items, stats_table_name=None, expires_at=None):
+    """
+    TransactWriteItems actions writing raw rows plus their aggregate updates.
+    The raw row puts come first, in `items` order, and only succeed for new keys,
+    so replaying a write can never count a row twice. Next come the idempotency key
+    claims, in `items` order, for the rows that carry an `idempotency_key`. Pass the
+    same `expires_at` for every attempt at a write, so the actions match its token.
+    """
+    stats_table_name = stats_table_name or STATS_TABLE_NAME
+    actions = [
+        {
+            'Put': {
+                'TableName': table_name,
+                'Item': item,
+                'ConditionExpression': 'attribute_not_exists(ProcedureTime)'
+            }
+        }
+        for item in items
+    ]
+    expires_at = expires_at or idempotency_expires_at()
+    actions += [idempotency_record_put(stats_table_name, item, expires_at) for item in items if item.get('idempotency_key')]
+    for key, delta in aggregate_rows(items).items():
+        actions.append(aggregate_update(stats_table_name, key, delta))
+    return actions
+
+
+def transaction_token(items, expires_at=None):
+    """
+    Idempotency token (ClientRequestToken) for a transaction: the same rows always get
+    the same token, so a retried call within DynamoDB's 10-minute window is a no-op.
+    Rows with idempotency keys also carry their claims' `expires_at`, so a later write
+    of the same rows (e.g. a redelivered message) never reuses the token with different claims.
+    """
+    keys = sorted(f"{item['DoctorName']}\n{item['ProcedureTime']}" for item in items)
+    if expires_at and any(item.get('idempotency_key') for item in items):
+        keys.append(str(expires_at))
+    return str(uuid.uuid5(_TOKEN_NAMESPACE, '\n'.join(keys)))
+
+
+def plan_transactions(rows):
+    """
+    Pack (row_id, item) pairs into transactions of rows sharing a partition key,
+    each within the TransactWriteItems action limit (one put per row, one per
+    idempotency key, plus the profile, the all-procedures stats and one stats
+    update per procedure code). Returns one list of transactions per partition:
+    a partition's transactions update the same aggregate items and conflict with
+    each other, so they must be written one after another.
+    """
+    by_partition = {}
+    for row in rows:
+        by_partition.setdefault(row[1]['DoctorName'], []).append(row)
+
+    partitions = []
+    for partition_rows in by_partition.values():
+        transactions = []
+        current = []
+        codes = set()
+        claims = 0
+        for row in partition_rows:
+            row_codes = codes | {row[1]['procedure_code']}
+            row_claims = 1 if row[1].get('idempotency_key') else 0
+            if current and len(current) + 1 + claims + row_claims + 2 + len(row_codes) > MAX_TRANSACTION_ACTIONS:
+                transactions.append(current)
+                current = []
+                row_codes = {row[1]['procedure_code']}
+                claims = 0
+            current.append(row)
+            codes = row_codes
+            claims += row_claims
+        if current:
+            transactions.append(current)
+        partitions.append(transactions)
+    return partitions
@@ -0,0 +1,115 @@
+"""
+Write-behind queue for procedure additions.
+
+In AWS the queue is SQS (PROCEDURE_QUEUE_URL, and PROCEDURE_DEAD_LETTER_QUEUE_URL for
+messages that can never be written). Locally, PROCEDURE_QUEUE_FILE
+selects a file-backed queue (one JSON message per line), and with neither set
+messages are kept in process memory. Consumers receive messages as SQS-style
+records, so the same handler drains every backend.
+"""
+import json
+import os
+import threading
+import uuid
+
+QUEUE_URL = os.environ.get('PROCEDURE_QUEUE_URL')
+DEAD_LETTER_QUEUE_URL = os.environ.get('PROCEDURE_DEAD_LETTER_QUEUE_URL')
+QUEUE_FILE = os.environ.get('PROCEDURE_QUEUE_FILE')
+
+_sqs_client = None
+_memory_queue = []
+_memory_dead_letters = []
+_local_lock = threading.Lock()
+
+
+def _get_sqs_client():
+    global _sqs_client
+    if _sqs_client is None:
+        # Imported here so that functions which never enqueue don't load boto3
+        import aws_clients
+        _sqs_client = aws_clients.client('sqs')
+    return _sqs_client
+
+
+def queue_backend():
+    """
+    Name of the active queue backend: 'sqs', 'file' or 'memory'. Either SQS URL selects
+    SQS, so a consumer given only the dead-letter queue never parks messages in memory.
+    """
+    if QUEUE_URL or DEAD_LETTER_QUEUE_URL:
+        return 'sqs'
+    if QUEUE_FILE:
+        return 'file'
+    return 'memory'
+
+
+def enqueue_procedure(message):
+    """
+    Enqueue a validated procedure message. Returns the message ID.
+    """
+    body = json.dumps(message)
+    backend = queue_backend()
+
+    if backend == 'sqs':
+        response = _get_sqs_client().send_message(QueueUrl=QUEUE_URL, MessageBody=body)
+        return response['MessageId']
+
+    message_id = str(uuid.uuid4())
+    record = {'messageId': message_id, 'body': body}
+    with _local_lock:
+        if backend == 'file':
+            with open(QUEUE_FILE, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        else:
+            _memory_queue.append(record)
+    return message_id
+
+
+def dead_letter_procedure(message, reason):
+    """
+    Park a message that can never be written (e.g. an ambiguous doctor name) for manual review.
+    Returns False when no dead-letter destination is available.
+    """
+    body = json.dumps(dict(message, failureReason=reason))
+
+    if queue_backend() == 'sqs':
+        if not DEAD_LETTER_QUEUE_URL:
+            return False
+        _get_sqs_client().send_message(QueueUrl=DEAD_LETTER_QUEUE_URL, MessageBody=body)
+        return True
+
+    with _local_lock:
+        if queue_backend() == 'file':
+            with open(QUEUE_FILE + '.dead', 'a') as f:
+                f.write(body + '\n')
+        else:
+            _memory_dead_letters.append(json.loads(body))
+    return True
+
+
+def drain_local_queue(max_messages=100):
+    """
+    Remove up to `max_messages` records from the local (file or memory) queue
+    and return them as an SQS-style event for the queue consumer handler.
+    """
+    with _local_lock:
+        if queue_backend() == 'file':
+            if not os.path.exists(QUEUE_FILE):
+                return {'Records': []}
+            with open(QUEUE_FILE) as f:
+                lines = [line for line in f if line.strip()]
+            records = [json.loads(line) for line in lines[:max_messages]]
+            with open(QUEUE_FILE, 'w') as f:
+                f.writelines(lines[max_messages:])
+        else:
+            records = _memory_queue[:max_messages]
+            del _memory_queue[:max_messages]
+
+    return {'Records': [dict(record, eventSource='local:procedure-queue') for record in records]}
+
+
+def local_dead_letters():
+    """
+    Messages parked by dead_letter_procedure on the in-memory backend.
+    """
+    return list(_memory_dead_letters)
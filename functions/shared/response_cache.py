@@ -0,0 +1,41 @@
+"""
+Per-container cache of answers, keyed on normalized request parameters.
+
+Each entry records the data version it was computed from (e.g. a fingerprint of
+the doctor's aggregates). A lookup must present the current version, so an entry
+is discarded as soon as the underlying data changes, as well as after its TTL.
+The oldest entries are evicted once `max_entries` is reached.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+
+    def __init__(self, ttl_seconds, max_entries, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        """The cached value for `key` if it is fresh and was stored for `version`, else None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, stored_version, value = entry
+            if stored_version != version or self.clock() - stored_at >= self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (self.clock(), version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
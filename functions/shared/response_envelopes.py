@@ -0,0 +1,69 @@
+"""
+Response envelopes shared by the procedure functions.
+
+Each function answers both API Gateway and Bedrock agent action groups. `build_response`
+wraps a result in the envelope the caller expects and serializes the body once.
+DynamoDB numbers (Decimal) are written directly, so handlers don't need to convert
+each field with float(). orjson is used when it is installed, the standard json
+module otherwise; both produce the same compact output.
+"""
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_GATEWAY_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+def is_bedrock_agent_event(event):
+    """Bedrock agent action group events carry the agent, action group, parameters and message version"""
+    return (
+        'agent' in event and
+        'actionGroup' in event and
+        'parameters' in event and
+        'messageVersion' in event
+    )
+
+
+def json_default(value):
+    """Decimals are written as floats, as the handlers' float() conversions did"""
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def to_json(value):
+    """Serialize `value` to a JSON string, with the fast backend when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default).decode('utf-8')
+    return json.dumps(value, default=json_default, separators=(',', ':'), ensure_ascii=False)
+
+
+def build_response(event, is_bedrock_agent, status_code, body, action_group, api_path, http_method='GET'):
+    """
+    Wrap `body` in the Bedrock action group envelope or the API Gateway one.
+    The action group, API path and method echo the event's, falling back to the given defaults.
+    """
+    if is_bedrock_agent:
+        return {
+            'messageVersion': '1.0',
+            'response': {
+                'actionGroup': event.get('actionGroup', action_group),
+                'apiPath': event.get('apiPath', api_path),
+                'httpMethod': event.get('httpMethod', http_method),
+                'httpStatusCode': status_code,
+                'responseBody': {
+                    'application/json': {
+                        'body': to_json(body)
+                    }
+                }
+            }
+        }
+    return {
+        'statusCode': status_code,
+        'headers': dict(API_GATEWAY_HEADERS),
+        'body': to_json(body)
+    }
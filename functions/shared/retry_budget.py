@@ -0,0 +1,129 @@
+"""
+Client-side rate limiting and deadline-aware retries for calls to rate-limited services.
+
+TokenBucket limits how fast one Lambda container starts calls (a refill rate with
+a burst allowance); DynamoDBTokenBucket applies the same limit across every
+container through one DynamoDB item. Deadlines are time.monotonic() values derived from the Lambda
+context, so a retry loop can tell whether another attempt still fits before the
+function times out. backoff_delay uses "full jitter", so containers throttled at
+the same moment do not retry in lockstep.
+"""
+import random
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, and bursts of up to `capacity`.
+    Thread-safe; one instance is shared by every request a container serves.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """
+        Take a token if one is available. Returns 0 on success, otherwise the
+        number of seconds until the next token.
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+class DynamoDBTokenBucket:
+    """
+    A TokenBucket kept in one DynamoDB item (partition key `PK`), shared by every
+    container. Each acquisition reads the item and writes it back on condition that
+    its version is unchanged; a write that loses the race retries with fresh state.
+    Raises ClientError when the table can't be read or written.
+    """
+
+    def __init__(self, table, key, rate, capacity, clock=time.time, max_conflicts=3):
+        self.table = table
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.max_conflicts = max_conflicts
+
+    def try_acquire(self):
+        """
+        Take a token if one is available. Returns 0 on success, otherwise the
+        number of seconds until the next token.
+        """
+        for _ in range(self.max_conflicts):
+            item = self.table.get_item(Key={'PK': self.key}, ConsistentRead=True).get('Item')
+            now = self.clock()
+            if item is None:
+                tokens, version = self.capacity, 0
+            else:
+                elapsed = max(0, now - float(item['updatedAt']))  # Container clocks can disagree slightly
+                tokens = min(self.capacity, float(item['tokens']) + elapsed * self.rate)
+                version = int(item['version'])
+            if tokens < 1:
+                return (1 - tokens) / self.rate if self.rate > 0 else float('inf')
+
+            condition = {'ConditionExpression': 'attribute_not_exists(PK)'}
+            if item is not None:
+                condition = {
+                    'ConditionExpression': '#version = :version',
+                    'ExpressionAttributeNames': {'#version': 'version'},
+                    'ExpressionAttributeValues': {':version': version}
+                }
+            try:
+                self.table.put_item(
+                    Item={
+                        'PK': self.key,
+                        'tokens': Decimal(str(round(tokens - 1, 6))),
+                        'updatedAt': Decimal(str(round(now, 6))),
+                        'version': version + 1
+                    },
+                    **condition
+                )
+                return 0
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        # Still losing races after max_conflicts reads: the bucket is busy, so report a short wait
+        return 1 / self.rate if self.rate > 0 else float('inf')
+
+
+def request_deadline(context, reserve_ms=0):
+    """
+    time.monotonic() by which retries must stop, leaving `reserve_ms` of the invocation
+    for whatever runs afterwards. None when the context has no remaining-time budget.
+    """
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining is None:
+        return None
+    return time.monotonic() + (get_remaining() - reserve_ms) / 1000
+
+
+def remaining_seconds(deadline):
+    """Seconds left before `deadline`; infinite when there is none"""
+    if deadline is None:
+        return float('inf')
+    return deadline - time.monotonic()
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
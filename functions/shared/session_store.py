@@ -0,0 +1,87 @@
+"""
+Server-side conversation state, keyed by sessionId.
+
+A session holds the context resolved so far, not the transcript:
+- the most recent doctors and procedure codes, newest first
+- the last intent
+- a running summary of the last few turns
+
+update_session applies one turn, so the state (and any prompt built from it) stays
+the same size however long the conversation runs.
+
+DynamoDBSessionStore keeps sessions in a table with a TTL attribute.
+InMemorySessionStore is a per-process stand-in for local runs and tests.
+"""
+import time
+
+SESSION_TTL_SECONDS = 24 * 60 * 60
+MAX_CONTEXT_ENTITIES = 5
+SUMMARY_TURNS = 3
+SUMMARY_TEXT_LIMIT = 120
+
+
+def new_session():
+    return {'doctors': [], 'procedures': [], 'lastIntent': None, 'summary': [], 'turns': 0}
+
+
+def _remember(values, value):
+    """`value` moved to the front of `values`, keeping at most MAX_CONTEXT_ENTITIES"""
+    if not value:
+        return values
+    return ([value] + [existing for existing in values if existing != value])[:MAX_CONTEXT_ENTITIES]
+
+
+def _clip(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= SUMMARY_TEXT_LIMIT else text[:SUMMARY_TEXT_LIMIT - 3] + '...'
+
+
+def update_session(session, user_text, extracted, response):
+    """
+    The session after one turn: the turn's doctor, code and intent become the most
+    recent context, and the exchange replaces the oldest one in the summary.
+    """
+    summary = session['summary'] + [f"User: {_clip(user_text)}", f"Assistant: {_clip(response)}"]
+    return {
+        'doctors': _remember(session['doctors'], extracted.get('doctorName')),
+        'procedures': _remember(session['procedures'], extracted.get('procedureCode')),
+        'lastIntent': extracted.get('intent') or session['lastIntent'],
+        'summary': summary[-2 * SUMMARY_TURNS:],
+        'turns': session['turns'] + 1
+    }
+
+
+class InMemorySessionStore:
+
+    def __init__(self):
+        self.sessions = {}
+
+    def load(self, session_id):
+        return self.sessions.get(session_id)
+
+    def save(self, session_id, session):
+        self.sessions[session_id] = session
+
+
+class DynamoDBSessionStore:
+
+    def __init__(self, table, ttl_seconds=SESSION_TTL_SECONDS):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, session_id):
+        item = self.table.get_item(Key={'SessionId': session_id}, ConsistentRead=True).get('Item')
+        if not item:
+            return None
+        return {
+            'doctors': list(item.get('doctors', [])),
+            'procedures': list(item.get('procedures', [])),
+            'lastIntent': item.get('lastIntent'),
+            'summary': list(item.get('summary', [])),
+            'turns': int(item.get('turns', 0))
+        }
+
+    def save(self, session_id, session):
+        item = {'SessionId': session_id, 'expiresAt': int(time.time()) + self.ttl_seconds}
+        item.update({key: value for key, value in session.items() if value is not None})
+        self.table.put_item(Item=item)
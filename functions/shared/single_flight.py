@@ -0,0 +1,137 @@
+"""
+Request coalescing ("single flight"): concurrent calls with the same key share one
+execution and its result.
+
+SingleFlight coalesces threads within one process. lease_flight coalesces across
+processes, e.g. Lambda containers, through a short-lived lease item in DynamoDB:
+- The first caller to create the lease runs the function and writes the result
+  to the item.
+- Callers that find a live lease poll the item for the result instead.
+- If the leader fails, or the result doesn't arrive within `wait_seconds`, a
+  waiting caller runs the function itself.
+Results shared through a lease must be JSON-serializable.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from structured_log import get_logger
+
+log = get_logger('single_flight')
+
+LEASE_KEY_PREFIX = 'LEASE#'
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call with the same key is already running, in which case wait
+        for it instead. Returns (result, shared) where shared means another call ran fn.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+def lease_key(key):
+    """Lease item key for any JSON-serializable request key"""
+    return LEASE_KEY_PREFIX + hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def lease_flight(table, key, fn, owner, lease_seconds=30, result_seconds=5, wait_seconds=10, poll_interval=0.1):
+    """
+    Run fn() once across every caller sharing `table` and `key`.
+    Returns (result, shared) where shared means another caller ran fn.
+    """
+    item_key = {'PK': lease_key(key)}
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={**item_key, 'owner': owner, 'expiresAt': now + lease_seconds},
+            ConditionExpression='attribute_not_exists(PK) OR expiresAt < :now',
+            ExpressionAttributeValues={':now': now}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            log.warning('Could not take coalescing lease, running uncoalesced', error=str(e))
+            return fn(), False
+        shared = _wait_for_result(table, item_key, wait_seconds, poll_interval)
+        if shared is not None:
+            return json.loads(shared), True
+        log.info('Coalesced request has no result yet, running it here')
+        return fn(), False
+
+    try:
+        result = fn()
+    except Exception:
+        # Let waiting callers run it themselves rather than wait out the lease
+        try:
+            table.delete_item(Key=item_key, ConditionExpression='#owner = :owner',
+                              ExpressionAttributeNames={'#owner': 'owner'}, ExpressionAttributeValues={':owner': owner})
+        except ClientError:
+            pass
+        raise
+
+    try:
+        table.update_item(
+            Key=item_key,
+            UpdateExpression='SET #result = :result, expiresAt = :expires',
+            ConditionExpression='#owner = :owner',
+            ExpressionAttributeNames={'#result': 'result', '#owner': 'owner'},
+            ExpressionAttributeValues={':result': json.dumps(result), ':expires': int(time.time()) + result_seconds, ':owner': owner}
+        )
+    except ClientError as e:
+        # The lease expired and was taken over; the new leader answers its own waiters
+        log.warning('Could not publish coalesced result', error=str(e))
+    return result, False
+
+
+def _wait_for_result(table, item_key, wait_seconds, poll_interval):
+    """The leader's JSON result, or None if the lease disappears or the wait runs out"""
+    give_up_at = time.monotonic() + wait_seconds
+    while time.monotonic() < give_up_at:
+        try:
+            item = table.get_item(Key=item_key, ConsistentRead=True).get('Item')
+        except ClientError as e:
+            log.warning('Could not read coalescing lease', error=str(e))
+            return None
+        if item is None:
+            return None
+        if 'result' in item:
+            return item['result']
+        time.sleep(poll_interval)
+    return None
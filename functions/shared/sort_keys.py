@@ -0,0 +1,91 @@
+"""
+Collision-free ProcedureTime sort keys.
+
+A sort key is the ISO 8601 logged time followed by a ULID-style suffix,
+e.g. "2025-07-31T10:30:00Z#01J3Q8Z6V4K9M2N5P7R8S0T1VW". Keys still sort by
+logged time, so time-range queries keep working, while two procedures logged
+in the same second for the same doctor no longer overwrite each other.
+Rows written before this scheme have a bare ISO time as their sort key.
+"""
+import hashlib
+import os
+import threading
+import time
+
+SORT_KEY_SEPARATOR = '#'
+
+# Sorts after every ULID character, so "<time>#~" bounds all keys for <time>
+SORT_KEY_MAX_SUFFIX = '~'
+
+# Crockford base32, as used by ULID
+ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_ulid_lock = threading.Lock()
+_last_ulid_ms = -1
+_last_ulid_random = 0
+
+
+def _encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(ULID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def new_ulid():
+    """
+    Generate a monotonic ULID: 48-bit millisecond timestamp + 80 bits of randomness.
+    Within the same millisecond the random part is incremented, so IDs generated
+    by one container are strictly increasing.
+    """
+    global _last_ulid_ms, _last_ulid_random
+
+    with _ulid_lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ulid_ms:
+            now_ms = _last_ulid_ms
+            _last_ulid_random = (_last_ulid_random + 1) & ((1 << 80) - 1)
+        else:
+            _last_ulid_ms = now_ms
+            _last_ulid_random = int.from_bytes(os.urandom(10), 'big')
+        return _encode_base32(now_ms, 10) + _encode_base32(_last_ulid_random, 16)
+
+
+def idempotent_suffix(idempotency_key):
+    """
+    Deterministic 26-character suffix for a client idempotency key, so a retried
+    request produces the same sort key as the original.
+    """
+    digest = int.from_bytes(hashlib.sha256(idempotency_key.encode('utf-8')).digest()[:17], 'big')
+    return _encode_base32(digest, 26)
+
+
+def make_sort_key(logged_time, idempotency_key=None):
+    """
+    Build a unique ProcedureTime sort key for a normalized ISO logged time.
+    With an idempotency key the suffix is derived from the key instead of a new ULID.
+    """
+    suffix = idempotent_suffix(idempotency_key) if idempotency_key else new_ulid()
+    return f"{logged_time}{SORT_KEY_SEPARATOR}{suffix}"
+
+
+def is_legacy_sort_key(sort_key):
+    """
+    True for sort keys written before the unique suffix was introduced.
+    """
+    return SORT_KEY_SEPARATOR not in sort_key
+
+
+def logged_time_from_sort_key(sort_key):
+    """
+    Strip the unique suffix from a sort key, returning the ISO logged time.
+    """
+    return sort_key.split(SORT_KEY_SEPARATOR, 1)[0]
+
+
+def sort_key_upper_bound(logged_time):
+    """
+    Inclusive upper bound covering every sort key logged at `logged_time`.
+    """
+    return f"{logged_time}{SORT_KEY_SEPARATOR}{SORT_KEY_MAX_SUFFIX}"
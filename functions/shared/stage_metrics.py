@@ -0,0 +1,151 @@
+"""
+Per-stage latency of a request, emitted as one CloudWatch Embedded Metric Format
+(EMF) record when the request finishes.
+
+    start_spans()                        at the start of an invocation
+    with span('nameResolution'): ...     time a stage; a stage timed twice is summed
+    timed_call('dynamodbQuery', table.query, **kwargs)
+                                         time one DynamoDB call and add its consumed capacity
+    emit_spans('get_quote', statusCode=200)
+                                         write the record and start over
+    emit_spans('intent_mapper', counts={'CircuitOpen': 1})
+                                         also record plain Count metrics
+
+CloudWatch turns every `<stage>Ms` and `<stage>CapacityUnits` field, and each of the
+`counts`, into a metric in METRICS_NAMESPACE with a FunctionName dimension. `<stage>Calls` and the properties
+passed to emit_spans stay searchable in Logs Insights. Calls made in parallel (shard
+fan-out) are summed, so a call stage can add up to more than the stage around it.
+
+Records are written by `sink`, stdout by default. Tests install a MemorySink. Like
+the structured logger, the spans belong to the one request a container handles at a
+time. Background work that outlives the request runs under `detached()`.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Metrics configuration
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DoctorProcedures')
+
+
+def print_record(record):
+    print(json.dumps(record, default=str))
+
+
+class MemorySink:
+    """Keeps emitted records in memory, for tests and local runs"""
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+
+class SpanRecorder:
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, elapsed_ms=0.0, capacity_units=None):
+        with self.lock:
+            totals = self.stages.setdefault(stage, {'ms': 0.0, 'calls': 0, 'capacityUnits': None})
+            totals['ms'] += elapsed_ms
+            totals['calls'] += 1
+            if capacity_units is not None:
+                totals['capacityUnits'] = (totals['capacityUnits'] or 0) + capacity_units
+
+
+sink = print_record
+_recorder = SpanRecorder()
+_thread = threading.local()
+
+
+def current_recorder():
+    return getattr(_thread, 'recorder', None) or _recorder
+
+
+def start_spans():
+    global _recorder
+    _recorder = SpanRecorder()
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_recorder().add(stage, (time.perf_counter() - start) * 1000)
+
+
+@contextmanager
+def detached():
+    """Record this thread's spans nowhere, for work that is not part of the current request"""
+    _thread.recorder = SpanRecorder()
+    try:
+        yield
+    finally:
+        _thread.recorder = None
+
+
+def consumed_capacity_units(response):
+    """Total capacity units in a DynamoDB response (one table or several), or None"""
+    consumed = response.get('ConsumedCapacity')
+    if consumed is None:
+        return None
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+
+
+def timed_call(stage, method, **kwargs):
+    """Call a DynamoDB client or resource method, timing it and recording its consumed capacity"""
+    kwargs.setdefault('ReturnConsumedCapacity', 'TOTAL')
+    start = time.perf_counter()
+    try:
+        response = method(**kwargs)
+    except Exception:
+        current_recorder().add(stage, (time.perf_counter() - start) * 1000)
+        raise
+    current_recorder().add(stage, (time.perf_counter() - start) * 1000, consumed_capacity_units(response))
+    return response
+
+
+def emf_record(function_name, stages, properties, counts=None):
+    """The EMF record for one request's stage totals and Count metrics"""
+    metrics = []
+    record = {}
+    for stage, totals in stages.items():
+        metrics.append({'Name': f'{stage}Ms', 'Unit': 'Milliseconds'})
+        record[f'{stage}Ms'] = round(totals['ms'], 3)
+        record[f'{stage}Calls'] = totals['calls']
+        if totals['capacityUnits'] is not None:
+            metrics.append({'Name': f'{stage}CapacityUnits', 'Unit': 'Count'})
+            record[f'{stage}CapacityUnits'] = totals['capacityUnits']
+    for name, value in (counts or {}).items():
+        metrics.append({'Name': name, 'Unit': 'Count'})
+        record[name] = value
+    record.update(properties)
+    record['FunctionName'] = function_name
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [['FunctionName']],
+            'Metrics': metrics
+        }]
+    }
+    return record
+
+
+def emit_spans(function_name, counts=None, **properties):
+    """Write the request's stage totals (and `counts` metrics) as one EMF record, then start a new request"""
+    recorder = current_recorder()
+    start_spans()
+    if METRICS_ENABLED and recorder.stages:
+        sink(emf_record(function_name, recorder.stages, properties, counts))
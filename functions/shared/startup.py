@@ -0,0 +1,83 @@
+"""
+Cold-start control for the Lambda functions.
+
+Importing boto3 and building the first DynamoDB resource take a few hundred
+milliseconds, most of a cold start. With STARTUP_MODE=lazy (the default) the
+handlers wrap their AWS clients, tables and heavy imports with `lazy`, and each one
+is built the first time it is used. A request rejected before it touches AWS never
+pays for them. STARTUP_MODE=eager builds everything at import instead, which suits
+provisioned concurrency, where init runs before any request arrives.
+
+    boto3 = lazy_import('boto3')
+    dynamodb = lazy(lambda: boto3.resource('dynamodb'))
+    table = lazy(lambda: dynamodb.Table(TABLE_NAME))
+
+A lazy value forwards attribute access, assignment and calls to the real object, so
+call sites are unchanged. It is built once, even when several threads use it first.
+Exception classes used in `except` clauses must be imported normally.
+"""
+import importlib
+import os
+import threading
+import weakref
+
+# 'lazy' builds clients and heavy imports on first use, 'eager' at import
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'lazy').lower()
+
+_pending = weakref.WeakSet()
+
+
+class Lazy:
+
+    __slots__ = ('_factory', '_value', '_lock', '__weakref__')
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_value', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def resolve(self):
+        """The real object, built on the first call"""
+        if self._factory is not None:
+            with self._lock:
+                if self._factory is not None:
+                    object.__setattr__(self, '_value', self._factory())
+                    object.__setattr__(self, '_factory', None)
+        return self._value
+
+    @property
+    def resolved(self):
+        return self._factory is None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return repr(self._value) if self.resolved else f'<lazy {self._factory!r}>'
+
+
+def lazy(factory):
+    """factory() now in eager mode, otherwise a Lazy that calls it on first use"""
+    if STARTUP_MODE == 'eager':
+        return factory()
+    value = Lazy(factory)
+    _pending.add(value)
+    return value
+
+
+def lazy_import(name):
+    """The module `name`, imported on first use in lazy mode"""
+    return lazy(lambda: importlib.import_module(name))
+
+
+def warm():
+    """Build every lazy value still in use, e.g. to measure what lazy mode deferred"""
+    for value in list(_pending):
+        value.resolve()
+        _pending.discard(value)
@@ -0,0 +1,107 @@
+"""
+Structured, sampled logging for the Lambda functions.
+
+Every record is one JSON line on stdout (which Lambda ships to CloudWatch) with the
+level, logger name, message, request id and the keyword fields passed to the call.
+Long strings and collections are truncated, so a record stays small however large
+the doctor catalog or a history grows. Configured through environment variables:
+
+    LOG_LEVEL              lowest level written: DEBUG, INFO, WARNING or ERROR (INFO)
+    LOG_DEBUG_SAMPLE_RATE  share of requests whose DEBUG records are written anyway (0)
+    LOG_MAX_FIELD_CHARS    strings are cut to this many characters (200)
+    LOG_MAX_FIELD_ITEMS    lists and dicts keep this many entries (10)
+    LOG_EVENT_PAYLOADS     write each incoming event as a DEBUG record (false)
+
+The sampling decision is made once per request in `start_request`, so a sampled
+request is logged in full and the others not at all. A Lambda container handles
+one request at a time, so the request state is shared by the threads it starts.
+"""
+import json
+import os
+import random
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+# Logging configuration
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0'))
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', '200'))
+LOG_MAX_FIELD_ITEMS = int(os.environ.get('LOG_MAX_FIELD_ITEMS', '10'))
+LOG_EVENT_PAYLOADS = os.environ.get('LOG_EVENT_PAYLOADS', 'false').lower() == 'true'
+
+_request = {'requestId': None, 'sampled': False}
+
+
+def start_request(context=None, sample=random.random):
+    """Record the request id and decide whether this request's DEBUG records are written"""
+    _request['requestId'] = getattr(context, 'aws_request_id', None)
+    _request['sampled'] = LOG_DEBUG_SAMPLE_RATE > 0 and sample() < LOG_DEBUG_SAMPLE_RATE
+
+
+def truncate(value, depth=0):
+    """A JSON-ready copy of `value` with long strings and collections cut short"""
+    if isinstance(value, str):
+        if len(value) > LOG_MAX_FIELD_CHARS:
+            return f"{value[:LOG_MAX_FIELD_CHARS]}...(+{len(value) - LOG_MAX_FIELD_CHARS} chars)"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if depth >= 3:
+        return truncate(str(value), depth)
+    if isinstance(value, dict):
+        kept = {str(key): truncate(item, depth + 1) for key, item in list(value.items())[:LOG_MAX_FIELD_ITEMS]}
+        if len(value) > LOG_MAX_FIELD_ITEMS:
+            kept['...'] = f"+{len(value) - LOG_MAX_FIELD_ITEMS} more"
+        return kept
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+        kept = [truncate(item, depth + 1) for item in items[:LOG_MAX_FIELD_ITEMS]]
+        if len(items) > LOG_MAX_FIELD_ITEMS:
+            kept.append(f"...(+{len(items) - LOG_MAX_FIELD_ITEMS} more)")
+        return kept
+    return truncate(str(value), depth)
+
+
+class StructuredLogger:
+
+    def __init__(self, name):
+        self.name = name
+
+    def enabled(self, level):
+        if LEVELS[level] >= LEVELS.get(LOG_LEVEL, LEVELS['INFO']):
+            return True
+        return level == 'DEBUG' and _request['sampled']
+
+    def log(self, level, message, **fields):
+        # Fields are only truncated and serialized when the record is written
+        if not self.enabled(level):
+            return
+        record = {'level': level, 'logger': self.name, 'message': message}
+        if _request['requestId']:
+            record['requestId'] = _request['requestId']
+        if _request['sampled']:
+            record['sampled'] = True
+        for key, value in fields.items():
+            record[key] = truncate(value)
+        print(json.dumps(record, default=str))
+
+    def debug(self, message, **fields):
+        self.log('DEBUG', message, **fields)
+
+    def info(self, message, **fields):
+        self.log('INFO', message, **fields)
+
+    def warning(self, message, **fields):
+        self.log('WARNING', message, **fields)
+
+    def error(self, message, **fields):
+        self.log('ERROR', message, **fields)
+
+    def event(self, event):
+        """The incoming event, at DEBUG and only when LOG_EVENT_PAYLOADS is on"""
+        if LOG_EVENT_PAYLOADS:
+            self.debug('Event received', event=event)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
@@ -1,15 +1,25 @@
 # filename: show_history_lambda.py
-import json
-import boto3
 import os
 from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Key, Attr
-from decimal import Decimal
-import difflib
+from startup import lazy, lazy_import
+import aws_clients
+from response_envelopes import is_bedrock_agent_event, build_response
+from structured_log import get_logger, start_request
+from stage_metrics import start_spans, span, timed_call, emit_spans
+from sort_keys import logged_time_from_sort_key, sort_key_upper_bound
+from doctor_shards import (
+    doctor_name_from_partition_key, read_partition_keys, fan_out, merge_partition_results, max_read_fan_out
+)
 
-dynamodb = boto3.resource('dynamodb')
+# Built on first use unless STARTUP_MODE=eager (see startup.py)
+conditions = lazy_import('boto3.dynamodb.conditions')
+difflib = lazy_import('difflib')
+
+# One pooled connection per shard a hot doctor's reads fan out across (see aws_clients.py)
+dynamodb = lazy(lambda: aws_clients.resource('dynamodb', max_pool_connections=max_read_fan_out()))
 TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'DoctorProcedures')
-table = dynamodb.Table(TABLE_NAME)
+table = lazy(lambda: dynamodb.Table(TABLE_NAME))
+log = get_logger('show_history')
 
 def find_best_doctor_match(input_name, threshold=0.4):
     """
@@ -18,12 +28,10 @@ def find_best_doctor_match(input_name, threshold=0.4):
     """
     try:
         # Get all unique doctor names from the table
-        response = table.scan(
-            ProjectionExpression='DoctorName'
-        )
+        response = timed_call('dynamodbScan', table.scan, ProjectionExpression='DoctorName')
         
-        all_doctors = list(set(item['DoctorName'] for item in response.get('Items', [])))
-        print(f"Available doctors: {all_doctors}")
+        all_doctors = list(set(doctor_name_from_partition_key(item['DoctorName']) for item in response.get('Items', [])))
+        log.debug('Doctor catalog', count=len(all_doctors), doctors=all_doctors)
         
         if not all_doctors:
             return None, 0
@@ -34,7 +42,7 @@ def find_best_doctor_match(input_name, threshold=0.4):
         # Try exact case-insensitive match first
         for doctor in all_doctors:
             if doctor.lower() == input_normalized:
-                print(f"Exact match found: {doctor}")
+                log.info('Exact doctor match', doctor=doctor)
                 return doctor, 1.0
         
         # Try partial matching (if input is contained in doctor name or vice versa)
@@ -44,7 +52,7 @@ def find_best_doctor_match(input_name, threshold=0.4):
                 # Calculate confidence based on length similarity
                 confidence = min(len(input_normalized), len(doctor_normalized)) / max(len(input_normalized), len(doctor_normalized))
                 if confidence >= threshold:
-                    print(f"Partial match found: {doctor} (confidence: {confidence:.2f})")
+                    log.info('Partial doctor match', doctor=doctor, confidence=round(confidence, 2))
                     return doctor, confidence
         
         # Use fuzzy matching for typos and spelling mistakes
@@ -61,30 +69,95 @@ def find_best_doctor_match(input_name, threshold=0.4):
             for doctor in all_doctors:
                 if doctor.lower() == matched_normalized:
                     confidence = difflib.SequenceMatcher(None, input_normalized, matched_normalized).ratio()
-                    print(f"Fuzzy match found: {doctor} (confidence: {confidence:.2f})")
+                    log.info('Fuzzy doctor match', doctor=doctor, confidence=round(confidence, 2))
                     return doctor, confidence
         
-        print(f"No good match found for: {input_name}")
+        log.info('No doctor match', input=input_name)
         return None, 0
         
     except Exception as e:
-        print(f"Error in find_best_doctor_match: {e}")
+        log.error('Doctor match failed', error=str(e))
         return None, 0
 
+def build_history_key_condition(partition_key, start_time=None, end_time=None, since=None):
+    """
+    Build the Query key condition for a doctor's history window in one partition.
+    `since` is an exclusive lower bound (a previously returned sort key), while
+    `start_time`/`end_time` are inclusive ISO times; the upper bound is widened so
+    suffixed sort keys logged exactly at `end_time` still match. Returns (key_condition, excluded_sort_key);
+    DynamoDB has no exclusive BETWEEN, so when `since` is combined with an upper
+    bound the caller must drop the row whose sort key equals `excluded_sort_key`.
+    Returns (None, None) when the window is empty (its lower bound is after `end_time`),
+    since DynamoDB rejects a BETWEEN whose bounds are out of order.
+    """
+    key_condition = conditions.Key('DoctorName').eq(partition_key)
+    if end_time:
+        end_time = sort_key_upper_bound(end_time)
+
+    lower, lower_exclusive = start_time, False
+    if since and (not start_time or since >= start_time):
+        lower, lower_exclusive = since, True
+
+    if lower and end_time:
+        if lower > end_time:
+            return None, None
+        key_condition = key_condition & conditions.Key('ProcedureTime').between(lower, end_time)
+        return key_condition, (lower if lower_exclusive else None)
+    if lower:
+        if lower_exclusive:
+            return key_condition & conditions.Key('ProcedureTime').gt(lower), None
+        return key_condition & conditions.Key('ProcedureTime').gte(lower), None
+    if end_time:
+        return key_condition & conditions.Key('ProcedureTime').lte(end_time), None
+    return key_condition, None
+
+def query_history(key_condition, limit, newest_first=True, excluded_sort_key=None):
+    """
+    Page through a key-condition Query until `limit` rows are collected.
+    Returns (items, has_more) where items are in query order.
+    """
+    items = []
+    query_kwargs = {
+        'TableName': TABLE_NAME,
+        'KeyConditionExpression': key_condition,
+        'ScanIndexForward': not newest_first
+    }
+
+    # Ask for one extra row so we can tell the client whether more remain
+    target = limit + 1
+    while True:
+        query_kwargs['Limit'] = target - len(items) + (1 if excluded_sort_key else 0)
+        # The resource's client is safe to share across the fan-out threads
+        response = timed_call('dynamodbQuery', table.meta.client.query, **query_kwargs)
+
+        for item in response.get('Items', []):
+            if excluded_sort_key and item['ProcedureTime'] == excluded_sort_key:
+                continue
+            items.append(item)
+
+        last_key = response.get('LastEvaluatedKey')
+        if len(items) >= target or not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+    return items[:limit], len(items) > limit
+
+def respond(event, is_bedrock_agent, status_code, body):
+    """Answer in the envelope the caller expects, and emit the request's stage timings"""
+    with span('response'):
+        response = build_response(event, is_bedrock_agent, status_code, body, 'ShowHistoryGroup', '/showHistory')
+    emit_spans('show_history', statusCode=status_code, bedrockAgent=is_bedrock_agent)
+    return response
+
 def lambda_handler(event, context):
+    is_bedrock_agent = False
+    start_request(context)
+    start_spans()
     try:
-        # Debug: print the event to understand Bedrock Agent invocation format
-        print(f"Event received: {json.dumps(event)}")
+        log.event(event)
         
-        # Detect Bedrock Agent by checking for agent and parameters structure
-        is_bedrock_agent = (
-            'agent' in event and 
-            'actionGroup' in event and 
-            'parameters' in event and
-            'messageVersion' in event
-        )
-        
-        print(f"Detected Bedrock Agent: {is_bedrock_agent}")
+        is_bedrock_agent = is_bedrock_agent_event(event)
+        log.info('Request received', bedrockAgent=is_bedrock_agent)
         
         # Handle Bedrock Agent parameters vs API Gateway parameters
         if is_bedrock_agent:
@@ -94,6 +167,7 @@ def lambda_handler(event, context):
             limit = parameters.get('limit', 5)
             start_date = parameters.get('startDate')
             end_date = parameters.get('endDate')
+            since = parameters.get('since')
         else:
             # Handle API Gateway query parameters
             query_params = event.get('queryStringParameters') or {}
@@ -101,120 +175,91 @@ def lambda_handler(event, context):
             limit = query_params.get('limit', 5)
             start_date = query_params.get('startDate')
             end_date = query_params.get('endDate')
+            since = query_params.get('since')
 
         if not doctor_name:
-            error_message = 'Missing required parameter: doctorName.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                        'apiPath': event.get('apiPath', '/showHistory'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 400,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 400, {'message': 'Missing required parameter: doctorName.'})
 
         # Find the best matching doctor name using fuzzy matching
-        print(f"Original doctor name input: {doctor_name}")
-        matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
+        with span('nameResolution'):
+            matched_doctor_name, confidence = find_best_doctor_match(doctor_name)
         
         if not matched_doctor_name:
             error_message = f'No doctor found matching "{doctor_name}". Please check the spelling and try again.'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                        'apiPath': event.get('apiPath', '/showHistory'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 404,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 404, {'message': error_message})
         
         # Use the matched doctor name for the query
         original_input = doctor_name
         doctor_name = matched_doctor_name
-        print(f"Using matched doctor name: {doctor_name} (confidence: {confidence:.2f})")
+        log.info('Using matched doctor', input=original_input, doctor=doctor_name, confidence=round(confidence, 2))
 
         try:
             limit = int(limit)
         except (ValueError, TypeError):
             limit = 5
 
-        # Build filter expression
-        filter_expression = Attr('DoctorName').eq(doctor_name)
+        # Resolve the sort key window for the Query
+        start_time = None
+        end_time = None
         
         if start_date:
             try:
                 start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                filter_expression = filter_expression & Attr('ProcedureTime').gte(start_dt.isoformat().replace('+00:00', 'Z'))
+                start_time = start_dt.isoformat().replace('+00:00', 'Z')
             except ValueError:
                 error_message = 'Invalid startDate format. Use ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SSZ).'
-                if is_bedrock_agent:
-                    return {
-                        'messageVersion': '1.0',
-                        'response': {
-                            'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                            'apiPath': event.get('apiPath', '/showHistory'),
-                            'httpMethod': event.get('httpMethod', 'GET'),
-                            'httpStatusCode': 400,
-                            'responseBody': {
-                                'application/json': {
-                                    'body': json.dumps({'message': error_message})
-                                }
-                            }
-                        }
-                    }
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'message': error_message})
-                    }
+                return respond(event, is_bedrock_agent, 400, {'message': error_message})
         
         if end_date:
             try:
                 end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                filter_expression = filter_expression & Attr('ProcedureTime').lte(end_dt.isoformat().replace('+00:00', 'Z'))
+                end_time = end_dt.isoformat().replace('+00:00', 'Z')
             except ValueError:
                 error_message = 'Invalid endDate format. Use ISO 8601 (e.g., YYYY-MM-DDTHH:MM:SSZ).'
-                if is_bedrock_agent:
-                    return {'message': error_message}
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'message': error_message})
-                    }
+                return respond(event, is_bedrock_agent, 400, {'message': error_message})
 
-        response = table.scan(
-            FilterExpression=filter_expression
-        )
+        # `since` is the watermark a client got back from a previous call; it is
+        # compared as an opaque sort key so clients can echo it back unchanged
+        # Incremental syncs walk forward from the watermark so that paging with
+        # the returned watermark never skips rows; regular calls want the newest rows
+        newest_first = not since
 
-        items = response.get('Items', [])
+        def query_partition(partition_key):
+            key_condition, excluded_sort_key = build_history_key_condition(
+                partition_key, start_time=start_time, end_time=end_time, since=since
+            )
+            if key_condition is None:
+                return [], False
+            return query_history(
+                key_condition,
+                limit,
+                newest_first=newest_first,
+                excluded_sort_key=excluded_sort_key
+            )
+
+        # Hot doctors are sharded across several partitions; query them all and merge
+        with span('historyQuery'):
+            partition_results = fan_out(query_partition, read_partition_keys(doctor_name))
+        with span('aggregation'):
+            items, has_more = merge_partition_results(partition_results, limit, newest_first=newest_first)
+
+        if not items and since:
+            message = f'No new procedures for {doctor_name} since {since}.'
+            
+            # Add fuzzy match note if confidence is less than perfect
+            if confidence < 1.0:
+                message += f' (Note: Matched "{doctor_name}" from your input "{original_input}")'
+            result_data = {
+                'message': message,
+                'doctorName': doctor_name,
+                'procedureCount': 0,
+                'totalCost': 0,
+                'matchConfidence': confidence,
+                'history': [],
+                'watermark': since,
+                'hasMore': False
+            }
+            return respond(event, is_bedrock_agent, 200, result_data)
 
         if not items:
             error_message = f'No procedure history found for {doctor_name}.'
@@ -222,105 +267,46 @@ def lambda_handler(event, context):
             # Add fuzzy match note if confidence is less than perfect
             if confidence < 1.0:
                 error_message += f' (Note: Matched "{doctor_name}" from your input "{original_input}")'
-            if is_bedrock_agent:
-                return {
-                    'messageVersion': '1.0',
-                    'response': {
-                        'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                        'apiPath': event.get('apiPath', '/showHistory'),
-                        'httpMethod': event.get('httpMethod', 'GET'),
-                        'httpStatusCode': 404,
-                        'responseBody': {
-                            'application/json': {
-                                'body': json.dumps({'message': error_message})
-                            }
-                        }
-                    }
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': error_message})
-                }
+            return respond(event, is_bedrock_agent, 404, {'message': error_message})
 
-        # Sort by procedure time (most recent first) and limit
-        items = sorted(items, key=lambda x: x['ProcedureTime'], reverse=True)[:limit]
-        
-        total_cost = sum(float(item['cost']) for item in items)
-        
-        history = []
-        for item in items:
-            history.append({
-                'procedure': item.get('procedure_name', item.get('procedure_code', 'Unknown')),
-                'time': item['ProcedureTime'],
-                'cost': float(item['cost'])
-            })
+        with span('aggregation'):
+            # The newest returned sort key is the watermark for the next incremental call
+            watermark = max(item['ProcedureTime'] for item in items)
+
+            # Sort by procedure time: most recent first, or oldest first for incremental calls
+            items = sorted(items, key=lambda x: x['ProcedureTime'], reverse=newest_first)
+            
+            # Costs stay Decimal; the response serializer writes them as numbers
+            total_cost = sum(item['cost'] for item in items)
+            
+            history = []
+            for item in items:
+                history.append({
+                    'procedure': item.get('procedure_name', item.get('procedure_code', 'Unknown')),
+                    'time': item.get('time_logged') or logged_time_from_sort_key(item['ProcedureTime']),
+                    'cost': item['cost']
+                })
 
-        message = f'Found {len(history)} procedures for {doctor_name}.'
+        if since:
+            message = f'Found {len(history)} new procedures for {doctor_name} since {since}.'
+        else:
+            message = f'Found {len(history)} procedures for {doctor_name}.'
         
         # Add fuzzy match note if confidence is less than perfect
         if confidence < 1.0:
             message += f' (Note: Matched "{doctor_name}" from your input "{original_input}")'
         
-        if is_bedrock_agent:
-            return {
-                'messageVersion': '1.0',
-                'response': {
-                    'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                    'apiPath': event.get('apiPath', '/showHistory'),
-                    'httpMethod': event.get('httpMethod', 'GET'),
-                    'httpStatusCode': 200,
-                    'responseBody': {
-                        'application/json': {
-                            'body': json.dumps({
-                                'message': message,
-                                'doctorName': doctor_name,
-                                'procedureCount': len(history),
-                                'totalCost': total_cost,
-                                'matchConfidence': confidence,
-                                'history': history
-                            })
-                        }
-                    }
-                }
-            }
-        else:
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'message': message,
-                    'doctorName': doctor_name,
-                    'procedureCount': len(history),
-                    'totalCost': total_cost,
-                    'matchConfidence': confidence,
-                    'history': history
-                })
-            }
+        return respond(event, is_bedrock_agent, 200, {
+            'message': message,
+            'doctorName': doctor_name,
+            'procedureCount': len(history),
+            'totalCost': total_cost,
+            'matchConfidence': confidence,
+            'history': history,
+            'watermark': watermark,
+            'hasMore': has_more
+        })
 
     except Exception as e:
-        print(f"Error in showHistoryLambda: {e}")
-        error_message = f'Internal server error: {str(e)}'
-        
-        if 'is_bedrock_agent' in locals() and is_bedrock_agent:
-            return {
-                'messageVersion': '1.0',
-                'response': {
-                    'actionGroup': event.get('actionGroup', 'ShowHistoryGroup'),
-                    'apiPath': event.get('apiPath', '/showHistory'),
-                    'httpMethod': event.get('httpMethod', 'GET'),
-                    'httpStatusCode': 500,
-                    'responseBody': {
-                        'application/json': {
-                            'body': json.dumps({'message': error_message})
-                        }
-                    }
-                }
-            }
-        else:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': error_message})
-            }
\ No newline at end of file
+        log.error('showHistory failed', error=str(e))
+        return respond(event, is_bedrock_agent, 500, {'message': f'Internal server error: {str(e)}'})
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+Local Intent Mapper Streaming Server
+Serves the intent mapper over plain HTTP so streamed agent output can be watched
+(and tested) locally. The Python Lambda runtime cannot stream responses through
+API Gateway, so there is no deployed stream route; this server relays each event
+as soon as it is produced, using chunked transfer encoding.
+
+    POST /intent-mapper          -> the JSON response, as from API Gateway
+    POST /intent-mapper/batch    -> the JSON batch response, as from API Gateway
+    POST /intent-mapper/stream   -> text/event-stream: chunk..., [replace], metadata
+
+Uses the same environment variables as the Lambda (BEDROCK_AGENT_ID, ...) and your
+local AWS credentials.
+
+    python3 intent_stream_server.py --port 8787
+"""
+
+import os
+import sys
+import uuid
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'functions', 'shared'))
+sys.path.append(os.path.join(ROOT, 'functions', 'bedrock_intent_mapper_lambda'))
+
+import bedrock_intent_mapper_lambda as mapper
+
+
+class LocalContext:
+    """The parts of the Lambda context the intent mapper uses"""
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+class IntentMapperRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path not in ('/intent-mapper', '/intent-mapper/stream', '/intent-mapper/batch'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        event = {'path': path, 'body': self.rfile.read(length).decode('utf-8')}
+
+        if path != '/intent-mapper/stream':
+            response = mapper.lambda_handler(event, LocalContext())
+            body = response['body'].encode('utf-8')
+            self.send_response(response['statusCode'])
+            for name, value in response['headers'].items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for sse_event in mapper.stream_intent_events(event, LocalContext()):
+            data = sse_event.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+def make_server(host='127.0.0.1', port=8787):
+    """An HTTP server for the intent mapper; port 0 picks a free port"""
+    return ThreadingHTTPServer((host, port), IntentMapperRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the intent mapper, including its streaming route, locally.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8787, help='Port to listen on')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"🚀 Intent mapper listening on http://{args.host}:{server.server_port}")
+    print("   POST /intent-mapper, /intent-mapper/stream and /intent-mapper/batch")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
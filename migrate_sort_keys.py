@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+ProcedureTime Sort Key Migration Script
+Rewrites legacy rows (bare ISO time sort keys) to the collision-free
+"<time>#<ULID>" scheme used by add_doctor_procedure_lambda.
+
+Each row is moved atomically with TransactWriteItems (put new key + delete old key),
+so the script is safe to interrupt and re-run: already-migrated rows are skipped.
+"""
+
+import os
+import sys
+import argparse
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions', 'shared'))
+from sort_keys import is_legacy_sort_key, make_sort_key
+
+# Configuration
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'DoctorProcedures')
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+
+def scan_segment(table, segment, total_segments):
+    """Yield legacy rows from one parallel scan segment"""
+    scan_kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            if is_legacy_sort_key(item['ProcedureTime']):
+                yield item
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+
+def migrate_item(client, table_name, item):
+    """Atomically move one row to a suffixed sort key. Returns True if moved."""
+    old_sort_key = item['ProcedureTime']
+    new_item = dict(item)
+    new_item['ProcedureTime'] = make_sort_key(old_sort_key)
+    new_item.setdefault('time_logged', old_sort_key)
+
+    try:
+        client.transact_write_items(TransactItems=[
+            {
+                'Put': {
+                    'TableName': table_name,
+                    'Item': new_item,
+                    'ConditionExpression': 'attribute_not_exists(DoctorName)'
+                }
+            },
+            {
+                'Delete': {
+                    'TableName': table_name,
+                    'Key': {'DoctorName': item['DoctorName'], 'ProcedureTime': old_sort_key},
+                    # Skip rows deleted or migrated by a concurrent run
+                    'ConditionExpression': 'attribute_exists(DoctorName)'
+                }
+            }
+        ])
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'TransactionCanceledException':
+            print(f"⚠️  Skipped {item['DoctorName']} @ {old_sort_key}: changed during migration")
+            return False
+        raise
+
+
+def migrate_segment(table, segment, total_segments, dry_run):
+    """Migrate every legacy row in one scan segment. Returns (found, migrated)."""
+    # The resource's client accepts native Python types, including Decimal
+    client = table.meta.client
+    found = 0
+    migrated = 0
+    for item in scan_segment(table, segment, total_segments):
+        found += 1
+        if dry_run:
+            continue
+        if migrate_item(client, table.name, item):
+            migrated += 1
+    print(f"✓ Segment {segment + 1}/{total_segments}: {found} legacy rows, {migrated} migrated")
+    return found, migrated
+
+
+def migrate_table(table, total_segments=4, dry_run=False):
+    """Run the migration across parallel scan segments. Returns (found, migrated)."""
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = list(executor.map(
+            lambda segment: migrate_segment(table, segment, total_segments, dry_run),
+            range(total_segments)
+        ))
+    return sum(found for found, _ in results), sum(migrated for _, migrated in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate ProcedureTime sort keys to the collision-free scheme.')
+    parser.add_argument('--table', default=TABLE_NAME, help='DynamoDB table name')
+    parser.add_argument('--region', default=REGION, help='AWS region')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    parser.add_argument('--dry-run', action='store_true', help='Only count legacy rows')
+    args = parser.parse_args()
+
+    print("🚀 Starting ProcedureTime sort key migration...")
+    print(f"📍 Target table: {args.table}")
+    print(f"🌍 Region: {args.region}")
+    if args.dry_run:
+        print("🔍 Dry run: no rows will be changed")
+
+    table = boto3.resource('dynamodb', region_name=args.region).Table(args.table)
+    found, migrated = migrate_table(table, total_segments=args.segments, dry_run=args.dry_run)
+
+    print(f"\n🎉 Migration complete!")
+    print(f"📊 Legacy rows found: {found}")
+    print(f"📊 Rows migrated: {migrated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,17 @@ DynamoDB Data Population Script for Doctor Procedures
 Creates substantial test data with realistic medical procedures and costs
 """
 
+import os
+import sys
 import json
 import boto3
 import random
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions', 'shared'))
+from sort_keys import make_sort_key
+
 # Configuration
 TABLE_NAME = 'DoctorProcedures'
 REGION = 'us-east-1'
@@ -161,7 +166,7 @@ def create_entry(doctor_name, procedure_code, procedure_info):
     
     return {
         'DoctorName': doctor_name,  # Hash key
-        'ProcedureTime': timestamp,  # Range key
+        'ProcedureTime': make_sort_key(timestamp),  # Range key, unique even for identical timestamps
         'procedure_code': procedure_code,
         'procedure_name': procedure_info['name'],
         'cost': Decimal(str(cost)),
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Doctor Registry and Aggregate Rebuild Script
+Recomputes every doctor registry entry and procedure aggregate in the stats table
+from the raw DoctorProcedures rows, using a parallel segmented scan.
+
+Normal writes keep the aggregates exact (see functions/shared/procedure_aggregates.py);
+run this after restoring or hand-editing raw rows, or whenever drift is suspected.
+Use --dry-run to only report how many aggregates differ. Procedures written while a
+rebuild is running may be missed by it, so re-run --dry-run afterwards to confirm.
+"""
+
+import os
+import sys
+import argparse
+import boto3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions', 'shared'))
+from procedure_aggregates import PROFILE_SORT_KEY, AGGREGATE_KEY_PREFIX, aggregate_rows, aggregate_item
+
+# Configuration
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'DoctorProcedures')
+STATS_TABLE_NAME = os.environ.get('DYNAMODB_STATS_TABLE_NAME', 'DoctorProcedureStats')
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+
+def scan_segment(table, segment, total_segments):
+    """Yield every item from one parallel scan segment"""
+    scan_kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield from response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+
+def aggregate_segment(table, segment, total_segments):
+    """Aggregate the raw rows in one scan segment. Returns (row_count, deltas)."""
+    rows = [
+        item for item in scan_segment(table, segment, total_segments)
+        if 'procedure_code' in item and 'cost' in item
+    ]
+    print(f"✓ Segment {segment + 1}/{total_segments}: {len(rows)} procedures")
+    return len(rows), aggregate_rows(rows)
+
+
+def merge_deltas(merged, deltas):
+    """Fold one segment's aggregate deltas into the running totals"""
+    for key, delta in deltas.items():
+        if key not in merged:
+            merged[key] = delta
+        elif key[1] == PROFILE_SORT_KEY:
+            merged[key]['procedure_codes'] |= delta['procedure_codes']
+        else:
+            merged[key]['procedure_count'] += delta['procedure_count']
+            merged[key]['total_cost'] += delta['total_cost']
+            merged[key]['buckets'] = Counter(merged[key]['buckets']) + delta['buckets']
+    return merged
+
+
+def rebuild_aggregates(table, stats_table, total_segments=4, dry_run=False):
+    """
+    Recompute all aggregates and replace the ones that drifted.
+    Returns (procedures, aggregates, changed, removed).
+    """
+    def scan_both(segment):
+        row_count, deltas = aggregate_segment(table, segment, total_segments)
+        return row_count, deltas, list(scan_segment(stats_table, segment, total_segments))
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = list(executor.map(scan_both, range(total_segments)))
+
+    merged = {}
+    existing = {}
+    for _, deltas, stored_items in results:
+        merge_deltas(merged, deltas)
+        # Idempotency key records share the table but are not aggregates
+        existing.update({(item['PK'], item['SK']): item for item in stored_items if item['PK'].startswith(AGGREGATE_KEY_PREFIX)})
+
+    expected = {key: aggregate_item(key, delta) for key, delta in merged.items()}
+    changed = [item for key, item in expected.items() if existing.get(key) != item]
+    removed = [key for key in existing if key not in expected]
+
+    if not dry_run:
+        with stats_table.batch_writer() as batch:
+            for item in changed:
+                batch.put_item(Item=item)
+            for pk, sk in removed:
+                batch.delete_item(Key={'PK': pk, 'SK': sk})
+
+    return sum(row_count for row_count, _, _ in results), len(expected), len(changed), len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the doctor registry and procedure aggregates from raw rows.')
+    parser.add_argument('--table', default=TABLE_NAME, help='DynamoDB procedures table name')
+    parser.add_argument('--stats-table', default=STATS_TABLE_NAME, help='DynamoDB stats table name')
+    parser.add_argument('--region', default=REGION, help='AWS region')
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    parser.add_argument('--dry-run', action='store_true', help='Only report aggregates that have drifted')
+    args = parser.parse_args()
+
+    print("🚀 Starting aggregate rebuild...")
+    print(f"📍 Procedures table: {args.table}")
+    print(f"📍 Stats table: {args.stats_table}")
+    print(f"🌍 Region: {args.region}")
+    if args.dry_run:
+        print("🔍 Dry run: no aggregates will be changed")
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    procedures, aggregates, changed, removed = rebuild_aggregates(
+        dynamodb.Table(args.table),
+        dynamodb.Table(args.stats_table),
+        total_segments=args.segments,
+        dry_run=args.dry_run
+    )
+
+    print(f"\n🎉 Rebuild complete!")
+    print(f"📊 Procedures scanned: {procedures}")
+    print(f"📊 Aggregates: {aggregates}")
+    print(f"📊 Drifted aggregates {'found' if args.dry_run else 'rewritten'}: {changed}")
+    print(f"📊 Stale aggregates {'found' if args.dry_run else 'removed'}: {removed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Local tests for the shared AWS client factory: pool size, keep-alive, timeouts fitted
+to the function timeout, one client per container, and the pools the handlers ask for.
+"""
+import sys
+import os
+import importlib
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/add_doctor_procedure'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import aws_clients
+
+
+def test_config_fits_the_function_timeout():
+    """Pools are at least the default size, keep-alive is on, and every attempt fits in the function timeout"""
+    config = aws_clients.client_config('lambda', max_pool_connections=40)
+    assert config.max_pool_connections == 40 and config.tcp_keepalive is True
+    assert config.retries == {'total_max_attempts': 2, 'mode': 'standard'}
+    assert aws_clients.client_config('sqs', max_pool_connections=2).max_pool_connections == aws_clients.AWS_MAX_POOL_CONNECTIONS
+
+    # 30 s function, 2 s reserve: the agent's one attempt gets 26 s, each of two lookups 12 s
+    assert aws_clients.service_timeouts('bedrock-agent-runtime') == (2, 26.0, 1)
+    assert aws_clients.service_timeouts('lambda') == (2, 12.0, 2)
+    assert aws_clients.service_timeouts('dynamodb') == (1, 3, 3)
+
+    aws_clients.FUNCTION_TIMEOUT_SECONDS = 15
+    try:
+        for service in ['dynamodb', 'sqs', 'lambda', 'bedrock-agent-runtime', 'sts']:
+            connect_timeout, read_timeout, attempts = aws_clients.service_timeouts(service)
+            assert (connect_timeout + read_timeout) * attempts <= 15 - aws_clients.CLIENT_TIMEOUT_RESERVE_SECONDS + 1e-9, service
+    finally:
+        aws_clients.FUNCTION_TIMEOUT_SECONDS = 30
+    print("   ✅ Config fits the function timeout")
+
+
+def test_clients_shared_per_container():
+    """Each service and pool size is built once, even when several threads ask first"""
+    aws_clients.clear()
+    built = []
+    threads = [threading.Thread(target=lambda: built.append(aws_clients.client('sqs', 'us-east-1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 8 and all(client is built[0] for client in built)
+
+    sqs = built[0]
+    assert sqs.meta.config.read_timeout == 5 and sqs.meta.config.tcp_keepalive is True
+    assert aws_clients.client('sqs', 'us-east-1', max_pool_connections=20) is not sqs
+    assert aws_clients.resource('dynamodb', 'us-east-1') is aws_clients.resource('dynamodb', 'us-east-1')
+
+    aws_clients.clear()
+    assert aws_clients.client('sqs', 'us-east-1') is not sqs
+    print("   ✅ Clients shared per container")
+
+
+def test_handlers_pool_for_their_concurrency():
+    """The bulk writer pools a connection per writer, and the mapper's lookups one per batch worker's doctor"""
+    aws_clients.clear()
+    os.environ['BULK_WRITE_CONCURRENCY'] = '16'
+    try:
+        import add_doctor_procedure_lambda
+        module = importlib.reload(add_doctor_procedure_lambda)
+    finally:
+        del os.environ['BULK_WRITE_CONCURRENCY']
+    assert module.dynamodb.meta.client.meta.config.max_pool_connections == 16
+
+    import bedrock_intent_mapper_lambda
+    mapper = importlib.reload(bedrock_intent_mapper_lambda)
+    lookups = mapper.lambda_client.meta.config
+    assert lookups.max_pool_connections == mapper.BATCH_MAX_WORKERS * mapper.FAN_OUT_MAX_DOCTORS == 40
+    assert lookups.read_timeout == 12.0 and lookups.retries['total_max_attempts'] == 2
+
+    agent = mapper.bedrock_agent_runtime.meta.config
+    assert agent.retries['total_max_attempts'] == 1 and agent.read_timeout == 26.0
+    assert mapper.dynamodb.meta.client.meta.config.tcp_keepalive is True
+    print("   ✅ Handlers pooled for their concurrency")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing AWS Clients...")
+
+    tests = [
+        test_config_fits_the_function_timeout,
+        test_clients_shared_per_container,
+        test_handlers_pool_for_their_concurrency
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local tests for the batch intent-mapping endpoint used to replay logged utterances:
+local-only extraction and routing, full mapping on a bounded worker pool, and
+per-item results with aggregate timings.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import time
+import threading
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from moto import mock_aws
+
+
+class SlowAgentRuntime:
+    """Answers after `delay` seconds, recording sessions and the peak number of concurrent calls"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sessions = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def invoke_agent(self, **kwargs):
+        with self.lock:
+            self.sessions.append(kwargs['sessionId'])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return {'completion': [{'chunk': {'bytes': f"Agent answer to: {kwargs['inputText']}".encode('utf-8')}}]}
+
+
+class StubContext:
+    aws_request_id = 'batch-request'
+
+
+def load_mapper(agent):
+    """Reload the mapper with a slow agent, no rate limit, and no cache, prefetch or sessions"""
+    import bedrock_intent_mapper_lambda
+    from retry_budget import TokenBucket
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.RESPONSE_CACHE_ENABLED = False
+    module.COALESCE_ENABLED = False
+    module.session_store = None
+    module.bedrock_agent_runtime = agent
+    module.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    module.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: f'Direct {intent} for {doctor_name}'
+    return module
+
+
+def batch(module, body):
+    event = {'path': '/intent-mapper/batch', 'body': json.dumps(body)}
+    response = module.lambda_handler(event, StubContext())
+    return response['statusCode'], json.loads(response['body'])
+
+
+@mock_aws
+def test_local_only_makes_no_calls():
+    """localOnly returns extraction and the predicted route for every item, calling nothing"""
+    agent = SlowAgentRuntime(0)
+    module = load_mapper(agent)
+    module.try_direct_lambda_invocation = None  # Would fail if called
+
+    history = [{'role': 'assistant', 'content': 'History for Emily Davis', 'extractedParams': {'doctorName': 'Emily Davis', 'intent': 'showHistory'}}]
+    status, body = batch(module, {'localOnly': True, 'items': [
+        {'text': 'get quote for Sarah Johnson ENDO001'},
+        {'text': 'what about her costs', 'conversationHistory': history},
+        'which doctor is cheapest?',
+        {'text': ''}
+    ]})
+
+    assert status == 200
+    results = body['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert results[0]['route'] == 'local' and results[0]['routeConfidence'] == 1.0
+    assert results[1]['extractedParams']['doctorName'] == 'Emily Davis'
+    assert results[2]['route'] == 'bedrock'
+    assert results[3]['statusCode'] == 400
+    assert body['summary']['succeeded'] == 3 and body['summary']['failed'] == 1
+    assert body['summary']['routes'] == {'local': 1, 'bedrock': 2}
+    assert agent.sessions == []
+    print("   ✅ Local-only batch made no calls")
+
+
+@mock_aws
+def test_items_run_on_bounded_pool():
+    """Full mapping runs items concurrently, never more than `workers` at once, each in its own agent session"""
+    agent = SlowAgentRuntime(0.1)
+    module = load_mapper(agent)
+    module.FAST_PATH_ENABLED = False
+
+    items = [{'text': f'which doctor is best for procedure number {i}?'} for i in range(8)]
+    start = time.perf_counter()
+    status, body = batch(module, {'items': items, 'workers': 4})
+    elapsed = time.perf_counter() - start
+
+    assert status == 200
+    assert agent.peak == 4
+    assert elapsed < 0.6, elapsed  # two rounds of 0.1s, not eight
+    assert len(set(agent.sessions)) == 8
+    assert all(result['response'].startswith('Agent answer to:') for result in body['results'])
+    summary = body['summary']
+    assert summary['workers'] == 4
+    assert summary['bedrockCalls'] == 8
+    assert set(summary['itemLatencyMs']) == {'mean', 'p50', 'p95', 'max'}
+    assert summary['itemLatencyMs']['p50'] >= 100
+    print(f"   ✅ Eight items on four workers took {elapsed * 1000:.0f} ms")
+
+
+@mock_aws
+def test_invalid_batches_rejected():
+    """Missing, empty and oversized item lists are rejected; workers are capped"""
+    module = load_mapper(SlowAgentRuntime(0))
+    module.BATCH_MAX_ITEMS = 3
+
+    assert batch(module, {})[0] == 400
+    assert batch(module, {'items': []})[0] == 400
+    assert batch(module, {'items': ['a', 'b', 'c', 'd']})[0] == 400
+    status, body = batch(module, {'items': ['get quote for Sarah Johnson'], 'localOnly': True, 'workers': 100})
+    assert status == 200
+    assert body['summary']['workers'] == module.BATCH_MAX_WORKERS
+    print("   ✅ Invalid batches rejected")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Batch Intent Mapping...")
+
+    tests = [
+        test_local_only_makes_no_calls,
+        test_items_run_on_bounded_pool,
+        test_invalid_batches_rejected
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Local tests for the intent mapper's Bedrock retry policy: the per-container token
+bucket, jittered backoff and the Lambda time budget.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import time
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+
+class ThrottlingAgentRuntime:
+    """Throttles the first `throttles` calls, then answers"""
+
+    def __init__(self, throttles, completion='Sarah Johnson charges $250.'):
+        self.throttles = throttles
+        self.completion = completion
+        self.call_times = []
+
+    def invoke_agent(self, **kwargs):
+        self.call_times.append(time.monotonic())
+        if len(self.call_times) <= self.throttles:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'InvokeAgent')
+        return {'completion': [{'chunk': {'bytes': self.completion.encode('utf-8')}}]}
+
+
+class StubContext:
+    """A Lambda context with `remaining_ms` of its time budget left"""
+    aws_request_id = 'test-request'
+
+    def __init__(self, remaining_ms):
+        self.ends_at = time.monotonic() + remaining_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.ends_at - time.monotonic()) * 1000)
+
+
+def load_mapper(agent):
+    """Reload the mapper with a stubbed agent and direct lookup, and the fast path off"""
+    import bedrock_intent_mapper_lambda
+    import startup
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.FAST_PATH_ENABLED = False
+    module.bedrock_agent_runtime = agent
+    module.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: f'Direct {intent} for {doctor_name}'
+    # Build the clients now, so timings don't include a cold start
+    startup.warm()
+    return module
+
+
+def chat(module, context):
+    event = {'body': json.dumps({'text': 'get quote for Sarah Johnson', 'sessionId': 'session-1'})}
+    start = time.perf_counter()
+    body = json.loads(module.lambda_handler(event, context)['body'])
+    return body, time.perf_counter() - start
+
+
+def test_token_bucket_rate_and_burst():
+    """A full bucket allows a burst, then refills at the configured rate"""
+    from retry_budget import TokenBucket
+
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=3, clock=lambda: now[0])
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == 0.5
+
+    now[0] = 0.5
+    assert bucket.try_acquire() == 0
+    now[0] = 10
+    assert [bucket.try_acquire() for _ in range(4)] == [0, 0, 0, 0.5]
+    print("   ✅ Token bucket burst and refill")
+
+
+@mock_aws
+def test_throttled_call_retries_with_jitter_within_budget():
+    """With time to spare, a throttled call is retried after a jittered delay below the cap"""
+    agent = ThrottlingAgentRuntime(throttles=1)
+    module = load_mapper(agent)
+    module.BEDROCK_BACKOFF_BASE_MS = 100
+    module.BEDROCK_BACKOFF_CAP_MS = 100
+
+    body, _ = chat(module, StubContext(30000))
+    assert body['bedrockCalls'] == 2
+    assert body['response'] == 'Sarah Johnson charges $250.'
+    assert body['fallbackUsed'] is False
+    assert agent.call_times[1] - agent.call_times[0] < 0.2
+    print("   ✅ Throttled call retried")
+
+
+@mock_aws
+def test_no_retry_past_the_deadline():
+    """When another attempt would not fit in the remaining time, the fallback answers at once"""
+    agent = ThrottlingAgentRuntime(throttles=3)
+    module = load_mapper(agent)
+    module.backoff_delay = lambda attempt, base, cap: cap
+
+    # 5.5 s left, 2 s reserved for the fallback: one 3 s attempt fits, but not a 4 s backoff and another attempt
+    body, elapsed = chat(module, StubContext(5500))
+    assert body['bedrockCalls'] == 1
+    assert body['fallbackUsed'] is True
+    assert body['response'] == 'Direct getQuote for Sarah Johnson'
+    assert elapsed < 0.5, elapsed
+    print(f"   ✅ Fell back after {elapsed * 1000:.0f} ms instead of sleeping")
+
+
+@mock_aws
+def test_empty_bucket_skips_the_agent():
+    """If the rate limiter has no token within the budget, the agent is not called"""
+    from retry_budget import TokenBucket
+
+    agent = ThrottlingAgentRuntime(throttles=0)
+    module = load_mapper(agent)
+    module.bedrock_rate_limiter = TokenBucket(rate=0.01, capacity=1)
+
+    assert chat(module, StubContext(30000))[0]['bedrockCalls'] == 1
+    body, elapsed = chat(module, StubContext(30000))
+    assert body['bedrockCalls'] == 0
+    assert body['fallbackUsed'] is True
+    assert len(agent.call_times) == 1
+    assert elapsed < 0.5, elapsed
+    print("   ✅ Rate-limited request served by the fallback")
+
+
+def test_botocore_retries_disabled():
+    """botocore makes a single attempt, so its retries don't stack on ours"""
+    import bedrock_intent_mapper_lambda
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    retries = module.bedrock_agent_runtime.meta.config.retries
+    assert retries['total_max_attempts'] == 1
+    assert retries['mode'] == 'standard'
+    print("   ✅ botocore retries disabled")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Bedrock Retry Policy...")
+
+    tests = [
+        test_token_bucket_rate_and_burst,
+        test_throttled_call_retries_with_jitter_within_budget,
+        test_no_retry_past_the_deadline,
+        test_empty_bucket_skips_the_agent,
+        test_botocore_retries_disabled
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
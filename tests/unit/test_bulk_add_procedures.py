@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Local tests for the bulk procedure ingest handler.
+Uses moto to stand in for DynamoDB, so no AWS account or Docker is required.
+"""
+import sys
+import os
+import json
+import importlib
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/add_doctor_procedure'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+
+def create_stats_table():
+    """Create the DoctorProcedureStats table for the doctor registry and aggregates"""
+    boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedureStats',
+        KeySchema=[
+            {'AttributeName': 'PK', 'KeyType': 'HASH'},
+            {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'PK', 'AttributeType': 'S'},
+            {'AttributeName': 'SK', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_table():
+    """Create the DoctorProcedures table with one known doctor"""
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    table.put_item(Item={
+        'DoctorName': 'Sarah Johnson',
+        'ProcedureTime': '2025-01-01T09:00:00Z',
+        'procedure_code': 'CONS001',
+        'procedure_name': 'Initial Consultation',
+        'cost': Decimal('250'),
+        'time_logged': '2025-01-01T09:00:00Z'
+    })
+    create_stats_table()
+    return table
+
+
+def load_handler():
+    import add_doctor_procedure_lambda
+    return importlib.reload(add_doctor_procedure_lambda)
+
+
+def invoke(module, body):
+    result = module.bulk_lambda_handler({'body': body}, None)
+    return result['statusCode'], json.loads(result['body'])
+
+
+@mock_aws
+def test_json_array_writes_all_chunks():
+    """A JSON array larger than one transaction is fully written"""
+    table = create_table()
+    module = load_handler()
+
+    rows = [
+        {
+            'doctorName': 'sarah johnson',
+            'procedureCode': 'LAB001',
+            'procedureName': 'Complete Blood Count',
+            'cost': 85.5,
+            'time': f'2025-02-01T10:{minute:02d}:00Z'
+        }
+        for minute in range(60)
+    ]
+    status, body = invoke(module, json.dumps(rows))
+    assert status == 200, body
+    assert body['written'] == 60 and body['failed'] == 0
+    assert all(result['doctorName'] == 'Sarah Johnson' for result in body['results'])
+
+    count = table.query(
+        KeyConditionExpression=boto3.dynamodb.conditions.Key('DoctorName').eq('Sarah Johnson')
+    )['Count']
+    assert count == 61
+    print("   ✅ JSON array written in parallel transactions")
+
+
+@mock_aws
+def test_ndjson_reports_per_row_errors():
+    """NDJSON rows are validated individually and failures do not block other rows"""
+    create_table()
+    module = load_handler()
+
+    lines = [
+        json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': '150.00', 'time': '2025-03-01T08:00:00+02:00'}),
+        json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 'abc'}),
+        '{not json',
+        json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 1, 'time': 'yesterday'})
+    ]
+    status, body = invoke(module, '\n'.join(lines))
+    assert status == 207, body
+    statuses = [result['status'] for result in body['results']]
+    assert statuses == ['written', 'failed', 'failed', 'failed'], statuses
+    assert body['results'][0]['timeLogged'] == '2025-03-01T06:00:00Z'
+    print("   ✅ NDJSON per-row validation")
+
+
+@mock_aws
+def test_same_second_rows_are_not_overwritten():
+    """Rows for one doctor logged at the same time get distinct sort keys"""
+    table = create_table()
+    module = load_handler()
+
+    rows = [
+        {'doctorName': 'Robert Brown', 'procedureCode': 'LAB001', 'cost': 85, 'time': '2025-03-01T06:00:00Z'}
+        for _ in range(30)
+    ]
+    status, body = invoke(module, json.dumps(rows))
+    assert status == 200, body
+    assert len({result['procedureTime'] for result in body['results']}) == 30
+
+    items = table.query(
+        KeyConditionExpression=boto3.dynamodb.conditions.Key('DoctorName').eq('Robert Brown')
+    )['Items']
+    assert len(items) == 30
+    assert all(item['ProcedureTime'].startswith('2025-03-01T06:00:00Z#') for item in items)
+    print("   ✅ Same-second rows kept")
+
+
+@mock_aws
+def test_transaction_conflicts_are_retried():
+    """A transaction cancelled by a conflicting write is retried until written"""
+    table = create_table()
+    module = load_handler()
+    module.backoff_delay = lambda attempt: 0
+
+    real_transact_write = module.dynamodb.meta.client.transact_write_items
+    calls = []
+
+    def conflicting_transact_write(TransactItems, ClientRequestToken, **kwargs):
+        calls.append(ClientRequestToken)
+        if len(calls) == 1:
+            raise ClientError({
+                'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                'CancellationReasons': [{'Code': 'None'}] * (len(TransactItems) - 1) + [{'Code': 'TransactionConflict'}]
+            }, 'TransactWriteItems')
+        return real_transact_write(TransactItems=TransactItems, ClientRequestToken=ClientRequestToken, **kwargs)
+
+    module.dynamodb.meta.client.transact_write_items = conflicting_transact_write
+    try:
+        rows = [
+            {'doctorName': 'Emily Davis', 'procedureCode': 'CONS001', 'cost': 200, 'time': f'2025-04-01T09:{minute:02d}:00Z'}
+            for minute in range(10)
+        ]
+        status, body = invoke(module, json.dumps(rows))
+    finally:
+        module.dynamodb.meta.client.transact_write_items = real_transact_write
+
+    assert status == 200, body
+    assert len(calls) == 2 and calls[0] == calls[1], calls
+    count = table.query(
+        KeyConditionExpression=boto3.dynamodb.conditions.Key('DoctorName').eq('Emily Davis')
+    )['Count']
+    assert count == 10
+    print("   ✅ Transaction conflicts retried")
+
+
+@mock_aws
+def test_large_single_doctor_import():
+    """A doctor's chunks are written one after another, so they never conflict on the shared aggregates"""
+    table = create_table()
+    module = load_handler()
+    module.BULK_MAX_RETRIES = 0
+
+    # Like DynamoDB, cancel a transaction that updates an aggregate another one is still updating
+    real_transact_write = module.dynamodb.meta.client.transact_write_items
+    in_flight = Counter()
+    lock = threading.Lock()
+    moto_lock = threading.Lock()  # moto's TransactWriteItems is not thread-safe
+
+    def conflicting_transact_write(TransactItems, **kwargs):
+        keys = [(action['Update']['Key']['PK'], action['Update']['Key']['SK']) for action in TransactItems if 'Update' in action]
+        with lock:
+            conflict = any(in_flight[key] for key in keys)
+            in_flight.update(keys)
+        try:
+            time.sleep(0.05)
+            if conflict:
+                raise ClientError({
+                    'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                    'CancellationReasons': [{'Code': 'TransactionConflict'}] * len(TransactItems)
+                }, 'TransactWriteItems')
+            with moto_lock:
+                return real_transact_write(TransactItems=TransactItems, **kwargs)
+        finally:
+            with lock:
+                in_flight.subtract(keys)
+
+    module.dynamodb.meta.client.transact_write_items = conflicting_transact_write
+    try:
+        rows = [
+            {'doctorName': 'Emily Davis', 'procedureCode': 'LAB001', 'cost': 85, 'time': f'2025-05-{1 + index // 60:02d}T10:{index % 60:02d}:00Z'}
+            for index in range(250)
+        ]
+        rows += [{'doctorName': 'Sarah Johnson', 'procedureCode': 'LAB001', 'cost': 90, 'time': '2025-05-01T11:00:00Z'}]
+        status, body = invoke(module, json.dumps(rows))
+    finally:
+        module.dynamodb.meta.client.transact_write_items = real_transact_write
+
+    assert status == 200, body['failed']
+    assert body['written'] == 251
+    count = table.query(
+        KeyConditionExpression=boto3.dynamodb.conditions.Key('DoctorName').eq('Emily Davis')
+    )['Count']
+    assert count == 250
+    stats = boto3.resource('dynamodb').Table('DoctorProcedureStats').get_item(Key={'PK': 'DOCTOR#Emily Davis', 'SK': 'STATS#*'})['Item']
+    assert stats['procedure_count'] == 250
+    print("   ✅ Large single-doctor import written without conflicts")
+
+
+@mock_aws
+def test_empty_body_is_rejected():
+    create_table()
+    module = load_handler()
+
+    status, body = invoke(module, '   ')
+    assert status == 400
+    print("   ✅ Empty body rejected")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Bulk Add Doctor Procedures...")
+
+    tests = [
+        test_json_array_writes_all_chunks,
+        test_ndjson_reports_per_row_errors,
+        test_same_second_rows_are_not_overwritten,
+        test_transaction_conflicts_are_retried,
+        test_large_single_doctor_import,
+        test_empty_body_is_rejected
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
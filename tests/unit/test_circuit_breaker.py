@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Local tests for the circuit breaker around the intent mapper's Bedrock agent calls.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from botocore.exceptions import ClientError, ReadTimeoutError, EndpointConnectionError
+from moto import mock_aws
+
+
+class FlakyAgentRuntime:
+    """Fails every call with `error` until `healthy` is set"""
+
+    def __init__(self, error):
+        self.error = error
+        self.healthy = False
+        self.calls = 0
+
+    def invoke_agent(self, **kwargs):
+        self.calls += 1
+        if not self.healthy:
+            raise self.error
+        return {'completion': [{'chunk': {'bytes': b'Sarah Johnson charges $250.'}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+THROTTLED = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'InvokeAgent')
+ACCESS_DENIED = ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': 'Not allowed'}}, 'InvokeAgent')
+
+
+class BrokenStreamAgentRuntime:
+    """Answers, but the completion stream fails after the first chunk"""
+
+    def invoke_agent(self, **kwargs):
+        def completion():
+            yield {'chunk': {'bytes': b'Sarah'}}
+            raise EndpointConnectionError(endpoint_url='https://bedrock-agent-runtime')
+        return {'completion': completion()}
+
+
+def load_mapper(agent, clock):
+    """Reload the mapper with a breaker that opens after 2 failures, on a fake clock"""
+    import bedrock_intent_mapper_lambda
+    from circuit_breaker import CircuitBreaker
+    from retry_budget import TokenBucket
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.FAST_PATH_ENABLED = False
+    module.RESPONSE_CACHE_ENABLED = False
+    module.bedrock_agent_runtime = agent
+    module.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    module.bedrock_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    module.backoff_delay = lambda attempt, base, cap: 0
+    module.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: f'Direct {intent} for {doctor_name}'
+    return module
+
+
+def chat(module):
+    event = {'body': json.dumps({'text': 'get quote for Sarah Johnson', 'sessionId': 'session-1'})}
+    return json.loads(module.lambda_handler(event, StubContext())['body'])
+
+
+def test_breaker_state_transitions():
+    """closed -> open after the threshold, half_open after the timeout, and probes decide the rest"""
+    from circuit_breaker import CircuitBreaker
+
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, probe_limit=1, clock=lambda: now[0])
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed'  # the success reset the count
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+
+    now[0] = 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    now[0] = 20
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow_request() and breaker.allow_request()
+
+    # A released probe frees its slot and leaves the circuit half open
+    for _ in range(3):
+        breaker.record_failure()
+    now[0] = 40
+    assert breaker.allow_request() and not breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+    print("   ✅ Breaker state transitions")
+
+
+@mock_aws
+def test_open_circuit_sends_traffic_to_fallback():
+    """Once throttling opens the circuit, retries stop and later requests skip the agent"""
+    now = [0.0]
+    agent = FlakyAgentRuntime(THROTTLED)
+    module = load_mapper(agent, lambda: now[0])
+
+    body = chat(module)
+    assert body['bedrockCalls'] == 2  # the third attempt was not made
+    assert body['circuitState'] == 'open'
+    assert body['fallbackUsed'] is True
+    assert body['response'] == 'Direct getQuote for Sarah Johnson'
+
+    body = chat(module)
+    assert body['bedrockCalls'] == 0
+    assert body['fallbackUsed'] is True
+    assert agent.calls == 2
+    print("   ✅ Open circuit skipped the agent")
+
+
+@mock_aws
+def test_half_open_probe_closes_circuit():
+    """After the reset timeout one request probes the agent; its success closes the circuit"""
+    now = [0.0]
+    agent = FlakyAgentRuntime(THROTTLED)
+    module = load_mapper(agent, lambda: now[0])
+    chat(module)
+
+    now[0] = 30
+    agent.healthy = True
+    body = chat(module)
+    assert body['bedrockCalls'] == 1
+    assert body['response'] == 'Sarah Johnson charges $250.'
+    assert body['circuitState'] == 'closed'
+    print("   ✅ Probe closed the circuit")
+
+
+@mock_aws
+def test_timeouts_open_circuit():
+    """Read timeouts count as failures, and are answered by the fallback rather than an error"""
+    now = [0.0]
+    agent = FlakyAgentRuntime(ReadTimeoutError(endpoint_url='https://bedrock-agent-runtime'))
+    module = load_mapper(agent, lambda: now[0])
+
+    assert chat(module)['circuitState'] == 'closed'
+    body = chat(module)
+    assert body['circuitState'] == 'open'
+    assert body['response'] == 'Direct getQuote for Sarah Johnson'
+    assert chat(module)['bedrockCalls'] == 0
+    print("   ✅ Timeouts opened the circuit")
+
+
+@mock_aws
+def test_circuit_state_reaches_metrics():
+    """Each request's EMF record carries a CircuitOpen metric and the circuitState property"""
+    import stage_metrics
+    now = [0.0]
+    agent = FlakyAgentRuntime(THROTTLED)
+    module = load_mapper(agent, lambda: now[0])
+    stage_metrics.sink = stage_metrics.MemorySink()
+    try:
+        chat(module)
+        now[0] = 30
+        agent.healthy = True
+        chat(module)
+        records = stage_metrics.sink.records
+    finally:
+        stage_metrics.sink = stage_metrics.print_record
+
+    assert [(record['circuitState'], record['CircuitOpen']) for record in records] == [('open', 1), ('closed', 0)]
+    metrics = records[0]['_aws']['CloudWatchMetrics'][0]['Metrics']
+    assert {'Name': 'CircuitOpen', 'Unit': 'Count'} in metrics
+    print("   ✅ Circuit state in metrics")
+
+
+@mock_aws
+def test_probe_outcome_always_recorded():
+    """Connection errors and broken streams fail a probe; non-load client errors free it without closing the circuit"""
+    now = [0.0]
+    agent = FlakyAgentRuntime(THROTTLED)
+    module = load_mapper(agent, lambda: now[0])
+    chat(module)
+    assert module.bedrock_breaker.state == 'open'
+
+    # The probe hits a connection error: answered by the fallback, circuit open again
+    now[0] = 30
+    agent.error = EndpointConnectionError(endpoint_url='https://bedrock-agent-runtime')
+    body = chat(module)
+    assert body['bedrockCalls'] == 1 and body['fallbackUsed'] is True
+    assert body['circuitState'] == 'open'
+
+    # A stream that breaks off mid-answer is a failure too
+    now[0] = 60
+    module.bedrock_agent_runtime = BrokenStreamAgentRuntime()
+    body = chat(module)
+    assert body['bedrockCalls'] == 1 and body['circuitState'] == 'open'
+
+    # Access denied neither closes the circuit nor keeps the probe slot
+    now[0] = 90
+    module.bedrock_agent_runtime = agent
+    agent.error = ACCESS_DENIED
+    body = chat(module)
+    assert body['bedrockCalls'] == 1 and body['circuitState'] == 'half_open'
+    assert module.bedrock_breaker.probes == 0
+
+    # So the next request can probe, and a real answer closes the circuit
+    agent.healthy = True
+    body = chat(module)
+    assert body['bedrockCalls'] == 1 and body['circuitState'] == 'closed'
+    print("   ✅ Probe outcome always recorded")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Bedrock Circuit Breaker...")
+
+    tests = [
+        test_breaker_state_transitions,
+        test_open_circuit_sends_traffic_to_fallback,
+        test_half_open_probe_closes_circuit,
+        test_timeouts_open_circuit,
+        test_circuit_state_reaches_metrics,
+        test_probe_outcome_always_recorded
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Local tests for the Aho-Corasick entity matcher and the intent mapper's
+registry-backed entity catalog.
+Uses moto to stand in for DynamoDB, so no AWS account or Docker is required.
+"""
+import sys
+import os
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from moto import mock_aws
+
+
+def create_registry(doctors):
+    """Create the stats table with a registry entry per {doctor: [codes]}"""
+    table = boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedureStats',
+        KeySchema=[
+            {'AttributeName': 'PK', 'KeyType': 'HASH'},
+            {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'PK', 'AttributeType': 'S'},
+            {'AttributeName': 'SK', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    for doctor, codes in doctors.items():
+        table.put_item(Item={'PK': f'DOCTOR#{doctor}', 'SK': 'PROFILE', 'doctor_name': doctor, 'procedure_codes': set(codes)})
+        table.put_item(Item={'PK': f'DOCTOR#{doctor}', 'SK': 'STATS#*', 'procedure_count': 1})
+    return table
+
+
+def load_mapper():
+    import bedrock_intent_mapper_lambda
+    return importlib.reload(bedrock_intent_mapper_lambda)
+
+
+def test_automaton_finds_overlapping_whole_words():
+    """Every pattern is found in one pass, including overlaps, but never inside a longer word"""
+    from entity_matcher import build_automaton, find_matches
+
+    automaton = build_automaton({'he': ['he'], 'she': ['she'], 'hers': ['hers'], 'sarah johnson': ['doctor'], 'johnson': ['last']})
+    text = 'ushers she hers sarah johnson'
+    found = [(text[start:end], payloads) for start, end, payloads in find_matches(automaton, text)]
+    assert found == [('she', ['she']), ('hers', ['hers']), ('sarah johnson', ['doctor']), ('johnson', ['last'])], found
+    assert find_matches(automaton, '') == []
+    print("   ✅ Overlapping whole-word matches")
+
+
+@mock_aws
+def test_catalog_comes_from_registry():
+    """Doctors and codes in the registry are extracted even when missing from the seed lists"""
+    create_registry({'Michael Chen': ['XRAY002', 'LAB001'], 'Rachel Green': ['CONS002']})
+    module = load_mapper()
+
+    extracted = module.extract_parameters_from_text('get quote for michael chen xray002')
+    assert extracted['doctorName'] == 'Michael Chen'
+    assert extracted['procedureCode'] == 'XRAY002'
+    assert extracted['matchSources'] == {'intent': 'phrase', 'doctorName': 'fullName', 'procedureCode': 'catalog'}
+
+    # Seed doctors that are not in the registry are no longer matched
+    assert module.extract_parameters_from_text('show history for Emily Davis')['doctorName'] is None
+    assert module.extract_parameters_from_text('show history for Green')['doctorName'] == 'Rachel Green'
+    print("   ✅ Catalog loaded from the doctor registry")
+
+
+@mock_aws
+def test_catalog_refreshes_after_ttl():
+    """New registry entries are picked up once the TTL has passed"""
+    table = create_registry({'Michael Chen': ['LAB001']})
+    module = load_mapper()
+    assert module.extract_parameters_from_text('history for Kevin Thomas')['doctorName'] is None
+
+    table.put_item(Item={'PK': 'DOCTOR#Kevin Thomas', 'SK': 'PROFILE', 'doctor_name': 'Kevin Thomas', 'procedure_codes': {'LAB001'}})
+    assert module.extract_parameters_from_text('history for Kevin Thomas')['doctorName'] is None
+
+    module._entity_catalog['loadedAt'] -= module.ENTITY_CATALOG_TTL_SECONDS
+    assert module.extract_parameters_from_text('history for Kevin Thomas')['doctorName'] == 'Kevin Thomas'
+    print("   ✅ Catalog refreshed after TTL")
+
+
+@mock_aws
+def test_seed_catalog_and_context_resolution():
+    """Without a registry the seed lists are used, and references resolve from history"""
+    module = load_mapper()
+
+    history = [
+        {'role': 'user', 'content': 'show history for Sarah Johnson'},
+        {'role': 'assistant', 'content': 'Sarah Johnson performed ENDO001 last week.'}
+    ]
+    extracted = module.extract_parameters_from_text('what about her costs for that procedure', history)
+    assert extracted['intent'] == 'getQuote'
+    assert extracted['doctorName'] == 'Sarah Johnson'
+    assert extracted['procedureCode'] == 'ENDO001'
+    assert extracted['matchSources']['doctorName'] == 'context'
+
+    # "her" inside another word is not a reference
+    assert module.extract_parameters_from_text('where are the costs', history)['doctorName'] is None
+    print("   ✅ Seed catalog and context resolution")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Entity Extraction...")
+
+    tests = [
+        test_automaton_finds_overlapping_whole_words,
+        test_catalog_comes_from_registry,
+        test_catalog_refreshes_after_ttl,
+        test_seed_catalog_and_context_resolution
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
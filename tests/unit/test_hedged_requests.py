@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Local tests for hedged intent mapper requests, which race a slow Bedrock agent
+against the direct quote/history lookup, and for configured function names.
+The agent and Lambda clients are replaced with stubs; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import io
+import json
+import time
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from moto import mock_aws
+
+
+class SlowAgentRuntime:
+    """Answers invoke_agent after `delay` seconds"""
+
+    def __init__(self, delay, completion):
+        self.delay = delay
+        self.completion = completion
+        self.calls = 0
+
+    def invoke_agent(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {'completion': [{'chunk': {'bytes': self.completion.encode('utf-8')}}]}
+
+
+class StubLambdaClient:
+    """Records direct invocations and answers like the quote/history functions after `delay` seconds"""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.function_names = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.function_names.append(FunctionName)
+        time.sleep(self.delay)
+        body = {'message': f'Direct answer from {FunctionName}', 'medianCost': 250, 'history': []}
+        return {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': json.dumps(body)}).encode('utf-8'))}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def load_mapper(agent, lambda_client, hedge_delay_ms=50):
+    """Reload the mapper with hedging on, the fast path off and stubbed clients"""
+    os.environ['HEDGE_ENABLED'] = 'true'
+    os.environ['HEDGE_DELAY_MS'] = str(hedge_delay_ms)
+    os.environ['FAST_PATH_ENABLED'] = 'false'
+    os.environ['GET_QUOTE_FUNCTION_NAME'] = 'stack-GetQuoteFunction-test'
+    os.environ['SHOW_HISTORY_FUNCTION_NAME'] = 'stack-ShowHistoryFunction-test'
+    try:
+        import bedrock_intent_mapper_lambda
+        import startup
+        module = importlib.reload(bedrock_intent_mapper_lambda)
+    finally:
+        for name in ('HEDGE_ENABLED', 'HEDGE_DELAY_MS', 'FAST_PATH_ENABLED',
+                     'GET_QUOTE_FUNCTION_NAME', 'SHOW_HISTORY_FUNCTION_NAME'):
+            os.environ.pop(name)
+    module.bedrock_agent_runtime = agent
+    module.lambda_client = lambda_client
+    # Build the clients now, so timings don't include a cold start
+    startup.warm()
+    return module
+
+
+def chat(module, text):
+    event = {'body': json.dumps({'text': text, 'sessionId': 'session-1'})}
+    start = time.perf_counter()
+    body = json.loads(module.lambda_handler(event, StubContext())['body'])
+    return body, time.perf_counter() - start
+
+
+@mock_aws
+def test_slow_agent_loses_to_direct_lookup():
+    """Past the hedge delay the direct lookup starts, and its answer is returned without waiting for the agent"""
+    lambda_client = StubLambdaClient()
+    module = load_mapper(SlowAgentRuntime(1.0, 'Agent quote.'), lambda_client)
+
+    body, elapsed = chat(module, 'get quote for Sarah Johnson')
+    assert body['hedgeWinner'] == 'direct'
+    assert body['fallbackUsed'] is True
+    assert body['response'] == 'Direct answer from stack-GetQuoteFunction-test'
+    assert lambda_client.function_names == ['stack-GetQuoteFunction-test']
+    assert elapsed < 0.5, elapsed
+    print("   ✅ Direct lookup won the race")
+
+
+@mock_aws
+def test_fast_agent_is_not_hedged():
+    """An agent that answers within the hedge delay never triggers a direct lookup"""
+    lambda_client = StubLambdaClient()
+    module = load_mapper(SlowAgentRuntime(0, 'Sarah Johnson charges $250.'), lambda_client, hedge_delay_ms=500)
+
+    body, _ = chat(module, 'show history for Sarah Johnson')
+    assert body['hedgeWinner'] == 'bedrock'
+    assert body['response'] == 'Sarah Johnson charges $250.'
+    assert lambda_client.function_names == []
+    print("   ✅ Fast agent answered alone")
+
+
+@mock_aws
+def test_poor_agent_answer_waits_for_direct_lookup():
+    """A generic agent reply is not acceptable, so the slower direct answer still wins"""
+    lambda_client = StubLambdaClient(delay=0.1)
+    module = load_mapper(SlowAgentRuntime(0, "I'm not sure which doctor you mean."), lambda_client, hedge_delay_ms=500)
+
+    body, _ = chat(module, 'show history for Sarah Johnson')
+    assert body['hedgeWinner'] == 'direct'
+    assert body['response'] == 'Direct answer from stack-ShowHistoryFunction-test'
+    print("   ✅ Poor agent answer replaced")
+
+
+@mock_aws
+def test_unconfigured_function_names_skip_direct_lookup():
+    """Without configured function names no hardcoded function is invoked"""
+    import bedrock_intent_mapper_lambda
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    lambda_client = StubLambdaClient()
+    module.lambda_client = lambda_client
+
+    assert module.try_direct_lambda_invocation('getQuote', 'Sarah Johnson') is None
+    assert lambda_client.function_names == []
+    print("   ✅ Unconfigured direct lookups skipped")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Hedged Requests...")
+
+    tests = [
+        test_slow_agent_loses_to_direct_lookup,
+        test_fast_agent_is_not_hedged,
+        test_poor_agent_answer_waits_for_direct_lookup,
+        test_unconfigured_function_names_skip_direct_lookup
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
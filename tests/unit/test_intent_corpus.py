@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Accuracy floor for the intent mapper on the labelled corpus in benchmarks/intent_corpus/,
+so changes to extraction or the fallback heuristics can't quietly make them worse.
+Runs offline with the seed catalog, through benchmarks/benchmark_intent_corpus.py.
+"""
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import benchmark_intent_corpus as corpus_benchmark
+
+
+def test_precision_recall():
+    """None is "nothing predicted/expected"; a wrong value counts against both scores"""
+    scores = corpus_benchmark.precision_recall([('a', 'a'), ('b', 'c'), (None, 'd'), (None, None), ('e', None)])
+    assert scores == {'precision': 1 / 3, 'recall': 1 / 3}
+    assert corpus_benchmark.precision_recall([(None, None)]) == {'precision': 1.0, 'recall': 1.0}
+    print("   ✅ Precision and recall")
+
+
+def test_extraction_accuracy_floor():
+    """Extraction never returns a wrong value, and finds nearly every labelled one"""
+    corpus_benchmark.use_seed_catalog()
+    utterances, _, _ = corpus_benchmark.load_corpus()
+    result = corpus_benchmark.evaluate_extraction(utterances)
+
+    assert len(utterances) >= 50
+    assert any(row.get('conversationHistory') for row in utterances)
+    for field, scores in result['fields'].items():
+        assert scores['precision'] == 1.0, (field, scores, result['misses'])
+        assert scores['recall'] >= 0.95, (field, scores, result['misses'])
+    assert result['tags']['explicit'] == 1.0, result['misses']
+    assert result['exactMatch'] >= 0.94, result['misses']
+    print(f"   ✅ Exact match on {result['exactMatch']:.1%} of {len(utterances)} utterances")
+
+
+def test_fallback_heuristics_and_direct_formatting():
+    """Every labelled agent reply and direct response is handled as expected"""
+    _, replies, directs = corpus_benchmark.load_corpus()
+    fallback = corpus_benchmark.evaluate_fallback(replies)
+    assert fallback['precision'] == fallback['recall'] == 1.0, fallback['misses']
+    assert corpus_benchmark.evaluate_direct(directs)['accuracy'] == 1.0
+    print("   ✅ Fallback heuristics and direct formatting")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Intent Corpus Accuracy...")
+
+    tests = [
+        test_precision_recall,
+        test_extraction_accuracy_floor,
+        test_fallback_heuristics_and_direct_formatting
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
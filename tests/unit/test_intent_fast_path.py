@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Local tests for the intent mapper's fast path, which answers unambiguous
+quote and history requests without calling the Bedrock agent.
+The agent and the direct quote/history invocation are replaced with stubs, and
+moto stands in for DynamoDB (no doctor registry, so the seed catalog is used).
+"""
+import sys
+import os
+import json
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from moto import mock_aws
+
+
+class StubAgentRuntime:
+    """Records invoke_agent calls and streams back a fixed completion"""
+
+    def __init__(self, completion):
+        self.completion = completion
+        self.calls = []
+
+    def invoke_agent(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'completion': [{'chunk': {'bytes': self.completion.encode('utf-8')}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def load_mapper(completion='Agent answer.'):
+    """Reload the mapper with stubbed Bedrock and direct invocation"""
+    import bedrock_intent_mapper_lambda
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.bedrock_agent_runtime = StubAgentRuntime(completion)
+    module.direct_calls = []
+
+    def direct(intent, doctor_name, procedure_code=None):
+        module.direct_calls.append((intent, doctor_name, procedure_code))
+        return f'Direct {intent} for {doctor_name}'
+
+    module.try_direct_lambda_invocation = direct
+    return module
+
+
+def chat(module, text, history=None):
+    event = {'body': json.dumps({'text': text, 'sessionId': 'session-1', 'conversationHistory': history or []})}
+    return json.loads(module.lambda_handler(event, StubContext())['body'])
+
+
+@mock_aws
+def test_route_confidence_scoring():
+    """Explicit intent and doctor score high; references and ambiguity score low"""
+    module = load_mapper()
+
+    def score(text, history=None):
+        return module.score_local_route(module.extract_parameters_from_text(text, history))
+
+    assert score('get quote for Sarah Johnson ENDO001') == 1.0
+    assert score('show history for Brown') >= module.FAST_PATH_MIN_CONFIDENCE
+    assert score('compare costs for Sarah Johnson and Emily Davis') < module.FAST_PATH_MIN_CONFIDENCE
+    assert score('show history and get quote for Sarah Johnson') < module.FAST_PATH_MIN_CONFIDENCE
+    assert score('add procedure for Sarah Johnson') == 0.0
+
+    history = [{'role': 'assistant', 'content': 'History for Emily Davis', 'extractedParams': {'doctorName': 'Emily Davis', 'intent': 'showHistory'}}]
+    assert score('what about her costs', history) < module.FAST_PATH_MIN_CONFIDENCE
+    print("   ✅ Route confidence scoring")
+
+
+@mock_aws
+def test_unambiguous_request_skips_bedrock():
+    """A clear quote request is answered directly with no Bedrock calls"""
+    module = load_mapper()
+
+    body = chat(module, 'get quote for Sarah Johnson ENDO001')
+    assert body['route'] == 'local'
+    assert body['bedrockCalls'] == 0
+    assert module.bedrock_agent_runtime.calls == []
+    assert module.direct_calls == [('getQuote', 'Sarah Johnson', 'ENDO001')]
+    assert body['response'] == 'Direct getQuote for Sarah Johnson'
+    assert body['latencyMs'] >= 0
+    print("   ✅ Fast path skipped Bedrock")
+
+
+@mock_aws
+def test_ambiguous_request_goes_to_bedrock():
+    """Anything below the confidence threshold is still sent to the agent"""
+    module = load_mapper('Sarah Johnson charges $250 for a consultation.')
+
+    body = chat(module, 'which doctor is cheapest for a consultation?')
+    assert body['route'] == 'bedrock'
+    assert body['bedrockCalls'] == 1
+    assert len(module.bedrock_agent_runtime.calls) == 1
+    assert body['response'] == 'Sarah Johnson charges $250 for a consultation.'
+    print("   ✅ Ambiguous request routed to Bedrock")
+
+
+@mock_aws
+def test_fast_path_can_be_disabled():
+    module = load_mapper()
+    module.FAST_PATH_ENABLED = False
+
+    body = chat(module, 'get quote for Sarah Johnson')
+    assert body['route'] == 'bedrock'
+    assert body['bedrockCalls'] == 1
+    print("   ✅ Fast path disabled by configuration")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Intent Mapper Fast Path...")
+
+    tests = [
+        test_route_confidence_scoring,
+        test_unambiguous_request_skips_bedrock,
+        test_ambiguous_request_goes_to_bedrock,
+        test_fast_path_can_be_disabled
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
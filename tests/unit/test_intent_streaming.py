@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Local tests for the intent mapper's streaming route, which relays Bedrock agent
+output as server-sent events and ends with the usual JSON metadata.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB,
+and intent_stream_server.py stands in for a streaming HTTP endpoint.
+"""
+import sys
+import os
+import json
+import time
+import threading
+import importlib
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from moto import mock_aws
+
+
+class ChunkedAgentRuntime:
+    """Streams the given pieces of completion, pausing `pause` seconds between them"""
+
+    def __init__(self, pieces, pause=0):
+        self.pieces = pieces
+        self.pause = pause
+
+    def invoke_agent(self, **kwargs):
+        def completion():
+            for index, piece in enumerate(self.pieces):
+                if index:
+                    time.sleep(self.pause)
+                yield {'chunk': {'bytes': piece.encode('utf-8')}}
+        return {'completion': completion()}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def load_mapper(pieces, pause=0):
+    """Reload the mapper with a chunked agent, the fast path off and a stubbed direct lookup"""
+    import bedrock_intent_mapper_lambda
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.FAST_PATH_ENABLED = False
+    module.bedrock_agent_runtime = ChunkedAgentRuntime(pieces, pause)
+    module.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: f'Direct {intent} for {doctor_name}'
+    return module
+
+
+def parse_sse(text):
+    """[(event, data)] from a server-sent event stream"""
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def chat_event(text, path='/intent-mapper/stream'):
+    return {'path': path, 'body': json.dumps({'text': text, 'sessionId': 'session-1'})}
+
+
+@mock_aws
+def test_chunks_then_trailing_metadata():
+    """Each agent chunk becomes an event, followed by the same metadata as the JSON route"""
+    module = load_mapper(['Sarah Johnson ', 'charges ', '$250.'])
+
+    events = parse_sse(''.join(module.stream_intent_events(chat_event('get quote for Sarah Johnson'), StubContext())))
+    assert [name for name, _ in events] == ['chunk', 'chunk', 'chunk', 'metadata']
+    assert ''.join(data['text'] for name, data in events if name == 'chunk') == 'Sarah Johnson charges $250.'
+
+    metadata = events[-1][1]
+    assert metadata['response'] == 'Sarah Johnson charges $250.'
+    assert metadata['extractedParams']['doctorName'] == 'Sarah Johnson'
+    assert metadata['fallbackUsed'] is False
+    assert metadata['intentMapped'] is True
+    print("   ✅ Chunks streamed before trailing metadata")
+
+
+@mock_aws
+def test_fallback_replaces_streamed_text():
+    """When a poor agent reply is replaced by the direct lookup, a replace event carries the final answer"""
+    module = load_mapper(["I'm not sure ", "which doctor you mean."])
+
+    events = parse_sse(''.join(module.stream_intent_events(chat_event('show history for Sarah Johnson'), StubContext())))
+    assert [name for name, _ in events] == ['chunk', 'chunk', 'replace', 'metadata']
+    assert events[2][1]['text'] == 'Direct showHistory for Sarah Johnson'
+    assert events[-1][1]['fallbackUsed'] is True
+    print("   ✅ Fallback answer replaced streamed text")
+
+
+@mock_aws
+def test_errors_end_the_stream():
+    """A bad request ends the stream with an error event; the Lambda JSON route is unchanged"""
+    module = load_mapper(['Sarah Johnson ', 'charges $250.'])
+
+    events = parse_sse(''.join(module.stream_intent_events({'path': '/intent-mapper/stream'}, StubContext())))
+    assert events == [('error', {'message': 'Request body is missing.', 'statusCode': 400})]
+
+    response = module.lambda_handler(chat_event('get quote for Sarah Johnson', '/intent-mapper'), StubContext())
+    assert response['headers']['Content-Type'] == 'application/json'
+    assert json.loads(response['body'])['response'] == 'Sarah Johnson charges $250.'
+    print("   ✅ Errors end the stream")
+
+
+@mock_aws
+def test_local_server_relays_chunks_as_they_arrive():
+    """The first chunk reaches an HTTP client while the agent is still producing the rest"""
+    load_mapper(['Sarah Johnson ', 'charges $250.'], pause=0.5)
+    from intent_stream_server import make_server
+
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=5)
+        start = time.perf_counter()
+        connection.request('POST', '/intent-mapper/stream', body=json.dumps({'text': 'get quote for Sarah Johnson'}))
+        response = connection.getresponse()
+        assert response.getheader('Content-Type') == 'text/event-stream'
+
+        first_line = response.readline().decode('utf-8')
+        first_event_at = time.perf_counter() - start
+        body = first_line + response.read().decode('utf-8')
+        total = time.perf_counter() - start
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert first_line == 'event: chunk\n'
+    assert first_event_at < 0.4 <= total, (first_event_at, total)
+    assert parse_sse(body)[-1][1]['response'] == 'Sarah Johnson charges $250.'
+    print(f"   ✅ First chunk after {first_event_at * 1000:.0f} ms of {total * 1000:.0f} ms")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Intent Mapper Streaming...")
+
+    tests = [
+        test_chunks_then_trailing_metadata,
+        test_fallback_replaces_streamed_text,
+        test_errors_end_the_stream,
+        test_local_server_relays_chunks_as_they_arrive
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
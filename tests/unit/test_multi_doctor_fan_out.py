@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Local tests for questions about several doctors ("compare Sarah Johnson and Robert
+Brown for ENDO001"): every doctor is extracted, and the per-doctor lookups run in
+parallel and are merged into one answer.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import time
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+from moto import mock_aws
+
+LOOKUP_SECONDS = 0.2
+
+
+class CountingAgentRuntime:
+    """Answers every call with a fixed completion, counting calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_agent(self, **kwargs):
+        self.calls += 1
+        return {'completion': [{'chunk': {'bytes': b'Agent answer.'}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def load_mapper(unavailable=()):
+    """Reload the mapper with slow direct lookups that return None for `unavailable` doctors"""
+    import bedrock_intent_mapper_lambda
+    import startup
+    from retry_budget import TokenBucket
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.RESPONSE_CACHE_ENABLED = False
+    module.session_store = None
+    module.bedrock_agent_runtime = CountingAgentRuntime()
+    module.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+
+    def direct(intent, doctor_name, procedure_code=None):
+        time.sleep(LOOKUP_SECONDS)
+        if doctor_name in unavailable:
+            return None
+        return f'{intent} {procedure_code or "all"} for {doctor_name}'
+
+    module.try_direct_lambda_invocation = direct
+    # Build the clients now, so timings don't include a cold start
+    startup.warm()
+    return module
+
+
+def chat(module, text):
+    event = {'body': json.dumps({'text': text, 'sessionId': 'session-1'})}
+    return json.loads(module.lambda_handler(event, StubContext())['body'])
+
+
+@mock_aws
+def test_comparison_extracts_every_doctor():
+    """A comparison names every doctor and is read as a quote request"""
+    module = load_mapper()
+
+    extracted = module.extract_parameters_from_text('compare Sarah Johnson and Robert Brown for ENDO001')
+    assert extracted['intent'] == 'getQuote'
+    assert extracted['matchSources']['intent'] == 'comparison'
+    assert extracted['doctorNames'] == ['Sarah Johnson', 'Robert Brown']
+    assert extracted['doctorName'] == 'Sarah Johnson'
+    assert extracted['procedureCode'] == 'ENDO001'
+    assert 'Sarah Johnson, Robert Brown' in extracted['enhanced_prompt']
+
+    single = module.extract_parameters_from_text('get quote for Sarah Johnson')
+    assert single['doctorNames'] == ['Sarah Johnson']
+    assert not module.is_fan_out_request(single)
+    print("   ✅ Comparison extracted every doctor")
+
+
+@mock_aws
+def test_lookups_run_in_parallel():
+    """Three doctors are answered in about the time of one lookup, in the order they were named"""
+    module = load_mapper()
+
+    start = time.perf_counter()
+    body = chat(module, 'compare Sarah Johnson, Robert Brown and Emily Davis for ENDO001')
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 2 * LOOKUP_SECONDS, elapsed
+    assert body['route'] == 'local'
+    assert body['bedrockCalls'] == 0
+    assert body['response'].split('\n') == [
+        'Quotes for ENDO001:',
+        '• Sarah Johnson: getQuote ENDO001 for Sarah Johnson',
+        '• Robert Brown: getQuote ENDO001 for Robert Brown',
+        '• Emily Davis: getQuote ENDO001 for Emily Davis'
+    ]
+    assert module.bedrock_agent_runtime.calls == 0
+    print(f"   ✅ Three lookups took {elapsed * 1000:.0f} ms")
+
+
+@mock_aws
+def test_history_for_several_doctors():
+    """History requests fan out too; a doctor whose lookup fails is still listed"""
+    module = load_mapper(unavailable=('Robert Brown',))
+
+    body = chat(module, 'show history for Sarah Johnson and Robert Brown')
+    assert body['response'].split('\n') == [
+        'Procedure history:',
+        '• Sarah Johnson: showHistory all for Sarah Johnson',
+        '• Robert Brown: No answer available right now.'
+    ]
+    print("   ✅ History fanned out with a failed lookup")
+
+
+@mock_aws
+def test_no_lookup_answers_falls_back_to_agent():
+    """If every lookup fails, the agent is asked to compare the doctors"""
+    module = load_mapper(unavailable=('Sarah Johnson', 'Robert Brown'))
+
+    body = chat(module, 'compare Sarah Johnson and Robert Brown')
+    assert body['route'] == 'bedrock'
+    assert body['response'] == 'Agent answer.'
+    assert module.bedrock_agent_runtime.calls == 1
+    print("   ✅ Agent answered when no lookup did")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Multi-Doctor Fan-Out...")
+
+    tests = [
+        test_comparison_extracts_every_doctor,
+        test_lookups_run_in_parallel,
+        test_history_for_several_doctors,
+        test_no_lookup_answers_falls_back_to_agent
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
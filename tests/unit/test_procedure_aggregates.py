@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Local tests for transactional procedure writes with registry/aggregate updates,
+and for the aggregate rebuild job.
+Uses moto to stand in for DynamoDB, so no AWS account or Docker is required.
+"""
+import sys
+import os
+import json
+import importlib
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/add_doctor_procedure'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+
+def create_tables():
+    """Create the DoctorProcedures and DoctorProcedureStats tables"""
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    stats_table = dynamodb.create_table(
+        TableName='DoctorProcedureStats',
+        KeySchema=[
+            {'AttributeName': 'PK', 'KeyType': 'HASH'},
+            {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'PK', 'AttributeType': 'S'},
+            {'AttributeName': 'SK', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    return table, stats_table
+
+
+def load_modules():
+    import procedure_queue
+    import add_doctor_procedure_lambda
+    return importlib.reload(procedure_queue), importlib.reload(add_doctor_procedure_lambda)
+
+
+def get_stats(stats_table, sort_key, partition_key='DOCTOR#Robert Brown'):
+    return stats_table.get_item(Key={'PK': partition_key, 'SK': sort_key}).get('Item')
+
+
+@mock_aws
+def test_add_updates_registry_and_aggregates():
+    """A single add writes the row, the registry entry and both stats items"""
+    table, stats_table = create_tables()
+    _, module = load_modules()
+
+    for cost in (100, 300):
+        result = module.lambda_handler({'body': json.dumps({
+            'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': cost
+        })}, None)
+        assert result['statusCode'] == 200, result
+
+    profile = get_stats(stats_table, 'PROFILE')
+    assert profile['doctor_name'] == 'Robert Brown'
+    assert profile['procedure_codes'] == {'XRAY001'}
+
+    for sort_key in ('STATS#XRAY001', 'STATS#*'):
+        stats = get_stats(stats_table, sort_key)
+        assert stats['procedure_count'] == 2
+        assert stats['total_cost'] == Decimal('400')
+    assert table.scan()['Count'] == 2
+    print("   ✅ Row, registry and aggregates written together")
+
+
+@mock_aws
+def test_idempotency_key_replay_counts_once():
+    """Replaying a request with the same idempotency key neither duplicates the row nor the aggregates"""
+    table, stats_table = create_tables()
+    _, module = load_modules()
+
+    event = {
+        'headers': {'Idempotency-Key': 'req-123'},
+        'body': json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 150,
+                            'time': '2025-06-01T10:00:00Z'})
+    }
+    first = json.loads(module.lambda_handler(event, None)['body'])
+    second = json.loads(module.lambda_handler(event, None)['body'])
+
+    assert first['procedureTime'] == second['procedureTime']
+    assert table.scan()['Count'] == 1
+    assert get_stats(stats_table, 'STATS#XRAY001')['procedure_count'] == 1
+    print("   ✅ Idempotent replay counted once")
+
+
+@mock_aws
+def test_idempotency_key_replay_without_time_counts_once():
+    """Without a time every retry gets a new current time, yet the key still maps to one row on every path"""
+    table, stats_table = create_tables()
+    procedure_queue, module = load_modules()
+    module.BULK_WRITE_CONCURRENCY = 1  # moto's TransactWriteItems is not thread-safe
+
+    event = {
+        'headers': {'Idempotency-Key': 'req-456'},
+        'body': json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 150})
+    }
+    first = json.loads(module.lambda_handler(event, None)['body'])
+    second = json.loads(module.lambda_handler(event, None)['body'])
+    assert second['replayed'] is True and 'replayed' not in first
+    assert (second['procedureTime'], second['timeLogged']) == (first['procedureTime'], first['timeLogged'])
+
+    # The same key in a bulk request, twice, and in the queue
+    rows = [{'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 150, 'idempotencyKey': key}
+            for key in ('req-456', 'req-789', 'req-789')]
+    results = json.loads(module.bulk_lambda_handler({'body': json.dumps(rows)}, None)['body'])['results']
+    assert results[0]['replayed'] is True and results[0]['procedureTime'] == first['procedureTime']
+    assert results[1]['status'] == 'written' and results[2]['status'] == 'failed'
+
+    module.PROCEDURE_WRITE_MODE = 'async'
+    for _ in range(2):
+        module.lambda_handler(dict(event, headers={'Idempotency-Key': 'req-999'}), None)
+    module.lambda_handler(event, None)
+    assert module.queue_lambda_handler(procedure_queue.drain_local_queue(), None) == {'batchItemFailures': []}
+
+    assert table.scan()['Count'] == 3
+    assert get_stats(stats_table, 'STATS#XRAY001')['procedure_count'] == 3
+
+    # A racing retry that missed the lookup is stopped by the key claim in its transaction
+    module.PROCEDURE_WRITE_MODE = 'sync'
+    module.claimed_procedures = lambda keys: {}
+    module.lambda_handler(event, None)
+    assert table.scan()['Count'] == 3
+    assert get_stats(stats_table, 'STATS#XRAY001')['procedure_count'] == 3
+    print("   ✅ Idempotent replay without a time counted once")
+
+
+@mock_aws
+def test_conflict_retry_resends_the_same_claim():
+    """A retried transaction sends the same key claim under the same token, however much time has passed"""
+    table, stats_table = create_tables()
+    _, module = load_modules()
+    module.backoff_delay = lambda attempt: 0
+
+    import procedure_aggregates
+    clock = [1750000000.0]
+
+    class Clock:
+        @staticmethod
+        def time():
+            clock[0] += 60
+            return clock[0]
+
+    real_transact_write = module.dynamodb.meta.client.transact_write_items
+    calls = []
+
+    def conflicting_transact_write(TransactItems, ClientRequestToken, **kwargs):
+        # DynamoDB rejects a reused token whose request differs (IdempotentParameterMismatchException)
+        calls.append((ClientRequestToken, json.dumps(TransactItems, default=str, sort_keys=True)))
+        if len(calls) == 1:
+            raise ClientError({
+                'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                'CancellationReasons': [{'Code': 'None'}] * (len(TransactItems) - 1) + [{'Code': 'TransactionConflict'}]
+            }, 'TransactWriteItems')
+        return real_transact_write(TransactItems=TransactItems, ClientRequestToken=ClientRequestToken, **kwargs)
+
+    procedure_aggregates.time, real_time = Clock, procedure_aggregates.time
+    module.dynamodb.meta.client.transact_write_items = conflicting_transact_write
+    try:
+        result = module.lambda_handler({
+            'headers': {'Idempotency-Key': 'req-321'},
+            'body': json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'XRAY001', 'cost': 150})
+        }, None)
+    finally:
+        procedure_aggregates.time = real_time
+        module.dynamodb.meta.client.transact_write_items = real_transact_write
+
+    assert result['statusCode'] == 200, result
+    assert len(calls) == 2 and calls[0] == calls[1]
+    assert table.scan()['Count'] == 1
+    print("   ✅ Conflict retry resent the same claim")
+
+
+@mock_aws
+def test_numeric_procedure_codes_are_strings():
+    """A code sent as a JSON number is stored as a string, so the registry's code set keeps one type"""
+    table, stats_table = create_tables()
+    _, module = load_modules()
+
+    for code in (101, 'LAB001'):
+        result = module.lambda_handler({'body': json.dumps({'doctorName': 'Robert Brown', 'procedureCode': code, 'cost': 80})}, None)
+        assert result['statusCode'] == 200, result
+    rows = [{'doctorName': 'Robert Brown', 'procedureCode': 102, 'cost': 80}]
+    assert module.bulk_lambda_handler({'body': json.dumps(rows)}, None)['statusCode'] == 200
+
+    assert get_stats(stats_table, 'PROFILE')['procedure_codes'] == {'101', '102', 'LAB001'}
+    assert get_stats(stats_table, 'STATS#101')['procedure_count'] == 1
+    print("   ✅ Numeric procedure codes stored as strings")
+
+
+@mock_aws
+def test_bulk_and_queue_paths_keep_aggregates_exact():
+    """Bulk rows and redelivered queue messages are aggregated exactly once"""
+    _, stats_table = create_tables()
+    procedure_queue, module = load_modules()
+
+    rows = [
+        {'doctorName': 'Robert Brown', 'procedureCode': 'LAB001' if i % 2 else 'XRAY001', 'cost': 100 + i,
+         'time': f'2025-06-02T09:{i:02d}:00Z'}
+        for i in range(40)
+    ]
+    result = module.bulk_lambda_handler({'body': json.dumps(rows)}, None)
+    assert result['statusCode'] == 200, result
+
+    module.PROCEDURE_WRITE_MODE = 'async'
+    module.lambda_handler({'body': json.dumps({'doctorName': 'Robert Brown', 'procedureCode': 'LAB001', 'cost': 90})}, None)
+    event = procedure_queue.drain_local_queue()
+    assert module.queue_lambda_handler(event, None) == {'batchItemFailures': []}
+    assert module.queue_lambda_handler(event, None) == {'batchItemFailures': []}
+
+    assert get_stats(stats_table, 'STATS#*')['procedure_count'] == 41
+    assert get_stats(stats_table, 'STATS#LAB001')['procedure_count'] == 21
+    assert get_stats(stats_table, 'PROFILE')['procedure_codes'] == {'LAB001', 'XRAY001'}
+    print("   ✅ Bulk and queue writes aggregated once")
+
+
+def test_sketch_estimates_median():
+    """The cost sketch estimates quantiles within about 1%"""
+    from procedure_aggregates import aggregate_rows, sketch_from_item, aggregate_item, estimate_quantile
+
+    items = [
+        {'DoctorName': 'Robert Brown', 'procedure_code': 'LAB001', 'cost': Decimal(cost)}
+        for cost in range(50, 251)
+    ]
+    deltas = aggregate_rows(items)
+    key = ('DOCTOR#Robert Brown', 'STATS#LAB001')
+    sketch = sketch_from_item(aggregate_item(key, deltas[key]))
+
+    median = estimate_quantile(sketch, 0.5)
+    assert abs(median - 150) / 150 <= 0.01, median
+    assert estimate_quantile({}, 0.5) is None
+    print("   ✅ Sketch median within 1%")
+
+
+@mock_aws
+def test_rebuild_repairs_drift():
+    """The rebuild job rewrites drifted aggregates and removes stale ones"""
+    table, stats_table = create_tables()
+    _, module = load_modules()
+    import rebuild_aggregates
+
+    rows = [
+        {'doctorName': doctor, 'procedureCode': 'CONS001', 'cost': 200, 'time': f'2025-06-03T09:0{i}:00Z'}
+        for doctor in ('Robert Brown', 'Emily Davis') for i in range(3)
+    ]
+    module.BULK_WRITE_CONCURRENCY = 1  # moto's TransactWriteItems is not thread-safe
+    module.bulk_lambda_handler({'body': json.dumps(rows)}, None)
+
+    # Legacy row written before aggregates existed, a corrupted counter and a stale item
+    table.put_item(Item={'DoctorName': 'Robert Brown', 'ProcedureTime': '2024-01-01T09:00:00Z',
+                         'procedure_code': 'CONS001', 'cost': Decimal('100'), 'time_logged': '2024-01-01T09:00:00Z'})
+    stats_table.update_item(Key={'PK': 'DOCTOR#Emily Davis', 'SK': 'STATS#*'},
+                            UpdateExpression='SET procedure_count = :zero', ExpressionAttributeValues={':zero': 0})
+    stats_table.put_item(Item={'PK': 'DOCTOR#Emily Davis', 'SK': 'STATS#LAB001', 'procedure_count': 1})
+
+    # An idempotency key record shares the stats table but is not an aggregate
+    from procedure_aggregates import idempotency_record_key
+    claim = dict(idempotency_record_key('req-1'), doctor_partition='Robert Brown', procedure_time='2025-06-03T09:00:00Z#X')
+    stats_table.put_item(Item=claim)
+
+    procedures, aggregates, changed, removed = rebuild_aggregates.rebuild_aggregates(
+        table, stats_table, total_segments=3, dry_run=True
+    )
+    assert (procedures, aggregates, changed, removed) == (7, 6, 3, 1)
+    assert get_stats(stats_table, 'STATS#*', 'DOCTOR#Emily Davis')['procedure_count'] == 0
+
+    rebuild_aggregates.rebuild_aggregates(table, stats_table, total_segments=3)
+    assert get_stats(stats_table, 'STATS#*', 'DOCTOR#Emily Davis')['procedure_count'] == 3
+    assert get_stats(stats_table, 'STATS#CONS001')['total_cost'] == Decimal('700')
+    assert get_stats(stats_table, 'STATS#LAB001', 'DOCTOR#Emily Davis') is None
+    assert rebuild_aggregates.rebuild_aggregates(table, stats_table, dry_run=True)[2:] == (0, 0)
+    assert get_stats(stats_table, claim['SK'], claim['PK']) == claim
+    print("   ✅ Rebuild repaired drift")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Procedure Aggregates...")
+
+    tests = [
+        test_add_updates_registry_and_aggregates,
+        test_idempotency_key_replay_counts_once,
+        test_idempotency_key_replay_without_time_counts_once,
+        test_conflict_retry_resends_the_same_claim,
+        test_numeric_procedure_codes_are_strings,
+        test_bulk_and_queue_paths_keep_aggregates_exact,
+        test_sketch_estimates_median,
+        test_rebuild_repairs_drift
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Local tests for coalescing identical concurrent intent requests, within a
+container (SingleFlight) and across containers (DynamoDB lease items).
+The Bedrock agent is replaced with a stub; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import time
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from moto import mock_aws
+
+
+class SlowAgentRuntime:
+    """Answers after `delay` seconds, counting calls"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke_agent(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return {'completion': [{'chunk': {'bytes': b'Sarah Johnson charges $250.'}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def create_coordination_table():
+    return boto3.resource('dynamodb').create_table(
+        TableName='IntentCoordination',
+        KeySchema=[{'AttributeName': 'PK', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'PK', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def load_mapper(agent):
+    """Reload the mapper with a slow agent, no rate limit, and the fast path, cache and sessions off"""
+    import bedrock_intent_mapper_lambda
+    import startup
+    from retry_budget import TokenBucket
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.FAST_PATH_ENABLED = False
+    module.RESPONSE_CACHE_ENABLED = False
+    module.session_store = None
+    module.bedrock_agent_runtime = agent
+    module.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    # Build the clients now, so timings don't include a cold start
+    startup.warm()
+    return module
+
+
+def test_single_flight_shares_one_call():
+    """Concurrent callers with the same key wait for the first; other keys run separately"""
+    from single_flight import SingleFlight
+
+    flights = SingleFlight()
+    runs = []
+
+    def work(value):
+        runs.append(value)
+        time.sleep(0.2)
+        return value
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        same = [executor.submit(flights.do, 'key', lambda: work('shared')) for _ in range(5)]
+        other = executor.submit(flights.do, 'other', lambda: work('other'))
+        results = [future.result() for future in same]
+
+    assert runs.count('shared') == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 'shared' for result, _ in results)
+    assert other.result() == ('other', False)
+    assert flights.calls == {}
+    print("   ✅ Single flight shared one call")
+
+
+@mock_aws
+def test_duplicate_requests_share_one_agent_call():
+    """A burst of identical requests from different sessions makes one agent call"""
+    agent = SlowAgentRuntime(0.3)
+    module = load_mapper(agent)
+
+    def chat(session_id):
+        event = {'body': json.dumps({'text': 'get quote for Sarah Johnson', 'sessionId': session_id})}
+        return json.loads(module.lambda_handler(event, StubContext())['body'])
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        bodies = list(executor.map(chat, ['a', 'b', 'c', 'd']))
+
+    assert agent.calls == 1
+    assert sorted(body['coalesced'] for body in bodies) == [False, True, True, True]
+    assert {body['response'] for body in bodies} == {'Sarah Johnson charges $250.'}
+    assert {body['sessionId'] for body in bodies} == {'a', 'b', 'c', 'd'}
+
+    # Once the burst is over, a new request calls the agent again
+    assert chat('e')['coalesced'] is False
+    assert agent.calls == 2
+    print("   ✅ Burst of duplicates made one agent call")
+
+
+@mock_aws
+def test_lease_coalesces_across_containers():
+    """Two callers that share only the lease table run the work once"""
+    from single_flight import lease_flight
+
+    table = create_coordination_table()
+    runs = []
+
+    def work():
+        runs.append(1)
+        time.sleep(0.3)
+        return {'response': 'Sarah Johnson charges $250.'}
+
+    def container(owner):
+        return lease_flight(table, ['getQuote', 'Sarah Johnson', None], work, owner=owner, poll_interval=0.05)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(container, 'container-1')
+        time.sleep(0.05)
+        follower = executor.submit(container, 'container-2')
+        results = [leader.result(), follower.result()]
+
+    assert len(runs) == 1
+    assert results == [({'response': 'Sarah Johnson charges $250.'}, False), ({'response': 'Sarah Johnson charges $250.'}, True)]
+    print("   ✅ Lease shared the result across containers")
+
+
+@mock_aws
+def test_failed_leader_releases_lease():
+    """If the leader fails, a waiting caller runs the work itself instead of waiting out the lease"""
+    from single_flight import lease_flight
+
+    table = create_coordination_table()
+
+    def failing_work():
+        time.sleep(0.2)
+        raise RuntimeError('Bedrock unavailable')
+
+    def leader():
+        try:
+            lease_flight(table, ['showHistory', 'Sarah Johnson', None], failing_work, owner='container-1')
+        except RuntimeError:
+            return 'failed'
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader_future = executor.submit(leader)
+        time.sleep(0.05)
+        start = time.perf_counter()
+        result = lease_flight(table, ['showHistory', 'Sarah Johnson', None], lambda: 'answered here',
+                              owner='container-2', poll_interval=0.05)
+        elapsed = time.perf_counter() - start
+
+    assert leader_future.result() == 'failed'
+    assert result == ('answered here', False)
+    assert elapsed < 1, elapsed
+    print("   ✅ Failed leader released the lease")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Request Coalescing...")
+
+    tests = [
+        test_single_flight_shares_one_call,
+        test_duplicate_requests_share_one_agent_call,
+        test_lease_coalesces_across_containers,
+        test_failed_leader_releases_lease
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Local tests for the intent mapper's response cache, keyed on the normalized
+(intent, doctorName, procedureCode) and invalidated when the doctor's data changes.
+The Bedrock agent is replaced with a stub; moto stands in for DynamoDB, and
+procedures are written through the real add function.
+"""
+import sys
+import os
+import json
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/add_doctor_procedure'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from decimal import Decimal
+from moto import mock_aws
+
+
+class CountingAgentRuntime:
+    """Answers with a numbered completion, so each agent call is distinguishable"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_agent(self, **kwargs):
+        self.calls += 1
+        completion = f'Answer {self.calls} for Sarah Johnson.'
+        return {'completion': [{'chunk': {'bytes': completion.encode('utf-8')}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def create_tables():
+    """Create the DoctorProcedures and DoctorProcedureStats tables"""
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.create_table(
+        TableName='DoctorProcedureStats',
+        KeySchema=[
+            {'AttributeName': 'PK', 'KeyType': 'HASH'},
+            {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'PK', 'AttributeType': 'S'},
+            {'AttributeName': 'SK', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def load_modules():
+    """Reload the add function and the mapper, with the mapper's fast path off"""
+    import add_doctor_procedure_lambda
+    import bedrock_intent_mapper_lambda
+    add_module = importlib.reload(add_doctor_procedure_lambda)
+    mapper = importlib.reload(bedrock_intent_mapper_lambda)
+    mapper.FAST_PATH_ENABLED = False
+    mapper.bedrock_agent_runtime = CountingAgentRuntime()
+    return add_module, mapper
+
+
+def add_procedure(add_module, cost, doctor_name='Sarah Johnson'):
+    result = add_module.lambda_handler({'body': json.dumps({
+        'doctorName': doctor_name, 'procedureCode': 'ENDO001', 'cost': cost
+    })}, None)
+    assert result['statusCode'] == 200, result
+
+
+def chat(mapper, text):
+    event = {'body': json.dumps({'text': text, 'sessionId': 'session-1'})}
+    return json.loads(mapper.lambda_handler(event, StubContext())['body'])
+
+
+def test_cache_expiry_versions_and_eviction():
+    """Entries expire after the TTL, only match their own version, and the oldest are evicted"""
+    from response_cache import ResponseCache
+
+    now = [0.0]
+    cache = ResponseCache(ttl_seconds=10, max_entries=2, clock=lambda: now[0])
+    cache.put('a', 'v1', 'answer a')
+    assert cache.get('a', 'v1') == 'answer a'
+    assert cache.get('a', 'v2') is None
+    assert cache.get('a', 'v1') is None  # dropped by the version mismatch
+
+    cache.put('a', 'v1', 'answer a')
+    now[0] = 10
+    assert cache.get('a', 'v1') is None
+
+    for key in ('a', 'b', 'c'):
+        cache.put(key, 'v1', f'answer {key}')
+    assert cache.get('a', 'v1') is None
+    assert cache.get('c', 'v1') == 'answer c'
+    print("   ✅ TTL, versions and eviction")
+
+
+@mock_aws
+def test_repeated_question_skips_bedrock():
+    """Differently worded requests for the same quote are answered once by the agent"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 250)
+    add_procedure(add_module, 300, 'Emily Davis')
+
+    first = chat(mapper, 'get quote for Sarah Johnson ENDO001')
+    assert first['route'] == 'bedrock'
+    second = chat(mapper, 'what is the price for sarah johnson endo001?')
+    assert second['route'] == 'cache'
+    assert second['bedrockCalls'] == 0
+    assert second['response'] == first['response'] == 'Answer 1 for Sarah Johnson.'
+    assert mapper.bedrock_agent_runtime.calls == 1
+
+    # A different procedure, or an ambiguous request, is not served from this entry
+    assert chat(mapper, 'get quote for Sarah Johnson LAB001')['route'] == 'bedrock'
+    assert chat(mapper, 'compare quote for Sarah Johnson and Emily Davis ENDO001')['route'] == 'bedrock'
+    print("   ✅ Repeated question answered from the cache")
+
+
+@mock_aws
+def test_new_procedure_invalidates_cached_answers():
+    """Writing a procedure for the doctor changes its data version, so the agent is asked again"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 250)
+
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'bedrock'
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'cache'
+
+    add_procedure(add_module, 400)
+    body = chat(mapper, 'show history for Sarah Johnson')
+    assert body['route'] == 'bedrock'
+    assert body['response'] == 'Answer 2 for Sarah Johnson.'
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'cache'
+    print("   ✅ New procedure invalidated the cached answer")
+
+
+@mock_aws
+def test_poor_answers_are_not_cached():
+    """Agent replies that needed the fallback (or guidance) are never reused"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 250)
+    mapper.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: None
+
+    class UnsureAgentRuntime:
+        def invoke_agent(self, **kwargs):
+            return {'completion': [{'chunk': {'bytes': b"I'm not sure which doctor you mean."}}]}
+
+    mapper.bedrock_agent_runtime = UnsureAgentRuntime()
+    assert chat(mapper, 'get quote for Sarah Johnson')['route'] == 'bedrock'
+    assert chat(mapper, 'get quote for Sarah Johnson')['route'] == 'bedrock'
+    print("   ✅ Poor answers not cached")
+
+
+@mock_aws
+def test_rows_without_aggregates_are_not_cached():
+    """Rows loaded around the add functions leave no data version, so answers aren't cached until a rebuild"""
+    create_tables()
+    _, mapper = load_modules()
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table('DoctorProcedures')
+    table.put_item(Item={'DoctorName': 'Sarah Johnson', 'ProcedureTime': '2025-07-01T10:00:00Z',
+                         'procedure_code': 'ENDO001', 'cost': Decimal('250'), 'time_logged': '2025-07-01T10:00:00Z'})
+
+    assert mapper.doctor_data_version('Sarah Johnson') is None
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'bedrock'
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'bedrock'
+
+    import rebuild_aggregates
+    rebuild_aggregates.rebuild_aggregates(table, dynamodb.Table('DoctorProcedureStats'), total_segments=1)
+    assert mapper.doctor_data_version('Sarah Johnson') == '1:250'
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'bedrock'
+    assert chat(mapper, 'show history for Sarah Johnson')['route'] == 'cache'
+    print("   ✅ Rows without aggregates not cached until rebuilt")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Response Cache...")
+
+    tests = [
+        test_cache_expiry_versions_and_eviction,
+        test_repeated_question_skips_bedrock,
+        test_new_procedure_invalidates_cached_answers,
+        test_poor_answers_are_not_cached,
+        test_rows_without_aggregates_are_not_cached
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Local tests for the shared response envelopes: Decimal serialization with and
+without orjson, the Bedrock and API Gateway envelopes, and a handler answering a
+Bedrock agent through them. Uses moto to stand in for DynamoDB.
+"""
+import sys
+import os
+import json
+import importlib
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/show_history_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from moto import mock_aws
+
+import response_envelopes
+
+BEDROCK_EVENT = {
+    'messageVersion': '1.0',
+    'agent': {'id': 'test-agent'},
+    'actionGroup': 'HistoryActions',
+    'apiPath': '/showHistory',
+    'httpMethod': 'GET',
+    'parameters': []
+}
+
+
+def test_decimals_serialized_by_both_backends():
+    """Decimals become numbers, and both backends write the same compact JSON"""
+    body = {'message': 'Café costs', 'totalCost': Decimal('500.50'), 'history': [{'cost': Decimal('250')}], 'count': 2}
+    fast_backend = response_envelopes.orjson
+    try:
+        response_envelopes.orjson = None
+        stdlib = response_envelopes.to_json(body)
+    finally:
+        response_envelopes.orjson = fast_backend
+
+    assert stdlib == '{"message":"Café costs","totalCost":500.5,"history":[{"cost":250.0}],"count":2}'
+    if fast_backend is not None:
+        assert response_envelopes.to_json(body) == stdlib
+    try:
+        response_envelopes.to_json({'when': object()})
+        assert False, 'expected TypeError'
+    except TypeError:
+        pass
+    print("   ✅ Decimals serialized by both backends")
+
+
+def test_envelopes_match_the_caller():
+    """Bedrock callers get the action group envelope echoing the event; others get API Gateway's"""
+    assert response_envelopes.is_bedrock_agent_event(BEDROCK_EVENT)
+    assert not response_envelopes.is_bedrock_agent_event({'queryStringParameters': {}})
+
+    bedrock = response_envelopes.build_response(BEDROCK_EVENT, True, 404, {'message': 'No doctor'}, 'ShowHistoryGroup', '/showHistory')
+    assert bedrock['messageVersion'] == '1.0'
+    assert bedrock['response']['actionGroup'] == 'HistoryActions'
+    assert bedrock['response']['httpStatusCode'] == 404
+    assert json.loads(bedrock['response']['responseBody']['application/json']['body']) == {'message': 'No doctor'}
+
+    defaults = response_envelopes.build_response({}, True, 200, {}, 'AddDoctorProcedureGroup', '/addDoctorProcedure', 'POST')['response']
+    assert (defaults['actionGroup'], defaults['apiPath'], defaults['httpMethod']) == ('AddDoctorProcedureGroup', '/addDoctorProcedure', 'POST')
+
+    api = response_envelopes.build_response({}, False, 201, {'ok': True}, 'ShowHistoryGroup', '/showHistory')
+    assert api['statusCode'] == 201
+    assert api['headers'] == {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    api['headers']['X-Changed'] = 'yes'
+    assert 'X-Changed' not in response_envelopes.API_GATEWAY_HEADERS
+    print("   ✅ Envelopes match the caller")
+
+
+@mock_aws
+def test_handler_answers_bedrock_with_decimal_costs():
+    """Show history answers a Bedrock agent in its envelope, including for a bad endDate"""
+    table = boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    for day, cost in [(1, '250'), (2, '80.25')]:
+        table.put_item(Item={
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'2025-07-0{day}T10:00:00Z',
+            'procedure_code': 'CONS001',
+            'procedure_name': 'Initial Consultation',
+            'cost': Decimal(cost),
+            'time_logged': f'2025-07-0{day}T10:00:00Z'
+        })
+    import show_history_lambda
+    module = importlib.reload(show_history_lambda)
+
+    event = dict(BEDROCK_EVENT, parameters=[{'name': 'doctorName', 'value': 'Sarah Johnson'}])
+    response = module.lambda_handler(event, None)['response']
+    body = json.loads(response['responseBody']['application/json']['body'])
+    assert response['httpStatusCode'] == 200
+    assert body['totalCost'] == 330.25
+    assert [item['cost'] for item in body['history']] == [80.25, 250.0]
+
+    event['parameters'].append({'name': 'endDate', 'value': 'not-a-date'})
+    response = module.lambda_handler(event, None)['response']
+    assert response['httpStatusCode'] == 400
+    assert 'endDate' in json.loads(response['responseBody']['application/json']['body'])['message']
+    print("   ✅ Handler answered Bedrock with Decimal costs")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Response Envelopes...")
+
+    tests = [
+        test_decimals_serialized_by_both_backends,
+        test_envelopes_match_the_caller,
+        test_handler_answers_bedrock_with_decimal_costs
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Local tests for server-side conversation sessions: incremental session updates,
+the DynamoDB and in-memory stores, and follow-up questions resolved without
+conversationHistory in the request.
+The Bedrock agent is replaced with a stub; moto stands in for DynamoDB.
+"""
+import sys
+import os
+import json
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from moto import mock_aws
+
+
+class RecordingAgentRuntime:
+    """Records every prompt and answers with a fixed completion"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def invoke_agent(self, **kwargs):
+        self.prompts.append(kwargs['inputText'])
+        return {'completion': [{'chunk': {'bytes': b'Here is what I found for that doctor.'}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def create_sessions_table():
+    return boto3.resource('dynamodb').create_table(
+        TableName='ConversationSessions',
+        KeySchema=[{'AttributeName': 'SessionId', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'SessionId', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def load_mapper():
+    """Reload the mapper with a recording agent, no rate limit, and the fast path and response cache off"""
+    import bedrock_intent_mapper_lambda
+    from retry_budget import TokenBucket
+    module = importlib.reload(bedrock_intent_mapper_lambda)
+    module.FAST_PATH_ENABLED = False
+    module.RESPONSE_CACHE_ENABLED = False
+    module.bedrock_agent_runtime = RecordingAgentRuntime()
+    module.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    return module
+
+
+def chat(module, text, session_id='session-1'):
+    event = {'body': json.dumps({'text': text, 'sessionId': session_id})}
+    return json.loads(module.lambda_handler(event, StubContext())['body'])
+
+
+def test_session_updates_stay_bounded():
+    """However many turns are applied, the context and summary stay the same size"""
+    from session_store import new_session, update_session, MAX_CONTEXT_ENTITIES, SUMMARY_TURNS
+
+    session = new_session()
+    for turn in range(50):
+        extracted = {'intent': 'getQuote', 'doctorName': f'Doctor {turn}', 'procedureCode': f'LAB{turn:03d}'}
+        session = update_session(session, f'get quote for Doctor {turn} ' + 'x' * 500, extracted, 'answer ' * 100)
+
+    assert session['turns'] == 50
+    assert session['doctors'][0] == 'Doctor 49'
+    assert len(session['doctors']) == len(session['procedures']) == MAX_CONTEXT_ENTITIES
+    assert len(session['summary']) == 2 * SUMMARY_TURNS
+    assert all(len(line) <= 131 for line in session['summary'])
+
+    # A turn without a doctor keeps the previous doctor as the most recent one
+    session = update_session(session, 'and the history?', {'intent': 'showHistory', 'doctorName': None}, 'ok')
+    assert session['doctors'][0] == 'Doctor 49'
+    assert session['lastIntent'] == 'showHistory'
+    print("   ✅ Session context and summary bounded")
+
+
+@mock_aws
+def test_follow_up_resolved_from_dynamodb_session():
+    """A follow-up with no conversationHistory resolves its doctor from the stored session"""
+    table = create_sessions_table()
+    module = load_mapper()
+
+    chat(module, 'show history for Sarah Johnson')
+    body = chat(module, 'what about her costs for ENDO001')
+    assert body['extractedParams']['doctorName'] == 'Sarah Johnson'
+    assert body['extractedParams']['intent'] == 'getQuote'
+    assert body['contextUsed'] is True
+
+    item = table.get_item(Key={'SessionId': 'session-1'})['Item']
+    assert item['turns'] == 2
+    assert item['doctors'] == ['Sarah Johnson']
+    assert item['procedures'] == ['ENDO001']
+    assert item['expiresAt'] > 0
+
+    # Other sessions don't share the context
+    assert chat(module, 'what about her costs', 'session-2')['extractedParams']['doctorName'] is None
+    print("   ✅ Follow-up resolved from the DynamoDB session")
+
+
+@mock_aws
+def test_prompt_size_constant_as_conversation_grows():
+    """With the in-memory store, prompts stop growing once the summary is full"""
+    module = load_mapper()
+    from session_store import InMemorySessionStore, SUMMARY_TURNS
+    module.session_store = InMemorySessionStore()
+
+    for turn in range(12):
+        chat(module, f'show history for Sarah Johnson please, turn {turn:02d}')
+
+    prompt_sizes = [len(prompt) for prompt in module.bedrock_agent_runtime.prompts]
+    assert prompt_sizes[0] < prompt_sizes[SUMMARY_TURNS]
+    assert len(set(prompt_sizes[SUMMARY_TURNS:])) == 1, prompt_sizes
+    assert 'Previous conversation context:' in module.bedrock_agent_runtime.prompts[-1]
+    print(f"   ✅ Prompt size constant at {prompt_sizes[-1]} characters")
+
+
+@mock_aws
+def test_unavailable_store_falls_back_to_request_history():
+    """If the sessions table can't be read, the request's conversationHistory is used as before"""
+    module = load_mapper()
+
+    history = [{'role': 'assistant', 'content': 'History for Emily Davis', 'extractedParams': {'doctorName': 'Emily Davis', 'intent': 'showHistory'}}]
+    event = {'body': json.dumps({'text': 'what about her costs', 'sessionId': 'session-1', 'conversationHistory': history})}
+    body = json.loads(module.lambda_handler(event, StubContext())['body'])
+    assert body['extractedParams']['doctorName'] == 'Emily Davis'
+    assert body['response'] == 'Here is what I found for that doctor.'
+    print("   ✅ Request history used without a session store")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Conversation Sessions...")
+
+    tests = [
+        test_session_updates_stay_bounded,
+        test_follow_up_resolved_from_dynamodb_session,
+        test_prompt_size_constant_as_conversation_grows,
+        test_unavailable_store_falls_back_to_request_history
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Local tests for incremental ("since" watermark) history sync.
+Uses moto to stand in for DynamoDB, so no AWS account or Docker is required.
+"""
+import sys
+import os
+import json
+import importlib
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/show_history_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from moto import mock_aws
+
+
+def create_table():
+    """Create the DoctorProcedures table and seed it with a few procedures"""
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    for day in range(1, 8):
+        table.put_item(Item={
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'2025-07-0{day}T10:00:00Z',
+            'procedure_code': 'CONS001',
+            'procedure_name': 'Initial Consultation',
+            'cost': Decimal('250'),
+            'time_logged': f'2025-07-0{day}T10:00:00Z'
+        })
+    return table
+
+
+def invoke(module, **params):
+    """Invoke the handler with API Gateway query parameters and decode the body"""
+    result = module.lambda_handler({'queryStringParameters': params}, None)
+    return result['statusCode'], json.loads(result['body'])
+
+
+def load_handler():
+    import show_history_lambda
+    return importlib.reload(show_history_lambda)
+
+
+@mock_aws
+def test_recent_window_returns_watermark():
+    """A regular call returns the newest rows plus the newest sort key"""
+    create_table()
+    module = load_handler()
+
+    status, body = invoke(module, doctorName='Sarah Johnson', limit='3')
+    assert status == 200
+    assert [h['time'] for h in body['history']] == [
+        '2025-07-07T10:00:00Z', '2025-07-06T10:00:00Z', '2025-07-05T10:00:00Z'
+    ]
+    assert body['watermark'] == '2025-07-07T10:00:00Z'
+    assert body['hasMore'] is True
+    print("   ✅ Recent window returns watermark")
+
+
+@mock_aws
+def test_since_returns_only_newer_rows():
+    """Passing the watermark back returns only the delta, oldest first in pages"""
+    create_table()
+    module = load_handler()
+
+    status, body = invoke(module, doctorName='Sarah Johnson', limit='2', since='2025-07-04T10:00:00Z')
+    assert status == 200
+    assert [h['time'] for h in body['history']] == ['2025-07-05T10:00:00Z', '2025-07-06T10:00:00Z']
+    assert body['watermark'] == '2025-07-06T10:00:00Z'
+    assert body['hasMore'] is True
+
+    status, body = invoke(module, doctorName='Sarah Johnson', limit='2', since=body['watermark'])
+    assert status == 200
+    assert [h['time'] for h in body['history']] == ['2025-07-07T10:00:00Z']
+    assert body['hasMore'] is False
+    print("   ✅ Since watermark pages through newer rows")
+
+
+@mock_aws
+def test_since_with_end_date_is_exclusive():
+    """The watermark row itself is never returned, even with an endDate bound"""
+    create_table()
+    module = load_handler()
+
+    status, body = invoke(
+        module, doctorName='Sarah Johnson', limit='10',
+        since='2025-07-05T10:00:00Z', endDate='2025-07-06T23:59:59Z'
+    )
+    assert status == 200
+    assert [h['time'] for h in body['history']] == ['2025-07-06T10:00:00Z']
+    print("   ✅ Since watermark is exclusive with endDate")
+
+
+@mock_aws
+def test_end_date_includes_suffixed_sort_keys():
+    """Rows with unique sort key suffixes logged exactly at endDate are included"""
+    table = create_table()
+    module = load_handler()
+    from sort_keys import make_sort_key
+
+    table.put_item(Item={
+        'DoctorName': 'Sarah Johnson',
+        'ProcedureTime': make_sort_key('2025-07-08T10:00:00Z'),
+        'procedure_code': 'LAB001',
+        'procedure_name': 'Complete Blood Count',
+        'cost': Decimal('85'),
+        'time_logged': '2025-07-08T10:00:00Z'
+    })
+
+    status, body = invoke(module, doctorName='Sarah Johnson', endDate='2025-07-08T10:00:00Z', limit='1')
+    assert status == 200
+    assert body['history'][0]['time'] == '2025-07-08T10:00:00Z'
+    assert body['watermark'].startswith('2025-07-08T10:00:00Z#')
+    print("   ✅ endDate includes suffixed sort keys")
+
+
+@mock_aws
+def test_since_with_no_new_rows():
+    """An empty delta is a 200 that echoes the watermark back"""
+    create_table()
+    module = load_handler()
+
+    status, body = invoke(module, doctorName='Sarah Johnson', since='2025-07-07T10:00:00Z')
+    assert status == 200
+    assert body['history'] == []
+    assert body['watermark'] == '2025-07-07T10:00:00Z'
+    print("   ✅ Empty delta keeps the watermark")
+
+
+@mock_aws
+def test_window_after_end_date_is_empty():
+    """A since watermark or startDate later than endDate is an empty result, not a failed Query"""
+    create_table()
+    module = load_handler()
+
+    # DynamoDB rejects an out-of-order BETWEEN (moto does not), so no Query is built for it
+    assert module.build_history_key_condition('Sarah Johnson', end_time='2025-07-03T10:00:00Z', since='2025-07-06T10:00:00Z') == (None, None)
+    assert module.build_history_key_condition('Sarah Johnson', start_time='2025-07-06T00:00:00Z', end_time='2025-07-03T10:00:00Z') == (None, None)
+
+    status, body = invoke(module, doctorName='Sarah Johnson', since='2025-07-06T10:00:00Z', endDate='2025-07-03T10:00:00Z')
+    assert status == 200
+    assert body['history'] == [] and body['watermark'] == '2025-07-06T10:00:00Z'
+
+    status, body = invoke(module, doctorName='Sarah Johnson', startDate='2025-07-06T00:00:00Z', endDate='2025-07-03T10:00:00Z')
+    assert status == 404
+    assert body['message'] == 'No procedure history found for Sarah Johnson.'
+    print("   ✅ Inverted window returns nothing")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Show History Since Watermark...")
+
+    tests = [
+        test_recent_window_returns_watermark,
+        test_since_returns_only_newer_rows,
+        test_since_with_end_date_is_exclusive,
+        test_end_date_includes_suffixed_sort_keys,
+        test_since_with_no_new_rows,
+        test_window_after_end_date_is_empty
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
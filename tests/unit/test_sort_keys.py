@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Local tests for collision-free ProcedureTime sort keys and the legacy key migration.
+Uses moto to stand in for DynamoDB, so no AWS account or Docker is required.
+"""
+import sys
+import os
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from moto import mock_aws
+
+from sort_keys import (
+    make_sort_key, is_legacy_sort_key, logged_time_from_sort_key, sort_key_upper_bound
+)
+import migrate_sort_keys
+
+
+def test_sort_keys_are_unique_and_ordered():
+    """Keys for the same logged time are distinct and increase in generation order"""
+    keys = [make_sort_key('2025-07-31T10:30:00Z') for _ in range(1000)]
+    assert len(set(keys)) == 1000
+    assert keys == sorted(keys)
+    assert all(logged_time_from_sort_key(key) == '2025-07-31T10:30:00Z' for key in keys)
+    assert all(key <= sort_key_upper_bound('2025-07-31T10:30:00Z') for key in keys)
+    assert make_sort_key('2025-07-31T10:29:59Z') < keys[0]
+    assert not is_legacy_sort_key(keys[0])
+    assert is_legacy_sort_key('2025-07-31T10:30:00Z')
+    print("   ✅ Sort keys unique and time-ordered")
+
+
+@mock_aws
+def test_migration_moves_legacy_rows():
+    """Legacy rows get suffixed keys with their attributes intact; reruns are no-ops"""
+    table = boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    for hour in range(10, 15):
+        table.put_item(Item={
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'2025-07-01T{hour}:00:00Z',
+            'procedure_code': 'CONS001',
+            'cost': Decimal('250.50')
+        })
+    table.put_item(Item={
+        'DoctorName': 'Sarah Johnson',
+        'ProcedureTime': make_sort_key('2025-07-02T10:00:00Z'),
+        'procedure_code': 'CONS001',
+        'cost': Decimal('99')
+    })
+
+    found, migrated = migrate_sort_keys.migrate_table(table, total_segments=2)
+    assert (found, migrated) == (5, 5)
+
+    items = table.query(KeyConditionExpression=Key('DoctorName').eq('Sarah Johnson'))['Items']
+    assert len(items) == 6
+    assert not any(is_legacy_sort_key(item['ProcedureTime']) for item in items)
+    assert [item['time_logged'] for item in items[:5]] == [f'2025-07-01T{hour}:00:00Z' for hour in range(10, 15)]
+    assert items[0]['cost'] == Decimal('250.50')
+
+    assert migrate_sort_keys.migrate_table(table, total_segments=2) == (0, 0)
+    print("   ✅ Legacy rows migrated")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Sort Keys...")
+
+    tests = [
+        test_sort_keys_are_unique_and_ordered,
+        test_migration_moves_legacy_rows
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
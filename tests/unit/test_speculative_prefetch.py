@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Local tests for prefetching likely follow-ups: once a request resolves a doctor,
+their history and quotes are cached in the background, so a context-resolved
+follow-up ("show her history") is answered from the response cache.
+The agent and direct lookups are replaced with stubs; moto stands in for DynamoDB,
+and procedures are written through the real add function.
+"""
+import sys
+import os
+import json
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/add_doctor_procedure'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from moto import mock_aws
+
+
+class CountingAgentRuntime:
+    """Answers every call with a fixed completion, counting calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_agent(self, **kwargs):
+        self.calls += 1
+        return {'completion': [{'chunk': {'bytes': b'Agent answer for Sarah Johnson.'}}]}
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def create_tables():
+    """Create the DoctorProcedures and DoctorProcedureStats tables"""
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.create_table(
+        TableName='DoctorProcedureStats',
+        KeySchema=[
+            {'AttributeName': 'PK', 'KeyType': 'HASH'},
+            {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'PK', 'AttributeType': 'S'},
+            {'AttributeName': 'SK', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def load_modules():
+    """Reload the add function and the mapper, with in-memory sessions and recorded direct lookups"""
+    import add_doctor_procedure_lambda
+    import bedrock_intent_mapper_lambda
+    from retry_budget import TokenBucket
+    from session_store import InMemorySessionStore
+    add_module = importlib.reload(add_doctor_procedure_lambda)
+    mapper = importlib.reload(bedrock_intent_mapper_lambda)
+    mapper.FAST_PATH_ENABLED = False
+    mapper.bedrock_agent_runtime = CountingAgentRuntime()
+    mapper.bedrock_rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    mapper.session_store = InMemorySessionStore()
+    mapper.direct_calls = []
+
+    def direct(intent, doctor_name, procedure_code=None):
+        mapper.direct_calls.append((intent, doctor_name, procedure_code))
+        return f'Direct {intent} {procedure_code or "all"} for {doctor_name}'
+
+    mapper.try_direct_lambda_invocation = direct
+    return add_module, mapper
+
+
+def add_procedure(add_module, code, cost):
+    result = add_module.lambda_handler({'body': json.dumps({
+        'doctorName': 'Sarah Johnson', 'procedureCode': code, 'cost': cost
+    })}, None)
+    assert result['statusCode'] == 200, result
+
+
+def chat(mapper, text):
+    event = {'body': json.dumps({'text': text, 'sessionId': 'session-1'})}
+    body = json.loads(mapper.lambda_handler(event, StubContext())['body'])
+    mapper.prefetch_executor.shutdown(wait=True)  # Let the background prefetch finish
+    mapper.prefetch_executor = mapper.ThreadPoolExecutor(max_workers=2)
+    return body
+
+
+@mock_aws
+def test_top_procedures_by_count():
+    """Procedure codes come from the doctor's aggregates, most frequent first"""
+    create_tables()
+    add_module, mapper = load_modules()
+    for code, cost in [('LAB001', 80), ('ENDO001', 250), ('ENDO001', 300), ('RAD001', 120), ('ENDO001', 275), ('LAB001', 90)]:
+        add_procedure(add_module, code, cost)
+
+    assert mapper.doctor_top_procedures('Sarah Johnson', 2) == ['ENDO001', 'LAB001']
+    assert mapper.doctor_top_procedures('Emily Davis', 2) == []
+    print("   ✅ Top procedures ranked by count")
+
+
+@mock_aws
+def test_follow_up_served_from_prefetch():
+    """After a quote, "show her history" and "what about LAB001" skip the agent"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 'ENDO001', 250)
+    add_procedure(add_module, 'LAB001', 80)
+
+    first = chat(mapper, 'get quote for Sarah Johnson ENDO001')
+    assert first['route'] == 'bedrock'
+    assert sorted(mapper.direct_calls, key=str) == sorted([
+        ('showHistory', 'Sarah Johnson', None),
+        ('getQuote', 'Sarah Johnson', None),
+        ('getQuote', 'Sarah Johnson', 'LAB001')
+    ], key=str)
+
+    history = chat(mapper, 'show her history')
+    assert history['extractedParams']['doctorName'] == 'Sarah Johnson'
+    assert history['route'] == 'cache'
+    assert history['response'] == 'Direct showHistory all for Sarah Johnson'
+
+    quote = chat(mapper, 'what about her costs for LAB001')
+    assert quote['route'] == 'cache'
+    assert quote['response'] == 'Direct getQuote LAB001 for Sarah Johnson'
+    assert mapper.bedrock_agent_runtime.calls == 1
+    print("   ✅ Follow-ups answered from prefetched entries")
+
+
+@mock_aws
+def test_cached_follow_ups_not_fetched_again():
+    """A second request about the same doctor only fetches what isn't cached yet"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 'ENDO001', 250)
+
+    chat(mapper, 'show history for Sarah Johnson')
+    assert len(mapper.direct_calls) == 2  # overall quote and ENDO001
+    # The quote was prefetched and the history was cached from the agent's answer
+    assert chat(mapper, 'get quote for Sarah Johnson')['route'] == 'cache'
+    assert len(mapper.direct_calls) == 2
+    print("   ✅ Cached follow-ups skipped")
+
+
+@mock_aws
+def test_new_procedure_invalidates_prefetched_answers():
+    """Prefetched answers carry the doctor's data version, so a new procedure makes them stale"""
+    create_tables()
+    add_module, mapper = load_modules()
+    add_procedure(add_module, 'ENDO001', 250)
+
+    chat(mapper, 'get quote for Sarah Johnson ENDO001')
+    add_procedure(add_module, 'ENDO001', 400)
+    body = chat(mapper, 'show her history')
+    assert body['route'] == 'bedrock'
+    assert mapper.bedrock_agent_runtime.calls == 2
+    print("   ✅ New procedure invalidated prefetched answers")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Speculative Prefetch...")
+
+    tests = [
+        test_top_procedures_by_count,
+        test_follow_up_served_from_prefetch,
+        test_cached_follow_ups_not_fetched_again,
+        test_new_procedure_invalidates_prefetched_answers
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
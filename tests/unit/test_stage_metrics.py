@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Local tests for per-stage latency metrics: spans summed per request, DynamoDB consumed
+capacity, the Embedded Metric Format record, and the stages the quote handler and the
+intent mapper report. Uses moto to stand in for DynamoDB and a stub Bedrock agent.
+"""
+import sys
+import os
+import json
+import importlib
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/get_quote_lambda'))
+sys.path.append(os.path.join(ROOT, 'functions/bedrock_intent_mapper_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ['BEDROCK_AGENT_ID'] = 'test-agent'
+os.environ['BEDROCK_AGENT_ALIAS_ID'] = 'test-alias'
+
+import boto3
+from moto import mock_aws
+
+import stage_metrics
+
+
+class StubContext:
+    aws_request_id = 'test-request'
+
+
+def capture():
+    """Send emitted records to a fresh MemorySink"""
+    stage_metrics.METRICS_ENABLED = True
+    stage_metrics.sink = stage_metrics.MemorySink()
+    stage_metrics.start_spans()
+    return stage_metrics.sink
+
+
+def metric_names(record):
+    return [metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']]
+
+
+def create_table(name, hash_key, range_key):
+    return boto3.resource('dynamodb').create_table(
+        TableName=name,
+        KeySchema=[
+            {'AttributeName': hash_key, 'KeyType': 'HASH'},
+            {'AttributeName': range_key, 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': hash_key, 'AttributeType': 'S'},
+            {'AttributeName': range_key, 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def test_spans_summed_into_one_emf_record():
+    """Repeated stages are summed, capacity is added up, and one EMF record is written per request"""
+    sink = capture()
+    calls = []
+
+    def batch_get_item(**kwargs):
+        calls.append(kwargs)
+        return {'ConsumedCapacity': [{'TableName': 'A', 'CapacityUnits': 1.5}, {'TableName': 'B', 'CapacityUnits': 0.5}]}
+
+    with stage_metrics.span('aggregation'):
+        pass
+    with stage_metrics.span('aggregation'):
+        stage_metrics.timed_call('dynamodbBatchGet', batch_get_item, RequestItems={})
+    with stage_metrics.detached():
+        with stage_metrics.span('prefetch'):
+            pass
+    stage_metrics.emit_spans('get_quote', statusCode=200)
+
+    assert calls == [{'RequestItems': {}, 'ReturnConsumedCapacity': 'TOTAL'}]
+    [record] = sink.records
+    assert record['FunctionName'] == 'get_quote' and record['statusCode'] == 200
+    assert record['aggregationCalls'] == 2 and record['aggregationMs'] >= record['dynamodbBatchGetMs']
+    assert record['dynamodbBatchGetCapacityUnits'] == 2.0
+    assert 'prefetchMs' not in record
+    assert record['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'DoctorProcedures'
+    assert record['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['FunctionName']]
+    assert metric_names(record) == ['aggregationMs', 'dynamodbBatchGetMs', 'dynamodbBatchGetCapacityUnits']
+
+    # The next request starts empty, and nothing is written with metrics off
+    stage_metrics.emit_spans('get_quote')
+    stage_metrics.METRICS_ENABLED = False
+    with stage_metrics.span('aggregation'):
+        pass
+    stage_metrics.emit_spans('get_quote')
+    stage_metrics.METRICS_ENABLED = True
+    assert len(sink.records) == 1
+    print("   ✅ Spans summed into one EMF record")
+
+
+@mock_aws
+def test_quote_handler_reports_its_stages():
+    """A quote reports name resolution, the scan and query with their capacity, aggregation and the response"""
+    table = create_table('DoctorProcedures', 'DoctorName', 'ProcedureTime')
+    for day in range(1, 4):
+        table.put_item(Item={
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'2025-07-0{day}T10:00:00Z',
+            'procedure_code': 'CONS001',
+            'procedure_name': 'Initial Consultation',
+            'cost': Decimal('250')
+        })
+    import get_quote_lambda
+    module = importlib.reload(get_quote_lambda)
+    sink = capture()
+
+    response = module.lambda_handler({'queryStringParameters': {'doctorName': 'sarah johnson'}}, StubContext())
+    assert response['statusCode'] == 200
+    [record] = sink.records
+    assert record['FunctionName'] == 'get_quote' and record['statusCode'] == 200
+    for stage in ['nameResolution', 'dynamodbScan', 'procedureQuery', 'dynamodbQuery', 'aggregation', 'response']:
+        assert record[f'{stage}Calls'] == 1, stage
+    assert record['nameResolutionMs'] >= record['dynamodbScanMs']
+    assert record['dynamodbScanCapacityUnits'] > 0 and record['dynamodbQueryCapacityUnits'] > 0
+
+    # A request rejected before any lookup only reports building the response
+    module.lambda_handler({'queryStringParameters': {}}, StubContext())
+    assert sink.records[1]['statusCode'] == 400
+    assert metric_names(sink.records[1]) == ['responseMs']
+    print("   ✅ Quote handler reported its stages")
+
+
+@mock_aws
+def test_mapper_reports_bedrock_and_fallback():
+    """A poor agent answer reports the Bedrock invocation, the fallback and the cache lookup's batch get"""
+    create_table('DoctorProcedures', 'DoctorName', 'ProcedureTime')
+    create_table('DoctorProcedureStats', 'PK', 'SK')
+    import bedrock_intent_mapper_lambda
+    mapper = importlib.reload(bedrock_intent_mapper_lambda)
+    mapper.FAST_PATH_ENABLED = False
+    mapper.PREFETCH_ENABLED = False
+
+    class UnsureAgentRuntime:
+        def invoke_agent(self, **kwargs):
+            return {'completion': [{'chunk': {'bytes': b"I'm not sure which doctor you mean."}}]}
+
+    mapper.bedrock_agent_runtime = UnsureAgentRuntime()
+    mapper.try_direct_lambda_invocation = lambda intent, doctor_name, procedure_code=None: 'Median cost is $250.00.'
+    sink = capture()
+
+    event = {'body': json.dumps({'text': 'get quote for Sarah Johnson', 'sessionId': 'session-1'})}
+    body = json.loads(mapper.lambda_handler(event, StubContext())['body'])
+    assert body['fallbackUsed'] is True
+    [record] = sink.records
+    assert record['FunctionName'] == 'intent_mapper'
+    assert (record['route'], record['statusCode']) == ('bedrock', 200)
+    for stage in ['sessionLoad', 'extraction', 'cacheLookup', 'dynamodbBatchGet', 'bedrockInvocation', 'fallback', 'sessionSave', 'response']:
+        assert record[f'{stage}Calls'] == 1, stage
+    assert 'dynamodbBatchGetCapacityUnits' in record
+    assert 'fastPathMs' not in record
+    print("   ✅ Mapper reported Bedrock and fallback")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Stage Metrics...")
+
+    tests = [
+        test_spans_summed_into_one_emf_record,
+        test_quote_handler_reports_its_stages,
+        test_mapper_reports_bedrock_and_fallback
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local tests for the startup mode: lazy values built once on first use, eager mode
+building at import, and handlers that reject a request without loading boto3.
+Uses moto to stand in for DynamoDB.
+"""
+import sys
+import os
+import json
+import importlib
+import subprocess
+import threading
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/get_quote_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from moto import mock_aws
+
+import startup
+
+# Imports a handler in a fresh interpreter, sends it a request it rejects up front,
+# and reports the status code and whether boto3 was loaded
+REJECTED_REQUEST_SCRIPT = """
+import json, sys
+sys.path[:0] = [{shared!r}, {directory!r}]
+module = __import__({module!r})
+context = type('Context', (), {{'aws_request_id': 'test-request'}})()
+response = module.lambda_handler({event!r}, context)
+print(json.dumps({{'statusCode': response['statusCode'], 'boto3Loaded': 'boto3' in sys.modules}}))
+"""
+
+
+class Options:
+    def __init__(self):
+        self.name = 'default'
+
+    def describe(self, suffix):
+        return f'{self.name}{suffix}'
+
+
+def test_lazy_values_built_once():
+    """A lazy value is built on first use, once across threads, and forwards attributes and calls"""
+    created = []
+
+    def build():
+        created.append(Options())
+        return created[-1]
+
+    options = startup.lazy(build)
+    assert created == [] and not options.resolved
+
+    threads = [threading.Thread(target=lambda: options.describe('!')) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and options.resolved
+
+    options.name = 'custom'
+    assert created[0].name == 'custom'
+    assert options.describe('?') == 'custom?'
+    assert startup.lazy(lambda: len)('abc') == 3
+
+    later = startup.lazy(build)
+    startup.warm()
+    assert later.resolved and len(created) == 2
+
+    startup.STARTUP_MODE = 'eager'
+    try:
+        assert isinstance(startup.lazy(build), Options)
+        assert startup.lazy_import('json') is json
+    finally:
+        startup.STARTUP_MODE = 'lazy'
+    print("   ✅ Lazy values built once")
+
+
+def test_rejected_requests_do_not_load_boto3():
+    """In lazy mode every function answers a request it rejects without importing boto3"""
+    functions = [
+        ('get_quote_lambda', 'get_quote_lambda', {'queryStringParameters': {}}),
+        ('show_history_lambda', 'show_history_lambda', {'queryStringParameters': {}}),
+        ('add_doctor_procedure', 'add_doctor_procedure_lambda', {'body': '{}'}),
+        ('bedrock_intent_mapper_lambda', 'bedrock_intent_mapper_lambda', {'body': '{}'})
+    ]
+    env = dict(os.environ, STARTUP_MODE='lazy', LOG_LEVEL='ERROR', METRICS_ENABLED='false',
+               BEDROCK_AGENT_ID='test-agent', BEDROCK_AGENT_ALIAS_ID='test-alias')
+    for directory, module, event in functions:
+        script = REJECTED_REQUEST_SCRIPT.format(
+            shared=os.path.join(ROOT, 'functions/shared'),
+            directory=os.path.join(ROOT, 'functions', directory),
+            module=module,
+            event=event
+        )
+        output = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        assert result == {'statusCode': 400, 'boto3Loaded': False}, (module, result)
+    print("   ✅ Rejected requests did not load boto3")
+
+
+@mock_aws
+def test_lazy_table_built_by_the_first_lookup():
+    """The quote handler's table is built by the first request that reads it, in either mode"""
+    table = boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    table.put_item(Item={
+        'DoctorName': 'Sarah Johnson',
+        'ProcedureTime': '2025-07-01T10:00:00Z',
+        'procedure_code': 'CONS001',
+        'procedure_name': 'Initial Consultation',
+        'cost': Decimal('250')
+    })
+    import get_quote_lambda
+    module = importlib.reload(get_quote_lambda)
+    event = {'queryStringParameters': {'doctorName': 'Sarah Johnson'}}
+
+    assert isinstance(module.table, startup.Lazy) and not module.table.resolved
+    assert module.lambda_handler(event, None)['statusCode'] == 200
+    assert module.table.resolved
+
+    startup.STARTUP_MODE = 'eager'
+    try:
+        module = importlib.reload(get_quote_lambda)
+    finally:
+        startup.STARTUP_MODE = 'lazy'
+    assert not isinstance(module.table, startup.Lazy)
+    assert module.lambda_handler(event, None)['statusCode'] == 200
+    print("   ✅ Lazy table built by the first lookup")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Startup Mode...")
+
+    tests = [
+        test_lazy_values_built_once,
+        test_rejected_requests_do_not_load_boto3,
+        test_lazy_table_built_by_the_first_lookup
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
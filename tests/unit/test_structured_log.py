@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Local tests for the shared structured logger: JSON records with levels, per-request
+DEBUG sampling, field truncation, and handlers that no longer log payloads by default.
+Uses moto to stand in for DynamoDB.
+"""
+import sys
+import os
+import io
+import json
+import importlib
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(ROOT, 'functions/shared'))
+sys.path.append(os.path.join(ROOT, 'functions/get_quote_lambda'))
+
+os.environ['DYNAMODB_TABLE_NAME'] = 'DoctorProcedures'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from moto import mock_aws
+
+import structured_log
+
+
+class StubContext:
+    aws_request_id = 'request-1'
+
+
+def configure(**settings):
+    """Reset the logger configuration to its defaults plus `settings`"""
+    structured_log.LOG_LEVEL = settings.get('level', 'INFO')
+    structured_log.LOG_DEBUG_SAMPLE_RATE = settings.get('sample_rate', 0)
+    structured_log.LOG_MAX_FIELD_CHARS = settings.get('max_chars', 200)
+    structured_log.LOG_MAX_FIELD_ITEMS = settings.get('max_items', 10)
+    structured_log.LOG_EVENT_PAYLOADS = settings.get('event_payloads', False)
+
+
+def records(call):
+    """The log records written while running `call` (stage metric records are left out)"""
+    output = io.StringIO()
+    with redirect_stdout(output):
+        call()
+    written = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{')]
+    return [record for record in written if '_aws' not in record]
+
+
+def test_levels_and_request_id():
+    """Records are JSON with the request id; DEBUG and the event are skipped at INFO"""
+    configure()
+    log = structured_log.get_logger('test')
+    structured_log.start_request(StubContext())
+
+    def run():
+        log.debug('Hidden', payload='x')
+        log.event({'body': 'secret'})
+        log.info('Shown', count=2, cost=Decimal('250.5'))
+        log.error('Failed', error='boom')
+
+    written = records(run)
+    assert [record['message'] for record in written] == ['Shown', 'Failed']
+    assert written[0] == {'level': 'INFO', 'logger': 'test', 'message': 'Shown', 'requestId': 'request-1', 'count': 2, 'cost': '250.5'}
+
+    configure(level='DEBUG', event_payloads=True)
+    assert [record['message'] for record in records(lambda: log.event({'body': 'secret'}))] == ['Event received']
+    configure(level='WARNING')
+    assert [record['level'] for record in records(run)] == ['ERROR']
+    print("   ✅ Levels and request id")
+
+
+def test_sampling_is_per_request():
+    """A sampled request writes all its DEBUG records, marked as sampled; others write none"""
+    configure(sample_rate=0.1)
+    log = structured_log.get_logger('test')
+
+    structured_log.start_request(StubContext(), sample=lambda: 0.05)
+    sampled = records(lambda: (log.debug('One'), log.debug('Two')))
+    assert [record['message'] for record in sampled] == ['One', 'Two']
+    assert all(record['sampled'] for record in sampled)
+
+    structured_log.start_request(StubContext(), sample=lambda: 0.5)
+    assert records(lambda: log.debug('Three')) == []
+
+    configure(sample_rate=0)
+    structured_log.start_request(StubContext(), sample=lambda: 0.0)
+    assert records(lambda: log.debug('Four')) == []
+    print("   ✅ Sampling is per request")
+
+
+def test_fields_truncated():
+    """Long strings, lists and dicts are cut short, nested ones too"""
+    configure(max_chars=5, max_items=2)
+    assert structured_log.truncate('abcdefgh') == 'abcde...(+3 chars)'
+    assert structured_log.truncate(['a', 'b', 'c', 'd']) == ['a', 'b', '...(+2 more)']
+    assert structured_log.truncate({'a': 'x' * 9, 'b': [1, 2, 3], 'c': 3}) == {
+        'a': 'xxxxx...(+4 chars)', 'b': [1, 2, '...(+1 more)'], '...': '+1 more'
+    }
+    assert structured_log.truncate({'a': {'b': {'c': {'d': 1}}}}) == {'a': {'b': {'c': "{'d':...(+3 chars)"}}}
+    assert structured_log.truncate((1, None)) == [1, None]
+    print("   ✅ Fields truncated")
+
+
+@mock_aws
+def test_quote_handler_logs_no_payloads_by_default():
+    """At the default level the quote handler logs neither the event, the doctor list nor the costs"""
+    configure()
+    table = boto3.resource('dynamodb').create_table(
+        TableName='DoctorProcedures',
+        KeySchema=[
+            {'AttributeName': 'DoctorName', 'KeyType': 'HASH'},
+            {'AttributeName': 'ProcedureTime', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'DoctorName', 'AttributeType': 'S'},
+            {'AttributeName': 'ProcedureTime', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    for day in range(1, 4):
+        table.put_item(Item={
+            'DoctorName': 'Sarah Johnson',
+            'ProcedureTime': f'2025-07-0{day}T10:00:00Z',
+            'procedure_code': 'CONS001',
+            'procedure_name': 'Initial Consultation',
+            'cost': Decimal('250')
+        })
+    import get_quote_lambda
+    module = importlib.reload(get_quote_lambda)
+    event = {'queryStringParameters': {'doctorName': 'Sarah Johnson'}}
+
+    written = records(lambda: module.lambda_handler(event, StubContext()))
+    messages = [record['message'] for record in written]
+    assert 'Median cost' in messages
+    assert not {'Event received', 'Doctor catalog', 'Costs found'} & set(messages)
+    assert all(record['logger'] == 'get_quote' and record['requestId'] == 'request-1' for record in written)
+
+    configure(level='DEBUG', event_payloads=True)
+    messages = [record['message'] for record in records(lambda: module.lambda_handler(event, StubContext()))]
+    assert {'Event received', 'Doctor catalog', 'Costs found'} <= set(messages)
+    configure()
+    print("   ✅ Quote handler logs no payloads by default")
+
+
+def main():
+    """Run all tests"""
+    print("🧪 Testing Structured Logging...")
+
+    tests = [
+        test_levels_and_request_id,
+        test_sampling_is_per_request,
+        test_fields_truncated,
+        test_quote_handler_logs_no_payloads_by_default
+    ]
+
+    passed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {test_func.__name__} failed: {e}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()